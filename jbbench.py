@@ -0,0 +1,259 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+@Time    : 2023/12/4 10:00
+@Author  : simonpage
+@File    : jbbench.py
+@Desc    : end-to-end benchmark of the jbteam pipeline against the offline mock LLM
+"""
+
+import asyncio
+import contextlib
+import sys
+import tempfile
+from pathlib import Path
+
+import fire
+
+from metagpt.actions import AdvanceStage, WriteCodeReview, WriteJBCode
+from metagpt.actions.action import Action
+from metagpt.actions.action_output import ActionOutput
+from metagpt.actions.advance_stage import OUTPUT_MAPPING
+from metagpt.config import CONFIG
+from metagpt.const import PROJECT_ROOT
+from metagpt.jbteam import STAGE_LIST, Team
+from metagpt.logs import define_log_level, logger
+from metagpt.memory.memory import Memory
+from metagpt.provider.streaming import (
+    StdoutSink,
+    add_stream_sink,
+    default_sinks,
+    remove_stream_sink,
+)
+from metagpt.roles import (
+    JBArchitect,
+    JBDesignApprover,
+    JBEngineer,
+    JBProductApprover,
+    JBProductManager,
+    JBProjectManager,
+    JBQaEngineer,
+    JBStageGovernance,
+    JBTaskApprover,
+    Role,
+)
+from metagpt.schema import Message
+from metagpt.utils.benchmark import (
+    Profiler,
+    compare_reports,
+    load_report,
+    median_report,
+    probe_io,
+    save_report,
+)
+from metagpt.utils.common import CodeParser, OutputParser
+from metagpt.utils.custom_decoder import CustomDecoder
+from metagpt.utils.event_log import EventLog
+from metagpt.utils.http_session import close_sessions
+from metagpt.utils.jb_common import JBParser
+
+FIXTURES = PROJECT_ROOT / "tests/data/mock_llm/jbteam"
+BASELINE = PROJECT_ROOT / "data/benchmark/jbteam_baseline.json"
+EMAIL = "bench@example.com"
+IDEA = "Make a simple web application that displays Hello World"
+
+
+def auto_approve(action: str, stage: str):
+    """Approval callback answering every stage gate at once, the human is not part of the benchmark"""
+    return "yes"
+
+
+def advance_to_test(team: Team):
+    """Publish hook advancing to Test once the Engineer hands its code to QA. Stage Governance only advances on
+    approvals and Build has none, so without it the benchmark would end before the Test stage"""
+    output_class = ActionOutput.create_model_class("stage_advance", OUTPUT_MAPPING)
+    advanced = False
+
+    def hook(message: Message):
+        nonlocal advanced
+        if advanced or message.cause_by not in (WriteJBCode, WriteCodeReview):
+            return
+        advanced = True
+        team.environment.publish_message(
+            Message(
+                content='[CONTENT]{ "Advance Stage": "Test" }[/CONTENT]',
+                instruct_content=output_class(**{"Advance Stage": "Test"}),
+                role="Benchmark",
+                cause_by=AdvanceStage,
+            )
+        )
+
+    return hook
+
+
+def add_probes(profiler: Profiler):
+    profiler.probe(Action, "_ask_llm", "llm")
+    profiler.probe(Role, "_get_next_state", "llm")
+    for name in ["parse_blocks", "parse_code", "parse_str", "parse_file_list", "parse_data_with_mapping"]:
+        profiler.probe(OutputParser, name, "parsing")
+    for name in ["parse_blocks", "parse_code", "parse_str", "parse_file_list"]:
+        profiler.probe(CodeParser, name, "parsing")
+    profiler.probe(JBParser, "parse_markdown_deliverable", "parsing")
+    profiler.probe(CustomDecoder, "decode", "parsing")
+    profiler.probe(ActionOutput, "create_model_class", "parsing")
+    for name in ["add", "add_batch", "get", "find_news", "get_by_action", "get_by_actions"]:
+        profiler.probe(Memory, name, "memory")
+    profiler.probe(EventLog, "append", "serialize")
+    profiler.probe(EventLog, "rewrite", "serialize")
+    profiler.probe(Team, "load_history", "serialize")
+    probe_io(profiler)
+
+
+@contextlib.contextmanager
+def mock_llm_config(**values):
+    """Point LLM() at the fixtures for the duration of the benchmark, and keep streamed answers off stdout"""
+    saved = {key: getattr(CONFIG, key) for key in values}
+    stdout_sinks = [sink for sink in default_sinks() if isinstance(sink, StdoutSink)]
+    for key, value in values.items():
+        setattr(CONFIG, key, value)
+    for sink in stdout_sinks:
+        remove_stream_sink(sink)
+    try:
+        yield
+    finally:
+        for key, value in saved.items():
+            setattr(CONFIG, key, value)
+        for sink in stdout_sinks:
+            add_stream_sink(sink)
+
+
+def hire_team(product_name: str) -> Team:
+    """The team of jbcode.get_project, with approvals given automatically"""
+    Team.create_project(email=EMAIL, product_name=product_name, idea=IDEA)
+    team = Team(product_name=product_name)
+    team.load_product_config(email=EMAIL)
+    with team.context.activate():
+        team.hire(
+            [
+                JBProductManager(),
+                JBArchitect(),
+                JBProjectManager(),
+                JBDesignApprover(callback=auto_approve),
+                JBProductApprover(callback=auto_approve),
+                JBTaskApprover(callback=auto_approve),
+                JBStageGovernance(),
+                JBEngineer(n_borg=5, use_code_review=True),
+                JBQaEngineer(),
+            ]
+        )
+    return team
+
+
+async def run_pipeline(product_name: str = "bench", end_stage: str = STAGE_LIST[-1], n_round: int = 5) -> dict:
+    """One profiled Team.run from Requirements to `end_stage`, in a fresh project under CONFIG.workspace_root"""
+    team = hire_team(product_name)
+    team.invest(1e6)  # the mock bills real token prices, the budget is not what is measured
+    team.start_project(product_name, stage=STAGE_LIST[0], end_stage=end_stage)
+
+    profiler = Profiler()
+    add_probes(profiler)
+    team.set_stage_callback(profiler.start_stage)
+    team.environment.add_publish_hook(advance_to_test(team))
+    try:
+        with profiler:
+            await team.run(n_round=n_round, start_stage=STAGE_LIST[0], end_stage=end_stage)
+    finally:
+        await close_sessions()
+    return profiler.report()
+
+
+def benchmark(
+    repeat: int = 3,
+    end_stage: str = STAGE_LIST[-1],
+    latency_mean: float = 0.0,
+    latency_stdev: float = 0.0,
+    fixtures: str = str(FIXTURES),
+    seed: int = 0,
+) -> dict:
+    """Median report of `repeat` pipeline runs, each in its own temporary workspace"""
+    reports = []
+    for i in range(repeat):
+        with tempfile.TemporaryDirectory() as workspace, mock_llm_config(
+            mock_llm=True,
+            mock_llm_fixtures=Path(fixtures),
+            mock_llm_seed=seed + i,
+            mock_llm_latency_mean=latency_mean,
+            mock_llm_latency_stdev=latency_stdev,
+            workspace_root=workspace,
+            long_term_memory=False,  # needs an embedding API
+        ):
+            reports.append(asyncio.run(run_pipeline(f"bench{i}", end_stage=end_stage)))
+            logger.info(f"Benchmark run {i + 1}/{repeat} took {reports[-1]['wall']:.2f}s")
+    return median_report(reports)
+
+
+def print_report(report: dict):
+    categories = list(report["total"])
+    print(f"{'stage':<14}{'wall':>9}" + "".join(f"{c:>12}" for c in categories) + f"{'rss MB':>9}")
+    for stage, entry in report["stages"].items():
+        row = "".join(f"{entry['categories'].get(c, 0.0):>12.3f}" for c in categories)
+        print(f"{stage:<14}{entry['wall']:>9.3f}{row}{entry['peak_rss_mb']:>9.1f}")
+    row = "".join(f"{report['total'][c]:>12.3f}" for c in categories)
+    print(f"{'total':<14}{report['wall']:>9.3f}{row}{report['peak_rss_mb']:>9.1f}")
+
+
+def main(
+    repeat: int = 3,
+    end_stage: str = STAGE_LIST[-1],
+    latency_mean: float = 0.0,
+    latency_stdev: float = 0.0,
+    fixtures: str = str(FIXTURES),
+    output: str = "",
+    baseline: str = str(BASELINE),
+    save_baseline: bool = False,
+    check: bool = False,
+    tolerance: float = 0.2,
+    log_level: str = "WARNING",
+):
+    """
+    Benchmark the jbteam pipeline offline: Team.run from Requirements to `end_stage` with every LLM call answered
+    by the mock provider from `fixtures`, and every approval given automatically.
+
+    Usage:
+    1) Measure and print the breakdown per stage:
+    jbbench.py [--repeat=3] [--latency_mean=0.0 --latency_stdev=0.0]
+
+    2) Record a baseline, then fail (exit code 1) when a later run regresses against it:
+    jbbench.py --save_baseline
+    jbbench.py --check [--tolerance=0.2]
+
+    :param repeat: runs to take the median of
+    :param end_stage: last stage to run
+    :param latency_mean: synthetic seconds per LLM call, 0 measures the framework alone
+    :param latency_stdev: spread of the synthetic latency
+    :param fixtures: directory of scripted LLM answers, see metagpt/provider/mock_api.py
+    :param output: also save the report as json to this path
+    :param baseline: the json report to save or compare against
+    :param save_baseline: save the report as the new baseline
+    :param check: compare against the baseline and exit with 1 on a regression
+    :param tolerance: relative slowdown of a metric that counts as a regression
+    :param log_level: console log level during the runs
+    """
+    define_log_level(print_level=log_level)
+    report = benchmark(repeat, end_stage, latency_mean, latency_stdev, fixtures)
+    print_report(report)
+    if output:
+        save_report(report, Path(output))
+    if save_baseline:
+        save_report(report, Path(baseline))
+    if check:
+        regressions = compare_reports(report, load_report(Path(baseline)), tolerance=tolerance)
+        for regression in regressions:
+            print(f"REGRESSION {regression}")
+        if regressions:
+            sys.exit(1)
+        print("No regression against the baseline")
+
+
+if __name__ == "__main__":
+    fire.Fire(main)
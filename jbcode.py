@@ -6,74 +6,69 @@
 @File    : jbcode.py
 """
 
-import asyncio
 import time as t
 import os
 import fire
-from io import StringIO
 import traceback
-from typing import Callable
-from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Optional
 
 import anvil.server
 import anvil.google.auth
 from anvil import BlobMedia
 
+from metagpt.config import CONFIG
+from metagpt.jbrunner import load_team, run_team, startup
 from metagpt.jbteam import Team
-from metagpt.roles import (
-    JBArchitect,
-    JBEngineer,
-    JBProductManager,
-    JBProjectManager,
-    JBDesignApprover,
-    JBProductApprover,
-    JBTaskApprover,
-    JBQaEngineer,
-    JBStageGovernance,
-)
+from metagpt.logs import logger
+from metagpt.provider.streaming import LineSink, add_stream_sink
+from metagpt.utils.approvals import Approvals
+from metagpt.utils.blob_store import open_blob_store
+from metagpt.utils.log_ring import LogRing
+from metagpt.utils.run_scheduler import Run, RunScheduler, RunStatus, current_run_id, report_log
 
 
 # TODO: configure Config from frontend
 # TODO: set git settings on workspaces / projects
 
-company: Team = None
-task = None
-executor = ThreadPoolExecutor(max_workers=1)
-task_state = {}
+companies: dict[tuple, Team] = {}  # (email, product name): team loaded by get_project, to run or inspect
+approvals = Approvals()  # by run id, resolved by approve_stage
 
-class LogSink:
-    """ Helper class to act as an internal log sink and replay messages to the client
-        Expect that we pull from the cache in batches until no lines are left.
-        Returns an empty list if there are no new log entries
-    """
-    def __init__(self):
-        self.stream = StringIO()
-        self.position = self.stream.tell()
-        self.cache = []
-
-    def get_lines(self, max_lines=100) -> tuple:
-        """ Returns lines from the stream up to max and a flag True if there is more to retrieve """
-        self._tail()
-        if len(self.cache) <= max_lines:
-            ret = self.cache
-            more = False
-            self.cache = []
-        else:
-            ret = self.cache[0:max_lines]
-            self.cache = self.cache[max_lines:]
-            more = True
-        return ret, more
-            
-    def _tail(self) -> str:
-        """ Returns new text from the stream and adds to the cache"""
-        self.stream.seek(self.position)
-        new_data = self.stream.read()
-        if new_data:
-            self.position = self.stream.tell()
-            self.cache += new_data.splitlines()
+log_ring = LogRing(
+    capacity=CONFIG.log_ring_capacity,
+    spill_path=CONFIG.log_ring_spill or None,
+    spill_max_bytes=CONFIG.log_ring_spill_max_bytes,
+)  # records of all runs, read by get_logs
+
+
+def _write_run_log(run_id: str, text: str, level: str, created: float) -> None:
+    """ Log lines sent by the runs, the records of process workers and the streamed LLM output """
+    log_ring.write(text, level=level, run_id=run_id, created=created)
+
+
+scheduler = RunScheduler(
+    max_runs=CONFIG.run_scheduler_max_runs,
+    max_runs_per_user=CONFIG.run_scheduler_max_runs_per_user,
+    workers=CONFIG.run_scheduler_workers,
+    on_log=_write_run_log,
+)
 
-        
-log_stream = LogSink()
+
+def _route_log(message) -> None:
+    """ Log sink keeping the records of each run apart, by the run_id the scheduler binds """
+    record = message.record
+    run_id = record["extra"].get("run_id")
+    if run_id is not None:
+        log_ring.write(message.rstrip("\n"), level=record["level"].name, run_id=run_id,
+                       created=record["time"].timestamp())
+
+
+def _route_stream_line(line: str) -> None:
+    """ Streamed LLM output, so the client sees progress before the action finishes """
+    report_log(line, level="STREAM")
+
+
+logger.add(_route_log, level="INFO")
+add_stream_sink(LineSink(_route_stream_line))
 
 # TODO: add auth to the frontend
 #authenticated_callable = anvil.server.callable(require_user=True)
@@ -96,15 +91,14 @@ def get_project(product_name: str, use_callback=True) -> dict:
         Returns None if it doesnt exist
     """
     
-    global company
-    if task is not None:
-        print("Project running!")
-        return None
-
     email: str = anvil.google.auth.get_user_email()
     if email is None:
         print("Not logged in!")
         return None
+
+    if scheduler.active(email, product_name) is not None:
+        print("Project running!")
+        return None
     
     if use_callback:
         api_callback: Callable = prompt_approval
@@ -112,26 +106,34 @@ def get_project(product_name: str, use_callback=True) -> dict:
         api_callback = None
     
     try:
-        company = Team(product_name=product_name)
-        company.load_product_config(email=email)
-        company.hire(
-            [
-                JBProductManager(),
-                JBArchitect(),
-                JBProjectManager(),
-                JBDesignApprover(callback = api_callback),
-                JBProductApprover(callback = api_callback),
-                JBTaskApprover(callback = api_callback),
-                JBStageGovernance(),
-                JBEngineer(n_borg=5, use_code_review=True),
-                JBQaEngineer()
-            ]
-        )
+        company = load_team(email, product_name, api_callback)
+        companies.pop((email, product_name), None)
+        companies[(email, product_name)] = company  # the latest, see _user_team
         deliverables: dict = company.get_project()
     except Exception:
         traceback.print_exc()
         deliverables = None
     return deliverables
+
+
+def _user_run(run_id: str = None) -> Optional[Run]:
+    """ The run of the logged in user with this id, by default their latest one """
+    email: str = anvil.google.auth.get_user_email()
+    if email is None:
+        return None
+    runs: list = scheduler.runs(user=email)
+    if run_id is None:
+        return runs[-1] if runs else None
+    return next((r for r in runs if r.run_id == run_id), None)
+
+
+def _user_team(run_id: str = None) -> Optional[Team]:
+    """ The team of a run of the logged in user, by default the team they loaded last """
+    if run_id is not None:
+        run = _user_run(run_id)
+        return None if run is None else companies.get((run.user, run.project))
+    email: str = anvil.google.auth.get_user_email()
+    return next((team for (user, _), team in reversed(companies.items()) if user == email), None)
     
 @authenticated_callable
 def update_project(product_name: str, project_data: dict) -> None:
@@ -178,7 +180,11 @@ def reset_project(product_name: str) -> None:
 
 
 @authenticated_callable
-def get_balance() -> float:
+def get_balance(run_id: str = None) -> float:
+    run: Run = _user_run(run_id)
+    if run is not None and 'balance' in run.info:
+        return run.info['balance']  # reported by a run in a process worker, where its team is
+    company: Team = _user_team(run_id)
     if company is None:
         return 0
     else:
@@ -187,7 +193,11 @@ def get_balance() -> float:
 
     
 @authenticated_callable
-def get_messages(except_first: int=0) -> list:
+def get_messages(except_first: int=0, inline_blobs: bool=True, run_id: str = None) -> list:
+    """ With inline_blobs=False, a body offloaded to the blob store (see MESSAGE_BLOB_THRESHOLD) is sent as its
+        digest in 'blob' with 'content' None, for the client to fetch with get_blob only if it is not cached yet
+    """
+    company: Team = _user_team(run_id)
     if company is None:
         return []
     else:
@@ -198,7 +208,8 @@ def get_messages(except_first: int=0) -> list:
         # Need to convert raw Classes to be serializable??
         msgs = [ {
                   'cause_by': str(x.cause_by),
-                  'content': x.content,
+                  'content': x.content if inline_blobs or x.blob is None else None,
+                  'blob': x.blob.digest if x.blob else None,
                   'role': x.role,
                   'send_to': x.send_to,
                   'sent_from': x.sent_from,
@@ -206,45 +217,41 @@ def get_messages(except_first: int=0) -> list:
                 } for x in raw_msgs ]
         return msgs
 
-def check_status() -> tuple:
-    global task
+@authenticated_callable
+def get_blob(digest: str) -> str:
+    """ Body of an offloaded message, by the digest returned by get_messages """
+    return open_blob_store(CONFIG.message_blob_path).get(digest)
+
+def check_status(run_id: str = None) -> tuple:
+    """ Status, stage and error of a run of the user, by default their latest one """
+    run: Run = _user_run(run_id)
     stage: str = ""
     error: str = ""
-    stage: str = ""
     status: str = ""
 
-    if task is not None:
-        if task_state.get('Waiting', False):
-            stage = task_state.get('stage', "Requirements")
-            status = "Waiting"
-        elif task.running():
-            stage = task_state.get('stage', "Requirements")
-            status = "Runnimg"
-        elif task.done():
-            try:
-                result = task.result()
-                print("###############\nCompleted task output:\n#################\n")
-                print(result)
-                status = "Complete"
-            except Exception:
-                traceback.print_exc()
-                status = "Idle"
-                error = traceback.format_exc()
-            task = None
-        else:
-            status = "Unknown!"
-    else:
+    if run is None:
         status = "Idle"
+    elif run.status is RunStatus.RUNNING:
+        stage = run.info.get('stage', "Requirements")
+        status = "Waiting" if run.info.get('Waiting', False) else "Running"
+    elif run.status is RunStatus.FAILED:
+        status = "Idle"
+        error = run.error
+    else:
+        stage = run.info.get('stage', "")
+        status = run.status.value
     return (status, stage, error)
 
-def run_project_background(n_round: int = 5,
-                           start_stage: str = "Requirements",
-                           end_stage:str = "Requirements"
-                           ) -> str:
 
-    """ Child thread main task launcher """
-    history: str = asyncio.run(company.run(n_round=n_round, start_stage=start_stage, end_stage=end_stage))
-    return history
+def _reload_team(run: Run) -> None:
+    """ Load again the team of a finished process run, from the files its process wrote """
+    if run.status is RunStatus.CANCELLED:
+        return
+    company = load_team(run.user, run.project, prompt_approval)
+    company.get_project()
+    companies.pop((run.user, run.project), None)
+    companies[(run.user, run.project)] = company
+
 
 @authenticated_callable
 def run_project(
@@ -252,144 +259,154 @@ def run_project(
     investment: float = 5.0,
     stage: str = "Requirements",
     end_stage: str = "Requirements",
-    use_callback: bool = True
+    use_callback: bool = True,
+    resume: bool = False,
+    priority: int = 0,
+    speculate: bool = False
     ) -> str:
 
-    """ Main execution launcher """
-    
-    global task
-    
+    """ Main execution launcher, returns the id of the run to follow it with check_status, get_logs and
+        approve_stage. Runs wait in a queue for their turn, the higher priority first.
+        With resume=True a crashed or stopped run continues from its last checkpoint. With speculate=True the next
+        stage starts while an approval is pending, and is kept if the deliverable is approved unchanged
+    """
+
+    email: str = anvil.google.auth.get_user_email()
+    company: Team = companies.get((email, product_name))
     if company is None:
         return "Error! Company not initiated!"
 
-    if task is None:
-        try:
-            n_round = startup(
-                product_name=product_name,
-                investment=investment, 
-                stage=stage,
-                end_stage=end_stage,
-                use_callback=use_callback
-                )
-        except FileNotFoundError:
-            ret = "Error: Call Create Project first!"
-            return ret
-
-        task = executor.submit(run_project_background, n_round, start_stage=stage, end_stage=end_stage)
-        check_status()
-        ret = "OK"
-    else:
-        ret = "Error: Already running!"
-     
-    return ret
-
-def update_stage(stage: str):
-    """ Called by child thread with current stage being worked on"""
-    task_state['stage'] = stage
+    if scheduler.active(email, product_name) is not None:
+        return "Error: Already running!"
 
+    if scheduler.workers == "process":
+        if not use_callback:
+            return "Error: console approvals need RUN_SCHEDULER_WORKERS: asyncio, process workers have no console"
+        run = scheduler.submit(email, product_name, run_team, email, product_name, investment=investment,
+                               stage=stage, end_stage=end_stage, resume=resume, priority=priority)
+        scheduler.add_done_callback(run.run_id, _reload_team)
+        return run.run_id
 
-def startup(
-    product_name: str, 
-    investment: float = 5.0, 
-    stage: str = "Requirements",
-    end_stage: str = "Requirements",
-    use_callback: bool = True
-) -> int:
-    
-    company.invest(investment)
-    company.start_project(product_name, stage=stage, end_stage=end_stage)
-    company.set_stage_callback(update_stage)
-    company.set_log_output(log_stream.stream)
-
-    remove_list = []
-    if end_stage not in ['Build', 'Test']:
-        remove_list.append('Engineer')
-    elif end_stage not in ['Test']:
-        remove_list.append('QaEngineer')
-
-    if len(remove_list)>0:
-        company.dehire(remove_list)
-
-    n_round = 2
-    
-    return n_round
+    try:
+        n_round = startup(
+            company,
+            product_name=product_name,
+            investment=investment, 
+            stage=stage,
+            end_stage=end_stage,
+            use_callback=use_callback
+            )
+    except FileNotFoundError:
+        ret = "Error: Call Create Project first!"
+        return ret
+
+    run = scheduler.submit(email, product_name, company.run, n_round=n_round, start_stage=stage, end_stage=end_stage,
+                           resume=resume, speculate=speculate, priority=priority)
+    return run.run_id
 
+@authenticated_callable
+def cancel_run(run_id: str) -> str:
+    """ Cancel a queued or running run of the user """
+    run: Run = _user_run(run_id)
+    if run is None:
+        return f"Error: unknown run {run_id}"
+    return "OK" if scheduler.cancel(run_id) else f"Error: run {run_id} cannot be cancelled"
 
-# This function is called from the background task!
+@authenticated_callable
+def get_runs() -> list:
+    """ Runs of the user the scheduler knows of, oldest first """
+    return [ {
+              'run_id': r.run_id,
+              'product_name': r.project,
+              'status': r.status.value,
+              'stage': r.info.get('stage', ""),
+              'priority': r.priority,
+              'submitted': r.submitted,
+            } for r in scheduler.runs(user=anvil.google.auth.get_user_email()) ]
+
+def _current_run() -> Optional[Run]:
+    run_id: str = current_run_id()
+    return None if run_id is None else scheduler.get(run_id)
+
+# This function is called from the run!
 def prompt_approval(action: str, stage: str):
-    """ Endpoint called from the child task to wait for API approval message or advance to next stage"""
+    """ Endpoint called from the run to ask for an API approval, which it awaits, or to advance to next stage"""
 
+    run: Run = _current_run()
+    task_state: dict = run.info
     if action == 'approve':
         print(f"Child: Submitting approval request for {stage}")
         task_state['Waiting'] = True
         task_state['Stage'] = stage
-        task_state['Approval'] = None
-        ret = None
+        ret = approvals.request(run.run_id)
+        ret.add_done_callback(lambda _: task_state.update(Waiting=False))  # answered, timed out or cancelled
     elif action == 'advance':
         print(f"Child: Signalling advance to {stage}")
         task_state['Waiting'] = False
         task_state['Stage'] = stage
-        task_state['Approval'] = None
         ret = None
-    elif action == "check":
-        print(f"Child: Looking for approval response for {stage}")
-        approval = task_state['Approval']
-        if approval is not None:
-            print(f"Child: Got approval response of: {approval}")
-            task_state['Waiting'] = False
-        ret = approval
     else:
         # Unknown action
-        pass
+        ret = None
     return ret
 
 
 @authenticated_callable
-def approve_stage(stage, approval=None) -> str:
-    """ Approve the Stage Deliverable """
+def approve_stage(stage, approval=None, run_id: str = None) -> str:
+    """ Approve the Stage Deliverable of a run of the user, by default their latest one """
     ret: str = "OK"
 
-    if task_state is None or task_state.get('Waiting'):
+    run: Run = _user_run(run_id)
+    if run is not None and (approvals.resolve(run.run_id, approval) or scheduler.answer(run.run_id, approval)):
         print(f"Got approval message for {stage}")
-        task_state['Approval'] = approval
-        task_state['Waiting'] = False
+        run.info['Waiting'] = False
     else:
         # Do nothing!
         ret = f"Error: task is not waiting for {stage} approval"
     return ret
 
 @authenticated_callable
-def get_logs(max_lines=100) -> tuple:
-    """ Retrieve new log messages since the last call """
-    return log_stream.get_lines(max_lines)
+def get_logs(since_seq: int = 0, max_lines=100, run_id: str = None) -> tuple:
+    """ Retrieve the log records of a run after since_seq, by default of the latest run of the user.
+        Returns the records (dicts of seq, time, level, text and run_id), True if there are more to retrieve, and
+        the since_seq of the next call. Every client pages with its own since_seq
+    """
+    run: Run = _user_run(run_id)
+    if run is None:
+        return [], False, since_seq
+    records, more = log_ring.read(since_seq, max_lines, run_id=run.run_id)
+    next_seq = records[-1].seq if records else since_seq
+    return [r.to_dict() for r in records], more, next_seq
 
 
 @authenticated_callable
-def get_deliverable(stage: str) -> str:
+def get_deliverable(stage: str, run_id: str = None) -> str:
     """ Retrieve new deliverable document for the specified stage"""
 
-    if  task_state.get('Waiting', False) and stage == task_state.get('stage', "Requirements"):
+    run: Run = _user_run(run_id)
+    if run is not None and run.info.get('Waiting', False) and stage == run.info.get('stage', "Requirements"):
         print(f"Retrieving deliverable for {stage}")
-        content = company.get_deliverable(stage)
+        content = companies[(run.user, run.project)].get_deliverable(stage)
     else:
         content = "Error: No content for this stage available!"
     return content
 
 @authenticated_callable
-def update_deliverable(stage: str, content: str) -> str:
+def update_deliverable(stage: str, content: str, run_id: str = None) -> str:
     """ Retrieve new deliverable document for the specified stage"""
 
-    if  task_state.get('Waiting', False) and stage == task_state.get('stage', "Requirements"):
+    run: Run = _user_run(run_id)
+    if run is not None and run.info.get('Waiting', False) and stage == run.info.get('stage', "Requirements"):
         print(f"Updating approved deliverable for {stage}")
-        ret: str = company.update_deliverable(stage, content)
+        ret: str = companies[(run.user, run.project)].update_deliverable(stage, content)
     else:
         ret = f"Error: Cannot update content for {stage} right now!"
     return ret
 
 @authenticated_callable
-def get_status():
-    """ Retrieve the running status of the main event loop """
-    return check_status()
+def get_status(run_id: str = None):
+    """ Retrieve the running status of a run """
+    return check_status(run_id)
 
 
 
@@ -408,7 +425,9 @@ def run_server():
         exit(1)
 
     while True:
-        print(check_status())
+        runs: list = scheduler.runs()
+        print(f"Runs: {sum(r.status is RunStatus.RUNNING for r in runs)} running, "
+              f"{sum(r.status is RunStatus.QUEUED for r in runs)} queued")
         t.sleep(60)         
 
 
@@ -474,14 +493,18 @@ def main(
         assert len(product_name)>0
         try:
             get_project(product_name)
-            run_project(
+            run_id = run_project(
                         product_name=product_name,
                         investment=investment,
-                        n_round=n_round,
-                        start_stage=start_stage,
+                        stage=start_stage,
                         end_stage=end_stage,
                         use_callback=False
                         )
+            if run_id.startswith("Error"):
+                print(run_id)
+            else:
+                run = scheduler.wait(run_id)
+                print(f"Run {run_id}: {run.status.value}\n{run.error}")
         except Exception:
             traceback.print_exc()
 
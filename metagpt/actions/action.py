@@ -14,6 +14,7 @@ from tenacity import retry, stop_after_attempt, wait_fixed, wait_random_exponent
 from metagpt.actions.action_output import ActionOutput
 from metagpt.llm import LLM
 from metagpt.logs import logger
+from metagpt.provider.base_gpt_api import current_action
 from metagpt.utils.common import OutputParser
 from metagpt.utils.custom_decoder import CustomDecoder
 
@@ -42,13 +43,21 @@ class Action(ABC):
     def __repr__(self):
         return self.__str__()
     
+    async def _ask_llm(self, prompt: str, system_msgs: list[str]) -> str:
+        """Ask the LLM on behalf of this action, so that providers can tell which action a prompt belongs to"""
+        token = current_action.set(type(self).__name__)
+        try:
+            return await self.llm.aask(prompt, system_msgs)
+        finally:
+            current_action.reset(token)
+
     @retry(stop=stop_after_attempt(3), wait=wait_random_exponential(min=60, max=180))
     async def _aask(self, prompt: str, system_msgs: Optional[list[str]] = None) -> str:
         """Append default prefix"""
         if not system_msgs:
             system_msgs = []
         system_msgs.append(self.prefix)
-        return await self.llm.aask(prompt, system_msgs)
+        return await self._ask_llm(prompt, system_msgs)
 
     @retry(stop=stop_after_attempt(3), wait=wait_random_exponential(min=60, max=180))
     async def _aask_v1(
@@ -63,7 +72,7 @@ class Action(ABC):
         if not system_msgs:
             system_msgs = []
         system_msgs.append(self.prefix)
-        content = await self.llm.aask(prompt, system_msgs)
+        content = await self._ask_llm(prompt, system_msgs)
         logger.debug(content)
         output_class = ActionOutput.create_model_class(output_class_name, output_data_mapping)
 
@@ -6,7 +6,7 @@
 @File    : action_output
 """
 
-from typing import Dict, Type
+from typing import Dict, Hashable, Type
 
 from pydantic import BaseModel, create_model, root_validator, validator
 
@@ -15,12 +15,30 @@ class ActionOutput:
     content: str
     instruct_content: BaseModel
 
+    # (class_name, mapping items) -> model class, create_model is slow and runs for every ask and every reconstruct
+    _model_classes: Dict[Hashable, Type[BaseModel]] = {}
+
     def __init__(self, content: str, instruct_content: BaseModel):
         self.content = content
         self.instruct_content = instruct_content
 
     @classmethod
     def create_model_class(cls, class_name: str, mapping: Dict[str, Type]):
+        """Model class with the fields of `mapping`, the same class for the same name and mapping"""
+        key = (class_name, tuple(mapping.items()))
+        try:
+            return cls._model_classes[key]
+        except KeyError:
+            pass
+        except TypeError:  # unhashable field defaults, not cached
+            key = None
+        new_class = cls._create_model_class(class_name, dict(mapping))
+        if key is not None:
+            cls._model_classes[key] = new_class
+        return new_class
+
+    @classmethod
+    def _create_model_class(cls, class_name: str, mapping: Dict[str, Type]):
         new_class = create_model(class_name, **mapping)
 
         @validator('*', allow_reuse=True)
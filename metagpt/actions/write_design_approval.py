@@ -50,6 +50,10 @@ class WriteDesignApproval(Action):
         instruct_content = output_class(**parsed_data)
         return ActionOutput(design_content, instruct_content)
 
+    def approved_output(self) -> ActionOutput:
+        """ What run returns when approved, given the deliverable as it is on disk now """
+        return self.get_design_from_disk()
+
     async def run(self, context, *args, **kwargs) -> ActionOutput:
         """ Wait for a Human Approval """
 
@@ -63,7 +67,7 @@ class WriteDesignApproval(Action):
 
         if design_approval.instruct_content.dict()['Approval Response'] == 'yes':
             logger.info("Got approval for System Design!")
-            output = self.get_design_from_disk()
+            output = self.approved_output()
             
         else:
             logger.warning("No approval - stop project!")
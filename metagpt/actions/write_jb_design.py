@@ -15,6 +15,7 @@ from metagpt.config import CONFIG
 import metagpt.const as CONST
 
 from metagpt.logs import logger
+from metagpt.product_config import PRODUCT_CONFIG
 from metagpt.utils.common import CodeParser
 from metagpt.utils.get_template import get_template
 from metagpt.utils.json_to_markdown import json_to_markdown
@@ -186,7 +187,7 @@ class WriteJBDesign(Action):
 
     async def _save(self, context, system_design) -> None:
         """ Save system design to output workspace """
-        workspace: Path = CONFIG.product_root
+        workspace: Path = PRODUCT_CONFIG.product_root
         docs_path: Path = workspace / "docs"
         resources_path: Path = workspace / "resources"
         await self._save_system_design(docs_path, resources_path, system_design)
@@ -64,6 +64,10 @@ class WriteProductApproval(Action):
         instruct_content = output_class(**parsed_data)
         return ActionOutput(prd_content, instruct_content)
     
+    def approved_output(self) -> ActionOutput:
+        """ What run returns when approved, given the deliverable as it is on disk now """
+        return self._get_prd_from_disk()
+
     async def run(self, context, *args, **kwargs) -> ActionOutput:
         """ Wait for a Human Approval """
                 
@@ -79,7 +83,7 @@ class WriteProductApproval(Action):
         
         if prd_approval.instruct_content.dict()['Approval Response'] == 'yes':
             logger.info("Got approval for Product Requirements!")
-            output = self._get_prd_from_disk()
+            output = self.approved_output()
 
         else:
             logger.warning("No approval - stop project!")
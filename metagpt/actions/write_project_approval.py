@@ -51,6 +51,10 @@ class WriteTaskApproval(Action):
         instruct_content = output_class(**parsed_data)
         return ActionOutput(design_content, instruct_content)
 
+    def approved_output(self) -> ActionOutput:
+        """ What run returns when approved, given the deliverable as it is on disk now """
+        return self._get_tasks_from_disk()
+
     async def run(self, context, *args, **kwargs) -> ActionOutput:
         """ Wait for a Human Approval """
         
@@ -64,7 +68,7 @@ class WriteTaskApproval(Action):
 
         if task_approval.instruct_content.dict()['Approval Response'] == 'yes':
             logger.info("Got approval for Tasks and API Spec!")
-            output = self._get_tasks_from_disk()
+            output = self.approved_output()
             
         else:
             logger.warning("No approval - stop project!")
@@ -14,6 +14,7 @@ import yaml
 from metagpt.const import PROJECT_ROOT
 from metagpt.logs import logger
 from metagpt.tools import SearchEngineType, WebBrowserEngineType
+from metagpt.utils.run_context import Scoped
 from metagpt.utils.singleton import Singleton
 import metagpt.const as CONST
 from pathlib import Path
@@ -42,6 +43,14 @@ class Config(metaclass=Singleton):
     key_yaml_file = PROJECT_ROOT / "config/key.yaml"
     default_yaml_file = PROJECT_ROOT / "config/config.yaml"
 
+    # what a run may set for itself without affecting the other runs of the process, see metagpt.utils.run_context
+    openai_api_model = Scoped()
+    claude_api_model = Scoped()
+    mock_llm_model = Scoped()
+    max_tokens_rsp = Scoped()
+    max_budget = Scoped()
+    total_cost = Scoped(default=0.0, inherit=False)
+
     def __init__(self, yaml_file=default_yaml_file):
         self._configs = {}
         self._init_with_config_files_and_env(self._configs, yaml_file)
@@ -50,10 +59,14 @@ class Config(metaclass=Singleton):
         self.openai_api_key = self._get("OPENAI_API_KEY")
         self.anthropic_api_key = self._get("Anthropic_API_KEY")
         self.zhipuai_api_key = self._get("ZHIPUAI_API_KEY")
-        if (not self.openai_api_key or "YOUR_API_KEY" == self.openai_api_key) and \
+        self.llm_endpoints = self._get("LLM_ENDPOINTS") or []
+        self.mock_llm = self._get("MOCK_LLM", False)
+        if not self.mock_llm and not self.llm_endpoints and (not self.openai_api_key or "YOUR_API_KEY" == self.openai_api_key) and \
                 (not self.anthropic_api_key or "YOUR_API_KEY" == self.anthropic_api_key) and \
                 (not self.zhipuai_api_key or "YOUR_API_KEY" == self.zhipuai_api_key):
-            raise NotConfiguredException("Set OPENAI_API_KEY or Anthropic_API_KEY or ZHIPUAI_API_KEY first")
+            raise NotConfiguredException(
+                "Set OPENAI_API_KEY or Anthropic_API_KEY or ZHIPUAI_API_KEY or LLM_ENDPOINTS or MOCK_LLM first"
+            )
         self.openai_api_base = self._get("OPENAI_API_BASE")
         openai_proxy = self._get("OPENAI_PROXY") or self.global_proxy
         if openai_proxy:
@@ -62,6 +75,7 @@ class Config(metaclass=Singleton):
         self.openai_api_type = self._get("OPENAI_API_TYPE")
         self.openai_api_version = self._get("OPENAI_API_VERSION")
         self.openai_api_rpm = self._get("RPM", 3)
+        self.openai_api_tpm = self._get("TPM", 0)
         self.openai_api_model = self._get("OPENAI_API_MODEL", "gpt-4")
         self.max_tokens_rsp = self._get("MAX_TOKENS", 2048)
         self.deployment_name = self._get("DEPLOYMENT_NAME")
@@ -72,8 +86,11 @@ class Config(metaclass=Singleton):
         self.spark_api_key = self._get("SPARK_API_KEY")
         self.domain = self._get("DOMAIN")
         self.spark_url = self._get("SPARK_URL")
+        self.spark_timeout = self._get("SPARK_TIMEOUT", 60)
 
         self.claude_api_key = self._get("Anthropic_API_KEY")
+        self.claude_api_model = self._get("Anthropic_API_MODEL", "claude-2")
+        self.claude_api_rpm = self._get("Anthropic_RPM", 0)
         self.serpapi_api_key = self._get("SERPAPI_API_KEY")
         self.serper_api_key = self._get("SERPER_API_KEY")
         self.google_api_key = self._get("GOOGLE_API_KEY")
@@ -92,11 +109,48 @@ class Config(metaclass=Singleton):
         self.puppeteer_config = self._get("PUPPETEER_CONFIG", "")
         self.mmdc = self._get("MMDC", "mmdc")
         self.calc_usage = self._get("CALC_USAGE", True)
+        self.llm_cache = self._get("LLM_CACHE", "off")
+        self.llm_cache_path = Path(self._get("LLM_CACHE_PATH", CONST.DATA_PATH / "llm_cache.sqlite3"))
+        self.llm_cache_max_entries = self._get("LLM_CACHE_MAX_ENTRIES", 0)
+        self.llm_cache_max_bytes = self._get("LLM_CACHE_MAX_BYTES", 0)
+        self.llm_single_flight = self._get("LLM_SINGLE_FLIGHT", True)
+        self.llm_stream_stdout = self._get("LLM_STREAM_STDOUT", True)
+        self.llm_hedge = self._get("LLM_HEDGE", False)
+        self.llm_hedge_percentile = self._get("LLM_HEDGE_PERCENTILE", 95)
+        self.llm_hedge_min_samples = self._get("LLM_HEDGE_MIN_SAMPLES", 20)
+        self.llm_hedge_budget_ratio = self._get("LLM_HEDGE_BUDGET_RATIO", 0.9)
+        self.message_blob_threshold = int(self._get("MESSAGE_BLOB_THRESHOLD", 0))
+        self.message_blob_path = Path(self._get("MESSAGE_BLOB_PATH", CONST.DATA_PATH / "blobs"))
+        self.message_blob_compression = self._get("MESSAGE_BLOB_COMPRESSION", "none")
+        self.message_blob_cache_size = int(self._get("MESSAGE_BLOB_CACHE_SIZE", 32))
+        self.mock_llm_fixtures = Path(self._get("MOCK_LLM_FIXTURES", CONST.DATA_PATH / "mock_llm"))
+        self.mock_llm_model = self._get("MOCK_LLM_MODEL", self.openai_api_model)
+        self.mock_llm_seed = self._get("MOCK_LLM_SEED", 0)
+        self.mock_llm_latency_mean = self._get("MOCK_LLM_LATENCY_MEAN", 0.0)
+        self.mock_llm_latency_stdev = self._get("MOCK_LLM_LATENCY_STDEV", 0.0)
+        self.mock_llm_completion_tokens_mean = self._get("MOCK_LLM_COMPLETION_TOKENS_MEAN", 0)
+        self.mock_llm_completion_tokens_stdev = self._get("MOCK_LLM_COMPLETION_TOKENS_STDEV", 0)
+        self.mock_llm_rate_limit_error_rate = self._get("MOCK_LLM_RATE_LIMIT_ERROR_RATE", 0.0)
+        self.mock_llm_timeout_error_rate = self._get("MOCK_LLM_TIMEOUT_ERROR_RATE", 0.0)
         self.model_for_researcher_summary = self._get("MODEL_FOR_RESEARCHER_SUMMARY")
         self.model_for_researcher_report = self._get("MODEL_FOR_RESEARCHER_REPORT")
         self.mermaid_engine = self._get("MERMAID_ENGINE", "nodejs")
         self.pyppeteer_executable_path = self._get("PYPPETEER_EXECUTABLE_PATH", "")
 
+        self.http_pool_limit = self._get("HTTP_POOL_LIMIT", 100)
+        self.http_pool_limit_per_host = self._get("HTTP_POOL_LIMIT_PER_HOST", 20)
+        self.http_dns_cache_ttl = self._get("HTTP_DNS_CACHE_TTL", 300)
+        self.http_keepalive_timeout = self._get("HTTP_KEEPALIVE_TIMEOUT", 30)
+
+        self.run_scheduler_max_runs = self._get("RUN_SCHEDULER_MAX_RUNS", 4)
+        self.run_scheduler_max_runs_per_user = self._get("RUN_SCHEDULER_MAX_RUNS_PER_USER", 1)
+        self.run_scheduler_workers = self._get("RUN_SCHEDULER_WORKERS", "asyncio")
+        self.approval_timeout = self._get("APPROVAL_TIMEOUT", 0)
+        self.speculation_max_cost = self._get("SPECULATION_MAX_COST", 1.0)
+        self.log_ring_capacity = self._get("LOG_RING_CAPACITY", 10000)
+        self.log_ring_spill = self._get("LOG_RING_SPILL", "")
+        self.log_ring_spill_max_bytes = self._get("LOG_RING_SPILL_MAX_BYTES", 100 * 1024 * 1024)
+
         self.prompt_format = self._get("PROMPT_FORMAT", "markdown")
         self.workspace_root: str = self._get("WORKSPACE_ROOT", f"{PROJECT_ROOT}/workspace")
         
@@ -6,14 +6,16 @@
 @File    : environment.py
 """
 import asyncio
-from typing import Iterable
+from collections import defaultdict
+from typing import Callable, Iterable, Optional
 
-from pydantic import BaseModel, Field
+from pydantic import BaseModel, Field, PrivateAttr
 
-from metagpt.memory import Memory
+from metagpt.memory import Memory, MessageStore
 from metagpt.roles import Role
 from metagpt.schema import Message
 from metagpt.config import CONFIG
+from metagpt.utils.event_log import EventLog
 
 class Environment(BaseModel):
     """环境，承载一批角色，角色可以向环境发布消息，可以被其他角色观察到
@@ -22,18 +24,45 @@ class Environment(BaseModel):
     """
 
     roles: dict[str, Role] = Field(default_factory=dict)
+    store: MessageStore = Field(default_factory=MessageStore)  # shared by the memories of the environment and roles
     memory: Memory = Field(default_factory=Memory)
     history: str = Field(default='')
 
+    # cause_by action types and send_to recipients -> profiles of the roles to wake up when such a message is published
+    _subscribers: dict = PrivateAttr(default_factory=lambda: defaultdict(set))
+    _pending: set = PrivateAttr(default_factory=set)  # profiles of the roles with messages they have not observed
+    _wakeup: Optional[asyncio.Event] = PrivateAttr(default=None)
+    _event_log: Optional[EventLog] = PrivateAttr(default=None)
+    _publish_hooks: list = PrivateAttr(default_factory=list)
+
     class Config:
         arbitrary_types_allowed = True
 
+    def __init__(self, **data):
+        super().__init__(**data)
+        self.memory.bind(self.store)
+
     def add_role(self, role: Role):
         """增加一个在当前环境的角色
            Add a role in the current environment
         """
         role.set_env(self)
         self.roles[role.profile] = role
+        self.subscribe(role)
+        self._pending.add(role.profile)  # a new role observes everything published so far
+
+    def subscribe(self, role: Role):
+        """Wake `role` up for messages caused by the actions it watches or sent to its profile or name"""
+        for key in [*role._rc.watch, role.profile, role._setting.name]:
+            if key:
+                self._subscribers[key].add(role.profile)
+
+    def wake(self, profiles: Iterable[str] = None):
+        """Have roles observe again on the next run, all of them by default. Needed after messages were added to
+        or removed from the memories directly rather than through `publish_message`"""
+        self._pending.update(self.roles if profiles is None else profiles)
+        if self._wakeup is not None:
+            self._wakeup.set()
 
     def add_roles(self, roles: Iterable[Role]):
         """增加一批在当前环境的角色
@@ -47,8 +76,40 @@ class Environment(BaseModel):
           Post information to the current environment
         """
         # self.message_queue.put(message)
-        self.memory.add(message)
+        if self.memory.add(message) and self._event_log is not None:
+            self._event_log.append(message)
         self.history += f"\n{message}"
+        for hook in list(self._publish_hooks):
+            hook(message)
+        self._pending.update(self._subscribers.get(message.cause_by, ()))
+        if message.send_to:
+            self._pending.update(self._subscribers.get(message.send_to, ()))
+        if self._wakeup is not None:
+            self._wakeup.set()
+
+    def add_publish_hook(self, hook: Callable[[Message], None]):
+        """Call `hook` with every message published from now on, before any role can observe it"""
+        self._publish_hooks.append(hook)
+
+    def remove_publish_hook(self, hook: Callable[[Message], None]):
+        if hook in self._publish_hooks:
+            self._publish_hooks.remove(hook)
+
+    @property
+    def pending(self) -> set[str]:
+        """Profiles of the roles that will run next"""
+        return set(self._pending)
+
+    def set_event_log(self, event_log: Optional[EventLog]):
+        """Append every message published from now on to `event_log`, None closes and detaches the current one"""
+        if self._event_log is not None and self._event_log is not event_log:
+            self._event_log.close()
+        self._event_log = event_log
+
+    def _take_pending(self) -> list[Role]:
+        due = [role for profile, role in self.roles.items() if profile in self._pending]
+        self._pending.clear()
+        return due
 
     async def run(self, k=1):
         """处理一次所有信息的运行
@@ -58,14 +119,48 @@ class Environment(BaseModel):
         # message = self.message_queue.get()
         # rsp = await self.manager.handle(message, self)
         # self.message_queue.put(rsp)
+        # Only the roles woken up by a published message run, the others would find no news
         for _ in range(k):
             futures = []
-            for role in self.roles.values():
+            for role in self._take_pending():
                 future = role.run()
                 futures.append(future)
 
             await asyncio.gather(*futures)
 
+    async def run_continuously(self, max_runs: int = 100) -> int:
+        """Run each role as soon as a message it subscribes to is published instead of in lock-step rounds, so that
+        independent roles overlap, until no role has anything left to observe. Returns the number of role runs.
+
+        A role is never run twice at the same time, messages published while it runs are seen by its next run.
+        `max_runs` bounds the total, in case roles keep answering each other.
+        """
+        self._wakeup = asyncio.Event()
+        running: dict[asyncio.Task, str] = {}
+        runs = 0
+        try:
+            while True:
+                busy = set(running.values())
+                for role in self._take_pending():
+                    if role.profile in busy or runs >= max_runs:
+                        self._pending.add(role.profile)  # left for later, or for the next call
+                    else:
+                        running[asyncio.create_task(role.run())] = role.profile
+                        runs += 1
+                if not running:
+                    return runs
+                self._wakeup.clear()
+                wakeup = asyncio.create_task(self._wakeup.wait())
+                done, _ = await asyncio.wait([*running, wakeup], return_when=asyncio.FIRST_COMPLETED)
+                wakeup.cancel()
+                for task in done - {wakeup}:
+                    running.pop(task)
+                    task.result()  # raise the first error of a role
+        finally:
+            for task in running:
+                task.cancel()
+            self._wakeup = None
+
     def get_roles(self) -> dict[str, Role]:
         """获得环境内的所有角色
            Process all Role runs at once
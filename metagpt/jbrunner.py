@@ -0,0 +1,109 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# @Desc   : the teams of jbcode projects and their runs, apart from the Anvil server so that process workers load them
+
+from typing import Callable
+
+from metagpt.jbteam import Team
+from metagpt.roles import (
+    JBArchitect,
+    JBDesignApprover,
+    JBEngineer,
+    JBProductApprover,
+    JBProductManager,
+    JBProjectManager,
+    JBQaEngineer,
+    JBStageGovernance,
+    JBTaskApprover,
+)
+from metagpt.utils.run_scheduler import ask, report
+
+
+def load_team(email: str, product_name: str, api_callback: Callable = None) -> Team:
+    """The team of a project, approvals go through api_callback if given"""
+    company = Team(product_name=product_name)
+    company.load_product_config(email=email)
+    with company.context.activate():  # the roles pick up the model settings of the team
+        company.hire(
+            [
+                JBProductManager(),
+                JBArchitect(),
+                JBProjectManager(),
+                JBDesignApprover(callback=api_callback),
+                JBProductApprover(callback=api_callback),
+                JBTaskApprover(callback=api_callback),
+                JBStageGovernance(),
+                JBEngineer(n_borg=5, use_code_review=True),
+                JBQaEngineer(),
+            ]
+        )
+    return company
+
+
+def update_stage(stage: str):
+    """Called from the run with current stage being worked on"""
+    report(stage=stage)
+
+
+def startup(
+    company: Team,
+    product_name: str,
+    investment: float = 5.0,
+    stage: str = "Requirements",
+    end_stage: str = "Requirements",
+    use_callback: bool = True,
+) -> int:
+    company.invest(investment)
+    company.start_project(product_name, stage=stage, end_stage=end_stage)
+    company.set_stage_callback(update_stage)
+
+    remove_list = []
+    if end_stage not in ["Build", "Test"]:
+        remove_list.append("Engineer")
+    elif end_stage not in ["Test"]:
+        remove_list.append("QaEngineer")
+
+    if len(remove_list) > 0:
+        company.dehire(remove_list)
+
+    n_round = 2
+
+    return n_round
+
+
+# This function is called from the run, in a process worker!
+def worker_approval(action: str, stage: str):
+    """Approval callback of a run in a process worker: the request goes to the server through the scheduler, and
+    approve_stage answers it there with RunScheduler.answer
+    """
+    if action == "approve":
+        ret = ask(stage)
+        report(Waiting=True, Stage=stage)
+        ret.add_done_callback(lambda _: report(Waiting=False))  # answered, timed out or cancelled
+    elif action == "advance":
+        report(Waiting=False, Stage=stage)
+        ret = None
+    else:
+        # Unknown action
+        ret = None
+    return ret
+
+
+async def run_team(
+    email: str,
+    product_name: str,
+    investment: float = 5.0,
+    stage: str = "Requirements",
+    end_stage: str = "Requirements",
+    resume: bool = False,
+) -> str:
+    """A run in a process worker, where the team is loaded again. Approvals are asked through the scheduler, see
+    worker_approval. The stage and the balance are reported to the server as the run goes
+    """
+    company = load_team(email, product_name, worker_approval)
+    n_round = startup(company, product_name, investment=investment, stage=stage, end_stage=end_stage)
+    company.set_stage_callback(lambda stage: report(stage=stage, balance=company.get_balance()))
+    try:
+        return await company.run(n_round=n_round, start_stage=stage, end_stage=end_stage, resume=resume)
+    finally:
+        report(balance=company.get_balance())
@@ -5,7 +5,10 @@
 @Author  : simonpage
 @File    : jbteam.py
 """
+import functools
+import itertools
 import os
+import pickle
 import traceback
 import zipfile
 import io
@@ -23,10 +26,19 @@ import metagpt.const as CONST
 from metagpt.environment import Environment
 from metagpt.logs import logger
 from metagpt.roles import Role, JBProductManager, JBProductApprover, JBArchitect, JBDesignApprover, JBProjectManager, JBTaskApprover, JBEngineer, JBQaEngineer, JBStageGovernance
+from metagpt.provider.human_provider import HumanProvider
 from metagpt.schema import Message
 from metagpt.utils.common import NoMoneyException
 from metagpt.utils.jb_common import ApprovalError, ProductConfigError
 from metagpt.utils.serialize import serialize_message, deserialize_message
+from metagpt.utils.event_log import EventLog, migrate_history, read_events, read_legacy_history
+from metagpt.utils.checkpoint import CHECKPOINT_VERSION, restore_checkpoint, take_checkpoint
+from metagpt.utils.run_context import RunContext, in_context
+from metagpt.utils.speculation import Speculation
+
+HISTORY_LOG = "history.log"
+CHECKPOINT = "checkpoint.pickle"
+LEGACY_HISTORY = "history.pickle"  # written by serialize_batch before the event log
 
 STAGE_LIST = [ "Requirements", "Design", "Plan", "Build", "Test"]
 
@@ -74,6 +86,13 @@ APPROVERS: dict = {
     "Test": [ JBEngineer, JBStageGovernance, JBQaEngineer ],
 }
 
+# The roles of the next stage, run speculatively while the deliverable of a stage waits for its approval
+SPECULATORS: dict = {
+    "Requirements": [JBArchitect],
+    "Design": [JBProjectManager],
+    "Plan": [JBEngineer],
+}
+
 
 class Team(BaseModel):
     """
@@ -86,12 +105,23 @@ class Team(BaseModel):
     investment: float = Field(default=10.0)
     idea: str = Field(default="")
     _stage_callback: Callable = PrivateAttr(None)
+    _announced_stage: str = PrivateAttr(None)  # the last stage given to the stage callback
     _bench: dict = PrivateAttr({})
     _log_stream: bool = PrivateAttr(False)
+    _context: RunContext = PrivateAttr(default_factory=RunContext)
+    _speculations: list = PrivateAttr(default_factory=list)
+    _history_dropped: int = PrivateAttr(0)  # messages of the history log that set_memory did not replay
     
     class Config:
         arbitrary_types_allowed = True
 
+    @property
+    def context(self) -> RunContext:
+        """Budget, cost, product and model settings of this team, apart from the other teams of the process.
+        Roles read the model settings when they are created, create them in `context.activate()` to use the
+        team's"""
+        return self._context
+
     
     @classmethod
     def generate_folder_name(cls, email) -> str:
@@ -243,12 +273,14 @@ class Team(BaseModel):
             if profile in env_roles.keys():
                 del env_roles[profile]
 
+    @in_context
     def invest(self, investment: float):
         """Invest company. raise NoMoneyException when exceed max_budget."""
         self.investment = investment
         CONFIG.max_budget = investment
         logger.info(f'Investment: ${investment}.')
 
+    @in_context
     def get_balance(self) -> float:
         return CONFIG.total_cost
 
@@ -272,6 +304,7 @@ class Team(BaseModel):
         }
         return DELIVERABLE_MAP.get(stage, None)
     
+    @in_context
     def get_deliverable(self, stage: str) -> str:
         path = self._map_stage_to_deliverable(stage)['path']
         name: str = self._map_stage_to_deliverable(stage)['name']
@@ -291,7 +324,11 @@ class Team(BaseModel):
         
         return { name: content }
 
+    @in_context
     def update_deliverable(self, stage: str, content: str) -> str:
+        for speculation in self._speculations:
+            if speculation.stage == stage:
+                speculation.abandon()  # built on the deliverable before the edit
         path: Path = self._map_stage_to_deliverable(stage)['path']
         if isinstance(path, Path):
             try:
@@ -305,6 +342,7 @@ class Team(BaseModel):
             ret = "Error"
         return ret
 
+    @in_context
     def create_product_config(self, idea, stage):
         data = {
             'IDEA': idea,
@@ -314,9 +352,11 @@ class Team(BaseModel):
         PRODUCT_CONFIG.product_config = yaml.dump(data)
         self.save_product_config()
         
+    @in_context
     def save_product_config(self):
         self.save_product_config_to_file(PRODUCT_CONFIG.email, self.product_name, PRODUCT_CONFIG.product_config)
 
+    @in_context
     def load_product_config(self, email: str) -> None:
         # First set CONFIG object up
         # TODO: implement in __init__?
@@ -329,12 +369,12 @@ class Team(BaseModel):
 
         PRODUCT_CONFIG.set_product_config(self.get_product_config(email, self.product_name))
         
+    @in_context
     def get_project(self) -> dict:
         deliverables: dict = PRODUCT_CONFIG.product_config.copy()
         deliverables['NAME'] = PRODUCT_CONFIG.product_name
 
-        history_file: Path = PRODUCT_CONFIG.product_root / "history.pickle"
-        if history_file.exists():
+        if self.has_history():
             self.set_memory('Test')
             for stage in ['Requirements', 'Design', 'Plan', 'Build', 'Test']:
                 deliverables.update(self.get_deliverable(stage))
@@ -342,6 +382,7 @@ class Team(BaseModel):
         return deliverables
 
 
+    @in_context
     def start_project(self, product_name: str, stage: str = "Requirements", send_to: str = "", end_stage="Requirements"):
         """Start a project from the start or a specific stage (assuming prior stages have been run)"""
         logger.info(f'Starting project: {product_name}')
@@ -361,6 +402,7 @@ class Team(BaseModel):
         return messages
         
 
+    @in_context
     def set_memory(self, stage: str=None):
         """ Resets Memory of Roles and Environment to a specific stage. 
             If None then continues from last run
@@ -377,11 +419,13 @@ class Team(BaseModel):
         for name, role in self.environment.get_roles().items():
             role._rc.memory.clear()
         
-        history_file: Path = PRODUCT_CONFIG.product_root / "history.pickle"
-        if history_file.exists():
+        self._history_dropped = 0
+        messages = self.load_history()
+        if messages:
             logger.info(f"Loading messages from a previous execution and replaying up to {stage}!")
-            messages = deserialize_batch(history_file.read_bytes())
-            messages = self.filter_messages(messages, STAGE_ACTIONS[stage])
+            kept = self.filter_messages(messages, STAGE_ACTIONS[stage])
+            self._history_dropped = len(messages) - len(kept)  # left in the log until `start_history`
+            messages = kept
             logger.info(f"Publishing {len(messages)} messages to the environment")
             self.environment.memory.add_batch(messages)
 
@@ -392,12 +436,90 @@ class Team(BaseModel):
                     for message in messages:
                         role.recv(message)
             ret = True
+
+        self.environment.wake()  # the replayed messages were not published, nobody was woken up by them
         
         return ret
+
+    @in_context
+    def start_history(self) -> None:
+        """Make the history log what `set_memory` kept and append every message published from now on. The
+        checkpoint is of the history before the replay, it is dropped"""
+        root: Path = PRODUCT_CONFIG.product_root
+        (root / CHECKPOINT).unlink(missing_ok=True)
+        if not (root / HISTORY_LOG).exists() and (root / LEGACY_HISTORY).exists():
+            migrate_history(root / LEGACY_HISTORY, root / HISTORY_LOG)
+        history_log = EventLog(root / HISTORY_LOG)
+        if self._history_dropped:
+            history_log.rewrite(self.environment.memory.get())  # the dropped stages will be published again
+            self._history_dropped = 0
+        self.environment.set_event_log(history_log)
     
+    @in_context
+    def has_history(self) -> bool:
+        root = PRODUCT_CONFIG.product_root
+        return (root / HISTORY_LOG).exists() or (root / LEGACY_HISTORY).exists()
+
+    @in_context
+    def load_history(self) -> list:
+        """Messages published by previous executions, None for a new project. Reads a history.pickle as is, it is
+        migrated by `start_history`"""
+        root = PRODUCT_CONFIG.product_root
+        if not (root / HISTORY_LOG).exists():
+            if not (root / LEGACY_HISTORY).exists():
+                return None
+            return read_legacy_history(root / LEGACY_HISTORY)
+        return list(read_events(root / HISTORY_LOG))
+
+    @in_context
+    def save_checkpoint(self, stage: str):
+        """Snapshot the environment and role state, the messages themselves are in the history log already"""
+        path: Path = PRODUCT_CONFIG.product_root / CHECKPOINT
+        tmp = path.with_suffix(".tmp")
+        tmp.write_bytes(pickle.dumps(take_checkpoint(self.environment, stage=stage)))
+        os.replace(tmp, path)
+
+    @in_context
+    def restore_checkpoint(self) -> str:
+        """Continue where the last checkpoint left off: the messages published after it are rolled back and every
+        role gets its memory and state back, without replaying the history. Returns the stage of the checkpoint,
+        None if there is no checkpoint matching the history log"""
+        root: Path = PRODUCT_CONFIG.product_root
+        if not (root / CHECKPOINT).exists() or not (root / HISTORY_LOG).exists():
+            return None
+        checkpoint: dict = pickle.loads((root / CHECKPOINT).read_bytes())
+        if checkpoint.get("version") != CHECKPOINT_VERSION:
+            logger.warning(f"Ignoring a checkpoint of version {checkpoint.get('version')}")
+            return None
+        messages = list(itertools.islice(read_events(root / HISTORY_LOG), checkpoint["messages"]))
+        if len(messages) != checkpoint["messages"] or (messages and messages[-1].id != checkpoint["last_id"]):
+            logger.warning("The checkpoint does not match the history log, replaying the history instead")
+            return None
+
+        history_log = EventLog(root / HISTORY_LOG)
+        history_log.truncate(checkpoint["messages"])
+        restore_checkpoint(self.environment, checkpoint, messages)
+        self.environment.set_event_log(history_log)
+        logger.info(f"Resuming stage {checkpoint['stage']} from a checkpoint after {len(messages)} messages")
+        return checkpoint["stage"]
+
     def set_stage_callback(self, callback: Callable) -> None:
         self._stage_callback = callback
 
+    def _announce_stage(self, stage: str) -> None:
+        """Call the stage callback once per stage reached, later stages only"""
+        if self._announced_stage is not None and STAGES[stage] <= STAGES[self._announced_stage]:
+            return
+        self._announced_stage = stage
+        if self._stage_callback is not None:
+            self._stage_callback(stage=stage)
+
+    def _on_advance(self, message: Message) -> None:
+        """Publish hook announcing a stage as soon as it is advanced to, rather than at the end of the round, while
+        the roles of the next stage already work"""
+        if message.cause_by is AdvanceStage and message.instruct_content is not None:
+            self._announce_stage(message.instruct_content.dict()['Advance Stage'])
+
     def set_log_output(self, stream) -> None:
         """ Handler to direct log output to a stream (for API retrieval)"""
         # Only do once!
@@ -444,13 +566,49 @@ class Team(BaseModel):
         for name in remove:
             del self.environment.get_roles()[name]
 
-    async def run(self, n_round=3, start_stage="Requirements", end_stage="Requirements"):
-        """Run company until target stage or no money"""
+    def _speculate(self, approver: Role, stage: str, pending) -> None:
+        """HumanProvider.on_wait of the approvers when speculating"""
+        roles = [role for role in self.environment.get_roles().values() if type(role) in SPECULATORS.get(stage, [])]
+        if not roles:
+            return
+        try:
+            speculation = Speculation(self.environment, self.context, approver, stage, pending, roles,
+                                      max_cost=CONFIG.speculation_max_cost)
+        except Exception as e:
+            logger.warning(f"Not speculating on {stage}: {e}")
+            return
+        self._speculations.append(speculation)
+
+    def _set_speculation(self, speculate: bool) -> None:
+        for role in self.environment.get_roles().values():
+            llm = role._actions[0].llm if role._actions else None
+            if isinstance(llm, HumanProvider) and hasattr(role._actions[0], "approved_output"):
+                llm.on_wait = functools.partial(self._speculate, role) if speculate else None
+
+    async def _settle_speculations(self) -> None:
+        for speculation in self._speculations:
+            if speculation.live and speculation.held:
+                await speculation.settle()
+        self._speculations = [s for s in self._speculations if s.live]
+
+    @in_context
+    async def run(self, n_round=3, start_stage="Requirements", end_stage="Requirements", continuous=False,
+                  resume=False, speculate=False):
+        """Run company until target stage or no money. With `continuous`, roles run as soon as their inputs arrive
+        rather than in lock-step rounds, see `Environment.run_continuously`. With `resume`, continue from the
+        checkpoint of the last round of a previous run when there is a valid one, see `restore_checkpoint`.
+        With `speculate`, the next stage starts while an approval is pending, see `Speculation`"""
 
         current_stage: str = start_stage
         self.set_team(end_stage)
-        
-        if self.set_memory(start_stage):
+        self._set_speculation(speculate)
+
+        resumed_stage = self.restore_checkpoint() if resume else None
+        if resumed_stage is not None:
+            current_stage = resumed_stage
+
+        elif self.set_memory(start_stage):
+            self.start_history()
             prev_stage = self.get_previous_stage(start_stage)
             
             while prev_stage is not None:
@@ -458,14 +616,16 @@ class Team(BaseModel):
                 prev_stage = self.get_previous_stage(prev_stage)
                 
         else:
+            self.start_history()
             logger.info("Commencing project with Boss Requirement")
             self.environment.publish_message(Message(role="Human", content=PRODUCT_CONFIG.idea, cause_by=BossRequirement, send_to=""))
 
 
         logger.info(f"Team will execute rounds of Tasks unless they finish the {end_stage} stage or run out of Investment funds!")
 
-        if self._stage_callback is not None:
-            self._stage_callback(stage=current_stage)
+        self._announced_stage = None
+        self._announce_stage(current_stage)
+        self.environment.add_publish_hook(self._on_advance)
 
         n_round = 3
         while n_round>0 and (STAGES[end_stage] >= STAGES[current_stage]):
@@ -474,17 +634,22 @@ class Team(BaseModel):
 
             try:
                 self._check_balance()
-                await self.environment.run()
+                if continuous:
+                    await self.environment.run_continuously()
+                else:
+                    await self.environment.run()
             except NoMoneyException as e:
                 logger.error("Ran out of money! Cannot continue!")
                 logger.error(f"Total spent: {e.amount} out of {CONFIG.max_budget}")
                 n_round = 0
+                self.save_checkpoint(current_stage)  # raised between rounds, resume once invested again
             except ApprovalError as e:
                 logger.error(f"Approval not given by {e.approver}")
                 role = self.environment.get_role(e.approver)
                 if role is not None:
                     logger.warning(f"Clearing memory for {e.approver}")
                     role._rc.memory.clear()
+                    self.environment.wake([e.approver])
                 else:
                     logger.error(f"Could not find an active role with profile={e.approver}. Should not happen!")
                 n_round = 0
@@ -492,24 +657,29 @@ class Team(BaseModel):
                 logger.error("Uncaught Exception!")
                 logger.error(traceback.format_exc())
                 n_round = 0
-            
+
+            await self._settle_speculations()
             end_msgs: int = len(self.environment.memory.get())
                 
             new_stage: str = self.scan_advances(current_stage)
             if new_stage != current_stage:
                 logger.info(f"Execution advanced to {new_stage} stage!")
-
-                if self._stage_callback is not None:
-                    self._stage_callback(stage=new_stage)
+                self._announce_stage(new_stage)  # for advances that were not published, e.g. replayed ones
                 current_stage = new_stage
 
             elif start_msgs == end_msgs:
                 logger.warning("No action taken during round! Aborting after three rounds!")
                 n_round -= 1
+
+            if n_round > 0:  # the round completed, every role is between two runs
+                self.save_checkpoint(current_stage)
             
-        history_file = PRODUCT_CONFIG.product_root / "history.pickle"
-        with open(history_file, 'wb') as file:
-            file.write(serialize_batch(self.environment.memory.get()))
+        for speculation in self._speculations:
+            speculation.discard()
+        self._speculations = []
+        self._set_speculation(False)
+        self.environment.remove_publish_hook(self._on_advance)
+        self.environment.set_event_log(None)  # closes the log, every message is in it already
         
         self.save_product_config()
         logger.info("Team execution completed!")
@@ -9,7 +9,9 @@
 from metagpt.logs import logger
 from metagpt.config import CONFIG
 from metagpt.provider.anthropic_api import Claude2 as Claude
+from metagpt.provider.mock_api import MockGPTAPI
 from metagpt.provider.openai_api import OpenAIGPTAPI
+from metagpt.provider.router_api import RouterGPTAPI
 from metagpt.provider.zhipuai_api import ZhiPuAIGPTAPI
 from metagpt.provider.spark_api import SparkAPI
 from metagpt.provider.human_provider import HumanProvider
@@ -18,7 +20,11 @@ from metagpt.provider.human_provider import HumanProvider
 def LLM() -> "BaseGPTAPI":
     """ initialize different LLM instance according to the key field existence"""
     # TODO a little trick, can use registry to initialize LLM instance further
-    if CONFIG.openai_api_key:
+    if CONFIG.mock_llm:
+        llm = MockGPTAPI()
+    elif CONFIG.llm_endpoints:
+        llm = RouterGPTAPI()
+    elif CONFIG.openai_api_key:
         llm = OpenAIGPTAPI()
     elif CONFIG.claude_api_key:
         llm = Claude()
@@ -7,10 +7,12 @@
 """
 
 from metagpt.memory.memory import Memory
+from metagpt.memory.message_store import MessageStore
 from metagpt.memory.longterm_memory import LongTermMemory
 
 
 __all__ = [
     "Memory",
     "LongTermMemory",
+    "MessageStore",
 ]
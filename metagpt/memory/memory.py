@@ -5,28 +5,98 @@
 @Author  : alexanderwu
 @File    : memory.py
 """
+import itertools
 from collections import defaultdict
-from typing import Iterable, Type
+from collections.abc import Sequence
+from typing import Iterable, Optional, Type
 
 from metagpt.actions import Action
+from metagpt.memory.message_store import MessageStore
 from metagpt.schema import Message
 
 
+# unique across memories, so that a cursor is never mistaken for one into another memory or before a delete/clear
+_generations = itertools.count(1)
+
+
+class MessageView(Sequence):
+    """Read-only window over a list of messages, taken without copying it.
+
+    Memory only appends to its lists and replaces them on delete/clear, so the window stays valid and fixed even
+    while the memory keeps growing.
+    """
+
+    __slots__ = ("_messages", "_range")
+
+    def __init__(self, messages: list[Message], start: int = 0, stop: Optional[int] = None):
+        self._messages = messages
+        self._range = range(*slice(start, stop).indices(len(messages)))
+
+    def __len__(self) -> int:
+        return len(self._range)
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            return [self._messages[j] for j in self._range[i]]
+        return self._messages[self._range[i]]
+
+    def __iter__(self):
+        messages = self._messages
+        for j in self._range:
+            yield messages[j]
+
+    def __eq__(self, other):
+        if isinstance(other, (list, tuple, MessageView)):
+            return len(self) == len(other) and all(a == b for a, b in zip(self, other))
+        return NotImplemented
+
+    def __add__(self, other) -> list[Message]:
+        return list(self) + list(other)
+
+    def __radd__(self, other) -> list[Message]:
+        return list(other) + list(self)
+
+    def __str__(self):
+        return str(list(self))
+
+    def __repr__(self):
+        return repr(list(self))
+
+
 class Memory:
     """The most basic memory: super-memory"""
 
-    def __init__(self):
-        """Initialize an empty storage list and an empty index dictionary"""
+    def __init__(self, store: Optional[MessageStore] = None):
+        """Initialize an empty storage list, an empty index dictionary and the set of stored message ids.
+        Messages are interned into `store` when given, see `bind`"""
+        self.store: Optional[MessageStore] = store
         self.storage: list[Message] = []
         self.index: dict[Type[Action], list[Message]] = defaultdict(list)
-
-    def add(self, message: Message):
-        """Add a new message to storage, while updating the index"""
-        if message in self.storage:
-            return
+        self.ids: set[str] = set()
+        self.generation: int = next(_generations)
+
+    def add(self, message: Message) -> bool:
+        """Add a new message to storage, while updating the index. Return False if it was already stored"""
+        if message.id in self.ids:
+            return False
+        if self.store is not None:
+            message = self.store.intern(message)
+        self.ids.add(message.id)
         self.storage.append(message)
         if message.cause_by:
             self.index[message.cause_by].append(message)
+        return True
+
+    def bind(self, store: MessageStore):
+        """Intern the messages of this memory, and the ones added later, into `store` shared with other memories"""
+        if store is self.store:
+            return
+        self.store = store
+        self.storage = [store.intern(m) for m in self.storage]
+        self.index = defaultdict(list)
+        for message in self.storage:
+            if message.cause_by:
+                self.index[message.cause_by].append(message)
 
     def add_batch(self, messages: Iterable[Message]):
         for message in messages:
@@ -42,40 +112,57 @@ class Memory:
 
     def delete(self, message: Message):
         """Delete the specified message from storage, while updating the index"""
-        self.storage.remove(message)
-        if message.cause_by and message in self.index[message.cause_by]:
-            self.index[message.cause_by].remove(message)
+        if message.id not in self.ids:
+            raise ValueError(f"{message} is not in memory")
+        self.ids.discard(message.id)
+        self.generation = next(_generations)
+        # new lists rather than in place removal, views handed out by `get` keep their window
+        self.storage = [m for m in self.storage if m.id != message.id]
+        if message.cause_by in self.index:
+            self.index[message.cause_by] = [m for m in self.index[message.cause_by] if m.id != message.id]
 
     def clear(self):
         """Clear storage and index"""
         self.storage = []
         self.index = defaultdict(list)
+        self.ids = set()
+        self.generation = next(_generations)
 
     def count(self) -> int:
         """Return the number of messages in storage"""
         return len(self.storage)
 
+    def __contains__(self, message: Message) -> bool:
+        return message.id in self.ids
+
     def try_remember(self, keyword: str) -> list[Message]:
         """Try to recall all messages containing a specified keyword"""
         return [message for message in self.storage if keyword in message.content]
 
-    def get(self, k=0) -> list[Message]:
-        """Return the most recent k memories, return all when k=0"""
-        return self.storage[-k:]
+    def get(self, k=0) -> MessageView:
+        """Return a read-only view of the most recent k memories, of all when k=0"""
+        return MessageView(self.storage, -k if k else 0)
 
-    def find_news(self, observed: list[Message], k=0) -> list[Message]:
+    def since(self, cursor: Optional[tuple[int, int]] = None) -> tuple[MessageView, tuple[int, int]]:
+        """Return a view of the messages added after `cursor` and the cursor to pass next time.
+
+        A cursor from a previous call is a position in the storage, which only grows until a delete or clear. From None,
+        or a cursor taken before a delete/clear, all messages are returned again.
+        """
+        generation, position = cursor or (self.generation, 0)
+        if generation != self.generation:
+            position = 0
+        news = MessageView(self.storage, position)
+        return news, (self.generation, position + len(news))
+
+    def find_news(self, observed: Iterable[Message], k=0) -> list[Message]:
         """find news (previously unseen messages) from the the most recent k memories, from all memories when k=0"""
-        already_observed = self.get(k)
-        news: list[Message] = []
-        for i in observed:
-            if i in already_observed:
-                continue
-            news.append(i)
-        return news
+        already_observed = {m.id for m in self.get(k)} if k else self.ids
+        return [i for i in observed if i.id not in already_observed]
 
-    def get_by_action(self, action: Type[Action]) -> list[Message]:
-        """Return all messages triggered by a specified Action"""
-        return self.index[action]
+    def get_by_action(self, action: Type[Action]) -> MessageView:
+        """Return a read-only view of all messages triggered by a specified Action"""
+        return MessageView(self.index.get(action, []))
 
     def get_by_actions(self, actions: Iterable[Type[Action]]) -> list[Message]:
         """Return all messages triggered by specified Actions"""
@@ -85,4 +172,3 @@ class Memory:
                 continue
             rsp += self.index[action]
         return rsp
-    
\ No newline at end of file
@@ -0,0 +1,34 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# @Desc   : interned messages shared by the memories of an environment
+
+import weakref
+from typing import Optional, Union
+
+from metagpt.schema import Message
+
+
+class MessageStore:
+    """One instance per message id, however many memories hold the message.
+
+    The environment owns the store and the memories of its roles intern into it, so that a message deserialized or
+    recreated elsewhere (e.g. recovered from long-term memory, replayed from history) does not cost its content again
+    for every role. The memories keep the references and their own indexes, an entry goes away with the last memory
+    holding it.
+    """
+
+    def __init__(self):
+        self._messages: weakref.WeakValueDictionary[str, Message] = weakref.WeakValueDictionary()
+
+    def intern(self, message: Message) -> Message:
+        """Return the stored instance equal to `message`, storing `message` if there is none"""
+        return self._messages.setdefault(message.id, message)
+
+    def get(self, message_id: str) -> Optional[Message]:
+        return self._messages.get(message_id)
+
+    def __contains__(self, message: Union[Message, str]) -> bool:
+        return (message.id if isinstance(message, Message) else message) in self._messages
+
+    def __len__(self) -> int:
+        return len(self._messages)
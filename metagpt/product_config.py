@@ -6,6 +6,7 @@
 @File    : product_config.py
 """
 
+from metagpt.utils.run_context import Scoped
 from metagpt.utils.singleton import Singleton
 from pathlib import Path
 
@@ -14,6 +15,12 @@ class ProductConfig(metaclass=Singleton):
 
     _instance = None
 
+    # one product per run, see metagpt.utils.run_context
+    _product_root: Path = Scoped(inherit=False)
+    _product_config: dict = Scoped(inherit=False)
+    _product_name: str = Scoped(inherit=False)
+    _email: str = Scoped(default="", inherit=False)
+
     def __init__(self):
         self._product_root: Path = None
         self._product_config: dict = None
@@ -5,31 +5,190 @@
 @Author  : Leo Xiao
 @File    : anthropic_api.py
 """
+import asyncio
+import time
+import weakref
+from typing import AsyncIterator
 
 import anthropic
-from anthropic import Anthropic
+from anthropic import Anthropic, AsyncAnthropic
+from tenacity import (
+    after_log,
+    retry,
+    retry_if_exception_type,
+    stop_after_attempt,
+    wait_random_exponential,
+)
 
 from metagpt.config import CONFIG
+from metagpt.logs import logger
+from metagpt.provider.base_gpt_api import BaseGPTAPI
+from metagpt.provider.openai_api import CostManager, Costs, log_and_reraise
+from metagpt.provider.rate_limiter import RateLimiter
+from metagpt.provider.streaming import publish_stream
+from metagpt.utils.token_counter import approximate_tokens
 
+_async_clients: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, dict[str, AsyncAnthropic]]" = (
+    weakref.WeakKeyDictionary()
+)
+_sync_clients: dict[str, Anthropic] = {}
 
-class Claude2:
-    def ask(self, prompt):
-        client = Anthropic(api_key=CONFIG.claude_api_key)
 
-        res = client.completions.create(
-            model="claude-2",
-            prompt=f"{anthropic.HUMAN_PROMPT} {prompt} {anthropic.AI_PROMPT}",
-            max_tokens_to_sample=1000,
-        )
-        return res.completion
+def _async_client(api_key: str) -> AsyncAnthropic:
+    """One pooled async client per event loop and api key; retries are done by Claude2 itself"""
+    clients = _async_clients.setdefault(asyncio.get_running_loop(), {})
+    if api_key not in clients:
+        clients[api_key] = AsyncAnthropic(api_key=api_key, max_retries=0)
+    return clients[api_key]
+
+
+def _sync_client(api_key: str) -> Anthropic:
+    if api_key not in _sync_clients:
+        _sync_clients[api_key] = Anthropic(api_key=api_key, max_retries=0)
+    return _sync_clients[api_key]
 
-    async def aask(self, prompt):
-        client = Anthropic(api_key=CONFIG.claude_api_key)
 
-        res = client.completions.create(
-            model="claude-2",
-            prompt=f"{anthropic.HUMAN_PROMPT} {prompt} {anthropic.AI_PROMPT}",
-            max_tokens_to_sample=1000,
+class Claude2(BaseGPTAPI):
+    """Anthropic completions API on the async client, with the cost, retry and rate-limit handling of OpenAIGPTAPI"""
+
+    max_rate_limit_retries = 3
+
+    def __init__(self):
+        self.api_key = CONFIG.claude_api_key
+        self.model = CONFIG.claude_api_model
+        self._cost_manager = CostManager()
+        self._rate_limiter = RateLimiter.get(
+            api_base="anthropic", api_key=self.api_key, model=self.model, rpm=CONFIG.claude_api_rpm
         )
-        return res.completion
-    
\ No newline at end of file
+
+    def _messages_to_prompt(self, messages: list[dict]) -> str:
+        """Render chat messages as a Human/Assistant transcript, system messages go before the first turn"""
+        prompt = ""
+        for message in messages:
+            if message["role"] == "user":
+                prompt += f"{anthropic.HUMAN_PROMPT} {message['content']}"
+            elif message["role"] == "assistant":
+                prompt += f"{anthropic.AI_PROMPT} {message['content']}"
+            else:
+                prompt += message["content"]
+        return f"{prompt}{anthropic.AI_PROMPT}"
+
+    def _const_kwargs(self, messages: list[dict]) -> dict:
+        return {
+            "model": self.model,
+            "prompt": self._messages_to_prompt(messages),
+            "max_tokens_to_sample": CONFIG.max_tokens_rsp,
+            "temperature": 0.3,
+        }
+
+    def count_tokens(self, text: str) -> int:
+        try:
+            return _sync_client(self.api_key).count_tokens(text)
+        except Exception as e:
+            logger.debug(f"Anthropic tokenizer unavailable, estimating tokens: {e}")
+            return approximate_tokens(text)
+
+    async def acount_tokens(self, text: str) -> int:
+        """count_tokens on the async client, the tokenizer is not loaded on the event loop"""
+        try:
+            return await _async_client(self.api_key).count_tokens(text)
+        except Exception as e:
+            logger.debug(f"Anthropic tokenizer unavailable, estimating tokens: {e}")
+            return approximate_tokens(text)
+
+    def _to_openai_format(self, content: str, usage: dict) -> dict:
+        """Completions in the shape of an OpenAI chat response, so that callers can treat providers alike"""
+        return {"choices": [{"index": 0, "message": {"role": "assistant", "content": content}}], "usage": usage}
+
+    def _usage(self, kwargs: dict, completion: str) -> dict:
+        return {
+            "prompt_tokens": self.count_tokens(kwargs["prompt"]),
+            "completion_tokens": self.count_tokens(completion),
+        }
+
+    async def _ausage(self, kwargs: dict, completion: str) -> dict:
+        return {
+            "prompt_tokens": await self.acount_tokens(kwargs["prompt"]),
+            "completion_tokens": await self.acount_tokens(completion),
+        }
+
+    def _update_costs(self, usage: dict):
+        if CONFIG.calc_usage:
+            try:
+                self._cost_manager.update_cost(usage["prompt_tokens"], usage["completion_tokens"], self.model)
+            except Exception as e:
+                logger.error(f"updating costs failed! {e}")
+
+    def _settle(self, kwargs: dict, usage: dict):
+        self._rate_limiter.settle(self._estimate_tokens(kwargs), usage["prompt_tokens"] + usage["completion_tokens"])
+
+    @staticmethod
+    def _estimate_tokens(kwargs: dict) -> int:
+        return approximate_tokens(kwargs["prompt"]) + int(kwargs["max_tokens_to_sample"])
+
+    async def _acreate(self, kwargs: dict, stream: bool = False):
+        """completions.create paced by the shared RateLimiter, a 429 waits for the advertised reset and retries"""
+        # one reservation for the request: a 429 was not served, its retries re-use it after the advertised reset
+        await self._rate_limiter.acquire(self._estimate_tokens(kwargs))
+        for attempt in range(self.max_rate_limit_retries + 1):
+            try:
+                return await _async_client(self.api_key).completions.create(**kwargs, stream=stream)
+            except anthropic.RateLimitError as e:
+                if attempt == self.max_rate_limit_retries:
+                    raise
+                delay = self._rate_limiter.retry_after(e.response.headers)
+                logger.warning(
+                    f"Rate limited by the API, retry in {delay:.2f}s ({attempt + 1}/{self.max_rate_limit_retries})"
+                )
+                await asyncio.sleep(delay)
+
+    def completion(self, messages: list[dict]) -> dict:
+        kwargs = self._const_kwargs(messages)
+        time.sleep(self._rate_limiter.reserve(self._estimate_tokens(kwargs)))
+        res = _sync_client(self.api_key).completions.create(**kwargs)
+        usage = self._usage(kwargs, res.completion)
+        self._update_costs(usage)
+        self._settle(kwargs, usage)
+        return self._to_openai_format(res.completion, usage)
+
+    async def acompletion(self, messages: list[dict]) -> dict:
+        kwargs = self._const_kwargs(messages)
+        res = await self._acreate(kwargs)
+        usage = await self._ausage(kwargs, res.completion)
+        self._update_costs(usage)
+        self._settle(kwargs, usage)
+        return self._to_openai_format(res.completion, usage)
+
+    async def _astream(self, messages: list[dict]) -> AsyncIterator[str]:
+        kwargs = self._const_kwargs(messages)
+        response = await self._acreate(kwargs, stream=True)
+        collected = []
+        try:
+            async for chunk in response:
+                if chunk.completion:
+                    collected.append(chunk.completion)
+                    yield chunk.completion
+        finally:
+            usage = await self._ausage(kwargs, "".join(collected))
+            self._update_costs(usage)
+            self._settle(kwargs, usage)
+
+    async def _achat_completion_stream(self, messages: list[dict]) -> str:
+        return await publish_stream(self._astream(messages))
+
+    @retry(
+        stop=stop_after_attempt(3),
+        wait=wait_random_exponential(min=30, max=180),
+        after=after_log(logger, logger.level("WARNING").name),
+        retry=retry_if_exception_type((anthropic.APIConnectionError, anthropic.InternalServerError)),
+        retry_error_callback=log_and_reraise,
+    )
+    async def acompletion_text(self, messages: list[dict], stream=False) -> str:
+        """when streaming, the answer is published to the stream sinks as it arrives"""
+        if stream:
+            return await self._achat_completion_stream(messages)
+        rsp = await self.acompletion(messages)
+        return self.get_choice_text(rsp)
+
+    def get_costs(self) -> Costs:
+        return self._cost_manager.get_costs()
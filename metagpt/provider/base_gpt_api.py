@@ -7,10 +7,16 @@
 """
 import json
 from abc import abstractmethod
-from typing import Optional
+from contextvars import ContextVar
+from typing import AsyncIterator, Iterable, Optional
 
 from metagpt.logs import logger
 from metagpt.provider.base_chatbot import BaseChatbot
+from metagpt.provider.streaming import StreamDelta, StreamFanout, StreamSink, stream_deltas
+
+# class name of the action (or of the role choosing its next action) on whose behalf the LLM is being asked,
+# set by Action and Role for providers that key on it
+current_action: ContextVar[str] = ContextVar("current_action", default="")
 
 
 class BaseGPTAPI(BaseChatbot):
@@ -38,18 +44,41 @@ class BaseGPTAPI(BaseChatbot):
         rsp = self.completion(message)
         return self.get_choice_text(rsp)
 
-    async def aask(self, msg: str, system_msgs: Optional[list[str]] = None) -> str:
+    def _build_messages(self, msg: str, system_msgs: Optional[list[str]] = None) -> list[dict[str, str]]:
         if system_msgs:
             message = self._system_msgs(system_msgs) + [self._user_msg(msg)] if self.use_system_prompt \
                 else [self._user_msg(msg)]
         else:
             message = [self._default_system_msg(), self._user_msg(msg)] if self.use_system_prompt \
                 else [self._user_msg(msg)]
+        return message
+
+    async def aask(self, msg: str, system_msgs: Optional[list[str]] = None) -> str:
+        message = self._build_messages(msg, system_msgs)
         rsp = await self.acompletion_text(message, stream=True)
         logger.debug(message)
         # logger.debug(rsp)
         return rsp
 
+    async def aask_stream(
+        self, msg: str, system_msgs: Optional[list[str]] = None, sinks: Iterable[StreamSink] = ()
+    ) -> AsyncIterator[StreamDelta]:
+        """Ask and yield the answer as it is generated, each delta carries time-to-first-token metadata.
+        The deltas are also delivered to `sinks`; the caller's iteration is the backpressure of the stream.
+
+        >>> async for delta in llm.aask_stream("hello"):
+        ...     print(delta.content, end="")
+        """
+        message = self._build_messages(msg, system_msgs)
+        async with StreamFanout(sinks) as fanout:
+            async for delta in stream_deltas(self._astream(message)):
+                await fanout.publish(delta)
+                yield delta
+
+    async def _astream(self, messages: list[dict]) -> AsyncIterator[str]:
+        """Raw text chunks of a streamed completion; providers without streaming yield the whole answer at once"""
+        yield await self.acompletion_text(messages)
+
     def _extract_assistant_rsp(self, context):
         return "\n".join([i["content"] for i in context if i["role"] == "assistant"])
 
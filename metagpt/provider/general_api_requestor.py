@@ -6,9 +6,11 @@ from typing import AsyncGenerator, Tuple, Union, Optional, Literal
 import aiohttp
 import asyncio
 
+import openai
 from openai.api_requestor import APIRequestor
 
 from metagpt.logs import logger
+from metagpt.utils.http_session import get_session
 
 
 class GeneralAPIRequestor(APIRequestor):
@@ -26,6 +28,14 @@ class GeneralAPIRequestor(APIRequestor):
         )
     """
 
+    async def arequest(self, *args, **kwargs):
+        # reuse the pooled session of the loop instead of a new session (and TLS handshake) per request
+        token = openai.aiosession.set(openai.aiosession.get() or get_session())
+        try:
+            return await super().arequest(*args, **kwargs)
+        finally:
+            openai.aiosession.reset(token)
+
     def _interpret_response_line(
         self, rbody: str, rcode: int, rheaders, stream: bool
     ) -> str:
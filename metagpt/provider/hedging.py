@@ -0,0 +1,135 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# @Desc   : hedged LLM requests, a late request is duplicated and the first response wins
+
+import asyncio
+import math
+import threading
+from collections import deque
+from typing import Any, Awaitable, Callable, Optional
+
+from metagpt.config import CONFIG
+from metagpt.logs import logger
+
+
+class LatencyTracker:
+    """Sliding window of observed request latencies, shared per model by every client of the process"""
+
+    _trackers: dict[str, "LatencyTracker"] = {}
+    _registry_lock = threading.Lock()
+
+    def __init__(self, window: int = 200):
+        self._samples: deque[float] = deque(maxlen=window)
+        self._lock = threading.Lock()
+
+    @classmethod
+    def get(cls, name: str) -> "LatencyTracker":
+        with cls._registry_lock:
+            if name not in cls._trackers:
+                cls._trackers[name] = cls()
+            return cls._trackers[name]
+
+    @classmethod
+    def reset_all(cls):
+        with cls._registry_lock:
+            cls._trackers.clear()
+
+    def __len__(self):
+        return len(self._samples)
+
+    def record(self, seconds: float):
+        with self._lock:
+            self._samples.append(seconds)
+
+    def percentile(self, p: float) -> Optional[float]:
+        with self._lock:
+            if not self._samples:
+                return None
+            ordered = sorted(self._samples)
+        rank = math.ceil(p / 100 * len(ordered))  # nearest-rank percentile
+        return ordered[min(max(rank, 1), len(ordered)) - 1]
+
+
+class HedgePolicy:
+    """When to send a duplicate of a slow request.
+
+    A request still running after the `percentile` of recent latencies gets one duplicate, sent to another
+    endpoint or key when one is available, and the first response is used. Nothing is hedged until
+    `min_samples` latencies have been seen, nor when the hedge could push the running cost past
+    `budget_ratio` of MAX_BUDGET.
+    """
+
+    def __init__(self, percentile: float = 95, min_samples: int = 20, budget_ratio: float = 0.9):
+        self.percentile = percentile
+        self.min_samples = min_samples
+        self.budget_ratio = budget_ratio
+        self.hedged = 0
+        self.hedge_wins = 0
+
+    @classmethod
+    def from_config(cls) -> Optional["HedgePolicy"]:
+        if not CONFIG.llm_hedge:
+            return None
+        return cls(
+            percentile=float(CONFIG.llm_hedge_percentile),
+            min_samples=int(CONFIG.llm_hedge_min_samples),
+            budget_ratio=float(CONFIG.llm_hedge_budget_ratio),
+        )
+
+    def delay(self, tracker: LatencyTracker) -> Optional[float]:
+        """Seconds to wait for the first request before hedging, None while there is too little history"""
+        if len(tracker) < self.min_samples:
+            return None
+        return tracker.percentile(self.percentile)
+
+    def within_budget(self, total_cost: float, extra_cost: float) -> bool:
+        if not CONFIG.max_budget:
+            return True
+        return total_cost + extra_cost <= CONFIG.max_budget * self.budget_ratio
+
+    async def run(
+        self,
+        primary: Callable[[], Awaitable[Any]],
+        hedge: Callable[[], Awaitable[Any]],
+        delay: float,
+        allow: Callable[[], bool],
+        on_loser: Optional[Callable[[Any], None]] = None,
+    ) -> Any:
+        """Run `primary`; if it has not finished after `delay` and `allow()` holds, race it against `hedge`.
+        The loser is cancelled, or handed to `on_loser` if it completed as well. An error of one request is only
+        raised if the other one fails too."""
+        first = asyncio.ensure_future(primary())
+        tasks = [first]
+        winner = None
+        try:
+            done, _ = await asyncio.wait({first}, timeout=delay)
+            if done or not allow():
+                winner = first
+                return await first
+
+            self.hedged += 1
+            logger.info(f"LLM request slower than {delay:.2f}s, sending a hedged request")
+            second = asyncio.ensure_future(hedge())
+            tasks.append(second)
+            pending = {first, second}
+            error = None
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        winner = task
+                        if task is second:
+                            self.hedge_wins += 1
+                        return task.result()
+                    if task is first or error is None:
+                        error = task.exception()
+            raise error
+        finally:
+            for task in tasks:
+                if not task.done():
+                    task.cancel()
+                elif task is not winner and on_loser and not task.cancelled() and task.exception() is None:
+                    on_loser(task.result())
+
+    def stats(self) -> dict:
+        return {"hedged": self.hedged, "hedge_wins": self.hedge_wins}
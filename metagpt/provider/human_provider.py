@@ -6,12 +6,17 @@ Author: garylin2099
 
 # Altered by simonpage
 
+import asyncio
+import inspect
 from typing import Optional, Callable
-import time as t
 
+from metagpt.config import CONFIG
 from metagpt.provider.base_gpt_api import BaseGPTAPI
 from metagpt.logs import logger
 
+APPROVALS = ('yes', 'y')  # the responses taken as an approval
+
+
 class HumanProvider(BaseGPTAPI):
     """Humans provide themselves as a 'model', which actually takes in human input as its response.
     This enables replacing LLM anywhere in the framework with a human, thus introducing human interaction
@@ -19,31 +24,53 @@ class HumanProvider(BaseGPTAPI):
 
     def __init__(self) -> None:
         self.callback: Callable = None
+        self.on_wait: Callable = None  # on_wait(stage, future) when an API approval starts pending
 
     def set_callback(self, callback: Callable) -> None:
+        """ callback(action="approve", stage=stage) returns the response, or an awaitable of it (see
+            metagpt.utils.approvals) that is awaited for up to APPROVAL_TIMEOUT seconds
+        """
         self.callback = callback
 
     def ask(self, msg: str, stage: str ="Requirements", autoapprove=False) -> str:
-        
+        return asyncio.run(self.aask(msg, [stage, autoapprove]))
+
+    async def _wait_for_api(self, stage: str) -> str:
+        rsp = self.callback(action="approve", stage=stage)
+        if inspect.isawaitable(rsp):
+            rsp = asyncio.ensure_future(rsp)
+            if self.on_wait is not None:
+                self.on_wait(stage, rsp)
+            # Suspend this role only, the other roles and runs of the loop go on
+            timeout = CONFIG.approval_timeout or None
+            try:
+                rsp = await asyncio.wait_for(rsp, timeout)
+            except asyncio.TimeoutError:
+                logger.warning(f"No approval for {stage} within {timeout}s, taken as a rejection")
+                rsp = "no"
+        logger.info(f"Approval received: {rsp}")
+        return rsp
+
+    async def aask(self, msg: str, system_msgs: Optional[list[str]] = None) -> str:
+        stage = system_msgs[0]
+        if len(system_msgs)>1:
+            autoapprove = system_msgs[1]
+        else:
+            autoapprove = False
+
         if autoapprove:
             logger.info("Responding with Auto-Approval")
             rsp = "yes"
         elif self.callback is not None:
             # API Input
             logger.info("Waiting for API response.")
-            self.callback(action="approve", stage=stage)
-            # Block until we get a response!
-            rsp  = self.callback(action="check", stage=stage)
-            while rsp is None:
-                t.sleep(10)
-                rsp  = self.callback(action="check", stage=stage)
-                logger.info(f"Approval received: {rsp}")
+            rsp = await self._wait_for_api(stage)
         else:
-            # Direct Human input
+            # Direct Human input, read in a thread so that the event loop is not blocked
             logger.info("Waiting for human response.")
-            rsp = input(msg)
+            rsp = await asyncio.to_thread(input, msg)
 
-        if rsp in['yes', 'y']:
+        if rsp in APPROVALS:
             logger.debug("Received an approval")
             rsp = '[CONTENT]{ "Approval Response": "yes" }[/CONTENT]'
         elif rsp in ['no', 'n', 'exit', 'quit']:
@@ -55,14 +82,6 @@ class HumanProvider(BaseGPTAPI):
 
         return rsp
 
-    async def aask(self, msg: str, system_msgs: Optional[list[str]] = None) -> str:
-        stage = system_msgs[0]
-        if len(system_msgs)>1:
-            autoapprove = system_msgs[1]
-        else:
-            autoapprove = False
-        return self.ask(msg, stage=stage, autoapprove=autoapprove)
-
     def completion(self, messages: list[dict]):
         """dummy implementation of abstract method in base"""
         return []
@@ -0,0 +1,202 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# @Desc   : persistent, content-addressed cache for LLM responses with record/replay modes
+
+import asyncio
+import hashlib
+import json
+import sqlite3
+import threading
+import time
+from enum import Enum
+from pathlib import Path
+from typing import Optional
+
+from metagpt.config import CONFIG
+from metagpt.logs import logger
+
+
+class LLMCacheMode(str, Enum):
+    OFF = "off"  # never read or write the cache
+    RECORD = "record"  # always call the LLM and (re)write the response
+    REPLAY = "replay"  # only serve from the cache, a miss is an error
+    READ_THROUGH = "read-through"  # serve hits, call the LLM and store on a miss
+
+    @classmethod
+    def values(cls):
+        return [item.value for item in cls]
+
+
+class LLMCacheMissError(Exception):
+    """Raised in replay mode when a request has no recorded response"""
+
+    def __init__(self, key: str):
+        self.key = key
+        super().__init__(f"No recorded LLM response for key {key} in replay mode")
+
+
+class LLMCache:
+    """Disk-backed LLM response cache, keyed by a hash of the request.
+
+    The backend is a SQLite database in WAL mode so that several processes (and threads) can share one cache
+    file. Entries are evicted least-recently-used first once `max_entries` or `max_bytes` is exceeded; a limit
+    of 0 disables that bound.
+    """
+
+    def __init__(self, path: Path, mode: str = LLMCacheMode.READ_THROUGH, max_entries: int = 0, max_bytes: int = 0):
+        assert mode in LLMCacheMode.values(), f"mode must be one of {LLMCacheMode.values()}"
+        self.path = Path(path)
+        self.mode = LLMCacheMode(mode)
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._conn: Optional[sqlite3.Connection] = None
+
+    @staticmethod
+    def make_key(
+        provider: str,
+        model: str,
+        messages: list[dict],
+        temperature: float = None,
+        max_tokens: int = None,
+        tools: list = None,
+    ) -> str:
+        """Content address of a request, stable across processes and dict ordering"""
+        payload = {
+            "provider": provider,
+            "model": model,
+            "messages": messages,
+            "temperature": temperature,
+            "max_tokens": max_tokens,
+            "tools": tools,
+        }
+        raw = json.dumps(payload, sort_keys=True, ensure_ascii=False, default=str)
+        return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+    @property
+    def enabled(self) -> bool:
+        return self.mode != LLMCacheMode.OFF
+
+    def _connect(self) -> sqlite3.Connection:
+        if self._conn is None:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            conn = sqlite3.connect(str(self.path), timeout=30, check_same_thread=False, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS llm_cache ("
+                "key TEXT PRIMARY KEY, value TEXT NOT NULL, size INTEGER NOT NULL, "
+                "created REAL NOT NULL, accessed REAL NOT NULL)"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS llm_cache_accessed ON llm_cache (accessed)")
+            self._conn = conn
+        return self._conn
+
+    def lookup(self, key: str) -> Optional[str]:
+        """Return the recorded response for `key`, or None when the LLM should be called.
+
+        Raises LLMCacheMissError in replay mode if nothing was recorded.
+        """
+        if self.mode in (LLMCacheMode.OFF, LLMCacheMode.RECORD):
+            return None
+        with self._lock:
+            conn = self._connect()
+            row = conn.execute("SELECT value FROM llm_cache WHERE key = ?", (key,)).fetchone()
+            if row is not None:
+                conn.execute("UPDATE llm_cache SET accessed = ? WHERE key = ?", (time.time(), key))
+        if row is None:
+            self.misses += 1
+            if self.mode == LLMCacheMode.REPLAY:
+                raise LLMCacheMissError(key)
+            return None
+        self.hits += 1
+        logger.debug(f"LLM cache hit: {key}")
+        return row[0]
+
+    def store(self, key: str, value: str):
+        """Record a response, evicting the least recently used entries when over the limits"""
+        if self.mode in (LLMCacheMode.OFF, LLMCacheMode.REPLAY):
+            return
+        now = time.time()
+        with self._lock:
+            conn = self._connect()
+            conn.execute(
+                "INSERT OR REPLACE INTO llm_cache (key, value, size, created, accessed) VALUES (?, ?, ?, ?, ?)",
+                (key, value, len(value.encode("utf-8")), now, now),
+            )
+            self._evict(conn)
+
+    async def alookup(self, key: str) -> Optional[str]:
+        """`lookup` in a worker thread, so that a busy database does not block the event loop"""
+        if self.mode in (LLMCacheMode.OFF, LLMCacheMode.RECORD):
+            return None
+        return await asyncio.to_thread(self.lookup, key)
+
+    async def astore(self, key: str, value: str):
+        """`store` in a worker thread, so that a busy database does not block the event loop"""
+        if self.mode in (LLMCacheMode.OFF, LLMCacheMode.REPLAY):
+            return
+        await asyncio.to_thread(self.store, key, value)
+
+    def _evict(self, conn: sqlite3.Connection):
+        if self.max_entries:
+            count = conn.execute("SELECT COUNT(*) FROM llm_cache").fetchone()[0]
+            if count > self.max_entries:
+                conn.execute(
+                    "DELETE FROM llm_cache WHERE key IN " "(SELECT key FROM llm_cache ORDER BY accessed ASC LIMIT ?)",
+                    (count - self.max_entries,),
+                )
+        if self.max_bytes:
+            total = conn.execute("SELECT COALESCE(SUM(size), 0) FROM llm_cache").fetchone()[0]
+            if total > self.max_bytes:
+                excess = total - self.max_bytes
+                freed = 0
+                victims = []
+                for key, size in conn.execute("SELECT key, size FROM llm_cache ORDER BY accessed ASC"):
+                    victims.append((key,))
+                    freed += size
+                    if freed >= excess:
+                        break
+                conn.executemany("DELETE FROM llm_cache WHERE key = ?", victims)
+
+    def count(self) -> int:
+        with self._lock:
+            return self._connect().execute("SELECT COUNT(*) FROM llm_cache").fetchone()[0]
+
+    def clear(self):
+        with self._lock:
+            self._connect().execute("DELETE FROM llm_cache")
+
+    def close(self):
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+
+
+_llm_cache: Optional[LLMCache] = None
+
+
+def get_llm_cache() -> LLMCache:
+    """Process-wide cache configured from LLM_CACHE / LLM_CACHE_PATH / LLM_CACHE_MAX_ENTRIES / LLM_CACHE_MAX_BYTES"""
+    global _llm_cache
+    if _llm_cache is None:
+        _llm_cache = LLMCache(
+            path=CONFIG.llm_cache_path,
+            mode=CONFIG.llm_cache,
+            max_entries=int(CONFIG.llm_cache_max_entries),
+            max_bytes=int(CONFIG.llm_cache_max_bytes),
+        )
+        if _llm_cache.enabled:
+            logger.info(f"LLM cache in {_llm_cache.mode.value} mode at {_llm_cache.path}")
+    return _llm_cache
+
+
+def set_llm_cache(cache: Optional[LLMCache]):
+    """Replace the process-wide cache, e.g. to switch modes between runs"""
+    global _llm_cache
+    if _llm_cache is not None and _llm_cache is not cache:
+        _llm_cache.close()
+    _llm_cache = cache
@@ -0,0 +1,197 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# @Desc   : offline LLM provider replaying scripted responses from a fixture directory, for benchmarks and CI
+
+import asyncio
+import hashlib
+import json
+import math
+import random
+import re
+import threading
+import time
+from collections import defaultdict
+from pathlib import Path
+from typing import AsyncIterator, Optional
+
+import openai
+
+from metagpt.config import CONFIG
+from metagpt.logs import logger
+from metagpt.provider.base_gpt_api import BaseGPTAPI, current_action
+from metagpt.provider.openai_api import CostManager, Costs
+from metagpt.provider.streaming import publish_stream
+from metagpt.utils.token_counter import approximate_tokens
+
+FIXTURE_SUFFIXES = (".json", ".md", ".txt")
+DEFAULT_FIXTURE = "default"
+
+
+class FixtureNotFoundError(LookupError):
+    """No scripted response matches the action and prompt of a request"""
+
+    def __init__(self, action: str, fingerprint: str, fixtures: Path):
+        self.action = action
+        self.fingerprint = fingerprint
+        super().__init__(
+            f"No mock LLM fixture for action {action or '<none>'} and prompt {fingerprint}, "
+            f"add {fixtures / (action or '.') / fingerprint}.json or a {DEFAULT_FIXTURE}.json fallback"
+        )
+
+
+def prompt_fingerprint(messages: list[dict]) -> str:
+    """Stable key of a prompt: roles and contents with whitespace collapsed, so reformatting does not change it"""
+    text = "\n".join(f"{m['role']}:{re.sub(r'\s+', ' ', m['content']).strip()}" for m in messages)
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()[:16]
+
+
+def write_fixture(fixtures: Path, action: str, messages: list[dict], response: str, **extra) -> Path:
+    """Script `response` for the given action and prompt, `extra` may hold usage/latency overrides"""
+    path = Path(fixtures) / action / f"{prompt_fingerprint(messages)}.json"
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_text(json.dumps({"response": response, **extra}, ensure_ascii=False, indent=2), encoding="utf-8")
+    return path
+
+
+class Distribution:
+    """Non-negative samples with the given mean and standard deviation, log-normal like real API latencies"""
+
+    def __init__(self, mean: float = 0.0, stdev: float = 0.0):
+        self.mean = float(mean)
+        self.stdev = float(stdev)
+
+    def sample(self, rng: random.Random) -> float:
+        if self.mean <= 0:
+            return 0.0
+        if self.stdev <= 0:
+            return self.mean
+        sigma2 = math.log(1 + (self.stdev / self.mean) ** 2)
+        return rng.lognormvariate(math.log(self.mean) - sigma2 / 2, math.sqrt(sigma2))
+
+
+class MockGPTAPI(BaseGPTAPI):
+    """Serves responses from a fixture directory instead of calling an API.
+
+    A request is matched by the action on whose behalf it is made (see `current_action`) and the fingerprint of its
+    messages, looked up in order as
+
+        <fixtures>/<Action>/<fingerprint>.json|md|txt
+        <fixtures>/<Action>/default.json|md|txt
+        <fixtures>/default.json|md|txt
+
+    where requests made outside of an action look in <fixtures> itself.
+
+    A .md/.txt fixture is the response itself. A .json fixture holds {"response": ...} where the response may be a
+    list served in turn to repeated requests, and optional "usage" and "latency" overrides. Latency and completion
+    tokens are sampled from the configured distributions with a seeded generator, and 429s/timeouts are injected at
+    the configured rates, so that everything but the API itself can be measured and exercised offline.
+    """
+
+    chunk_size = 64  # characters per streamed chunk
+
+    def __init__(self, fixtures: Optional[Path] = None, seed: Optional[int] = None):
+        self.fixtures = Path(fixtures or CONFIG.mock_llm_fixtures)
+        self.model = CONFIG.mock_llm_model
+        self.latency = Distribution(CONFIG.mock_llm_latency_mean, CONFIG.mock_llm_latency_stdev)
+        self.completion_tokens = Distribution(
+            CONFIG.mock_llm_completion_tokens_mean, CONFIG.mock_llm_completion_tokens_stdev
+        )
+        self.rate_limit_error_rate = CONFIG.mock_llm_rate_limit_error_rate
+        self.timeout_error_rate = CONFIG.mock_llm_timeout_error_rate
+        self._rng = random.Random(CONFIG.mock_llm_seed if seed is None else seed)
+        self._served = defaultdict(int)
+        self._lock = threading.Lock()
+        self._cost_manager = CostManager()
+
+    def _find_fixture(self, action: str, fingerprint: str) -> Optional[Path]:
+        folder = self.fixtures / action if action else self.fixtures
+        candidates = [folder / fingerprint, folder / DEFAULT_FIXTURE, self.fixtures / DEFAULT_FIXTURE]
+        for candidate in candidates:
+            for suffix in FIXTURE_SUFFIXES:
+                path = candidate.with_suffix(suffix)
+                if path.is_file():
+                    return path
+        return None
+
+    def _load(self, messages: list[dict]) -> dict:
+        action = current_action.get()
+        fingerprint = prompt_fingerprint(messages)
+        path = self._find_fixture(action, fingerprint)
+        if path is None:
+            raise FixtureNotFoundError(action, fingerprint, self.fixtures)
+        if path.suffix == ".json":
+            fixture = json.loads(path.read_text(encoding="utf-8"))
+        else:
+            fixture = {"response": path.read_text(encoding="utf-8")}
+        response = fixture["response"]
+        if isinstance(response, list):
+            with self._lock:
+                served = self._served[path]
+                self._served[path] += 1
+            response = response[min(served, len(response) - 1)]
+        logger.debug(f"Mock LLM answers {action or '<none>'} {fingerprint} from {path}")
+        return {**fixture, "response": response}
+
+    def _plan(self, messages: list[dict]) -> tuple[str, dict, float]:
+        """Pick the response, usage and latency of a request, or raise the injected error"""
+        fixture = self._load(messages)
+        with self._lock:
+            draw = self._rng.random()
+            latency = self.latency.sample(self._rng)
+            completion_tokens = self.completion_tokens.sample(self._rng)
+        if draw < self.rate_limit_error_rate:
+            raise openai.error.RateLimitError(
+                "Mock LLM injected rate limit", http_status=429, headers={"retry-after": "1"}
+            )
+        if draw < self.rate_limit_error_rate + self.timeout_error_rate:
+            raise openai.error.Timeout("Mock LLM injected timeout")
+        content = fixture["response"]
+        usage = {
+            "prompt_tokens": sum(approximate_tokens(m["content"]) for m in messages),
+            "completion_tokens": round(completion_tokens) or approximate_tokens(content),
+        }
+        usage.update(fixture.get("usage", {}))
+        return content, usage, float(fixture.get("latency", latency))
+
+    def _response(self, content: str, usage: dict) -> dict:
+        self._update_costs(usage)
+        return {
+            "model": self.model,
+            "choices": [{"index": 0, "message": {"role": "assistant", "content": content}, "finish_reason": "stop"}],
+            "usage": {**usage, "total_tokens": usage["prompt_tokens"] + usage["completion_tokens"]},
+        }
+
+    def _update_costs(self, usage: dict):
+        if CONFIG.calc_usage:
+            try:
+                self._cost_manager.update_cost(usage["prompt_tokens"], usage["completion_tokens"], self.model)
+            except Exception as e:
+                logger.error(f"updating costs failed! {e}")
+
+    def completion(self, messages: list[dict]) -> dict:
+        content, usage, latency = self._plan(messages)
+        time.sleep(latency)
+        return self._response(content, usage)
+
+    async def acompletion(self, messages: list[dict]) -> dict:
+        content, usage, latency = self._plan(messages)
+        await asyncio.sleep(latency)
+        return self._response(content, usage)
+
+    async def _astream(self, messages: list[dict]) -> AsyncIterator[str]:
+        """The sampled latency is spread evenly over the chunks of the response"""
+        content, usage, latency = self._plan(messages)
+        chunks = [content[i : i + self.chunk_size] for i in range(0, len(content), self.chunk_size)] or [""]
+        for chunk in chunks:
+            await asyncio.sleep(latency / len(chunks))
+            yield chunk
+        self._update_costs(usage)
+
+    async def acompletion_text(self, messages: list[dict], stream=False) -> str:
+        if stream:
+            return await publish_stream(self._astream(messages))
+        rsp = await self.acompletion(messages)
+        return self.get_choice_text(rsp)
+
+    def get_costs(self) -> Costs:
+        return self._cost_manager.get_costs()
@@ -5,11 +5,13 @@
 @File    : openai.py
 """
 import asyncio
+import json
 import time
-from typing import NamedTuple, Union
+from typing import AsyncIterator, Callable, NamedTuple, Optional, Union
 
 import openai
-from openai.error import APIConnectionError
+from openai.error import APIConnectionError, RateLimitError
+from openai.util import convert_to_openai_object
 from tenacity import (
     after_log,
     retry,
@@ -23,41 +25,24 @@ from metagpt.config import CONFIG
 from metagpt.logs import logger
 from metagpt.provider.base_gpt_api import BaseGPTAPI
 from metagpt.provider.constant import GENERAL_FUNCTION_SCHEMA, GENERAL_TOOL_CHOICE
+from metagpt.provider.hedging import HedgePolicy, LatencyTracker
+from metagpt.provider.llm_cache import LLMCache, get_llm_cache
+from metagpt.provider.rate_limiter import RateLimiter
+from metagpt.provider.singleflight import llm_single_flight
+from metagpt.provider.streaming import publish_stream
 from metagpt.schema import Message
+from metagpt.utils.http_session import get_session
+from metagpt.utils.run_context import Scoped
 from metagpt.utils.singleton import Singleton
 from metagpt.utils.token_counter import (
     TOKEN_COSTS,
+    approximate_tokens,
     count_message_tokens,
     count_string_tokens,
     get_max_completion_tokens,
 )
 
 
-class RateLimiter:
-    """Rate control class, each call goes through wait_if_needed, sleep if rate control is needed"""
-
-    def __init__(self, rpm):
-        self.last_call_time = 0
-        # Here 1.1 is used because even if the calls are made strictly according to time,
-        # they will still be QOS'd; consider switching to simple error retry later
-        self.interval = 1.1 * 60 / rpm
-        self.rpm = rpm
-
-    def split_batches(self, batch):
-        return [batch[i : i + self.rpm] for i in range(0, len(batch), self.rpm)]
-
-    async def wait_if_needed(self, num_requests):
-        current_time = time.time()
-        elapsed_time = current_time - self.last_call_time
-
-        if elapsed_time < self.interval * num_requests:
-            remaining_time = self.interval * num_requests - elapsed_time
-            logger.info(f"sleep {remaining_time}")
-            await asyncio.sleep(remaining_time)
-
-        self.last_call_time = time.time()
-
-
 class Costs(NamedTuple):
     total_prompt_tokens: int
     total_completion_tokens: int
@@ -68,6 +53,12 @@ class Costs(NamedTuple):
 class CostManager(metaclass=Singleton):
     """计算使用接口的开销"""
 
+    # counted per run, see metagpt.utils.run_context
+    total_prompt_tokens = Scoped(default=0, inherit=False)
+    total_completion_tokens = Scoped(default=0, inherit=False)
+    total_cost = Scoped(default=0, inherit=False)
+    total_budget = Scoped(default=0, inherit=False)
+
     def __init__(self):
         self.total_prompt_tokens = 0
         self.total_completion_tokens = 0
@@ -138,18 +129,37 @@ See FAQ 5.8
     raise retry_state.outcome.exception()
 
 
-class OpenAIGPTAPI(BaseGPTAPI, RateLimiter):
+class OpenAIGPTAPI(BaseGPTAPI):
     """
     Check https://platform.openai.com/examples for examples
     """
 
-    def __init__(self):
-        self.__init_openai(CONFIG)
+    max_rate_limit_retries = 3
+    # keys of the request kwargs that select the endpoint, see `_endpoint_kwargs`
+    endpoint_kwarg_names = ("model", "engine", "deployment_id", "api_key", "api_base", "api_type", "api_version")
+
+    def __init__(self, endpoint: Optional[dict] = None):
+        """
+        :param endpoint: optional per-instance endpoint, e.g. one entry of LLM_ENDPOINTS with the keys
+            api_key, api_base, api_type, api_version, model, deployment_name, deployment_id, rpm, tpm.
+            Missing keys fall back to the global configuration, and the `openai` module globals are left alone.
+        """
+        self._endpoint = endpoint
+        if endpoint is None:
+            self.__init_openai(CONFIG)
+        else:
+            self.__init_endpoint(CONFIG, endpoint)
         self.llm = openai
-        self.model = CONFIG.openai_api_model
         self.auto_max_tokens = False
         self._cost_manager = CostManager()
-        RateLimiter.__init__(self, rpm=self.rpm)
+        self._rate_limiter = RateLimiter.get(
+            api_base=self.api_base, api_key=self.api_key, model=self.model, rpm=self.rpm, tpm=self.tpm
+        )
+        self._latency = LatencyTracker.get(self.model)
+        self._first_content_latency = LatencyTracker.get(f"{self.model}:first_content")  # of stream requests
+        self.hedge_policy: Optional[HedgePolicy] = HedgePolicy.from_config()
+        # where hedged requests go, e.g. another endpoint of a router; the same endpoint when unset or None
+        self.hedge_alternate: Optional[Callable[[], Optional["OpenAIGPTAPI"]]] = None
 
     def __init_openai(self, config):
         openai.api_key = config.openai_api_key
@@ -158,29 +168,183 @@ class OpenAIGPTAPI(BaseGPTAPI, RateLimiter):
         if config.openai_api_type:
             openai.api_type = config.openai_api_type
             openai.api_version = config.openai_api_version
+        self.api_key = config.openai_api_key
+        self.api_base = config.openai_api_base
+        self.api_type = config.openai_api_type
+        self.api_version = config.openai_api_version
+        self.model = config.openai_api_model
+        self.deployment_name = config.deployment_name
+        self.deployment_id = config.deployment_id
         self.rpm = int(config.get("RPM", 10))
+        self.tpm = int(config.openai_api_tpm)
+
+    def __init_endpoint(self, config, endpoint: dict):
+        self.api_key = endpoint.get("api_key", config.openai_api_key)
+        self.api_base = endpoint.get("api_base", config.openai_api_base)
+        self.api_type = endpoint.get("api_type", config.openai_api_type)
+        self.api_version = endpoint.get("api_version", config.openai_api_version)
+        self.model = endpoint.get("model", config.openai_api_model)
+        self.deployment_name = endpoint.get("deployment_name")
+        self.deployment_id = endpoint.get("deployment_id")
+        self.rpm = int(endpoint.get("rpm", config.get("RPM", 10)))
+        self.tpm = int(endpoint.get("tpm", config.openai_api_tpm))
+
+    @staticmethod
+    def _estimate_tokens(kwargs: dict) -> int:
+        """Cheap estimate of prompt + completion tokens, used to budget TPM before the request and settled after it"""
+        prompt_tokens = sum(approximate_tokens(str(m.get("content") or "")) for m in kwargs["messages"])
+        return prompt_tokens + int(kwargs.get("max_tokens") or 0)
+
+    async def _acreate(self, kwargs: dict, stream: bool = False):
+        """ChatCompletion.acreate paced by the shared RateLimiter, a 429 waits for the advertised reset and retries"""
+        estimated = self._estimate_tokens(kwargs)
+        # one reservation for the request: a 429 was not served, its retries re-use it after the advertised reset
+        await self._rate_limiter.acquire(estimated)
+        for attempt in range(self.max_rate_limit_retries + 1):
+            session_token = openai.aiosession.set(openai.aiosession.get() or get_session())
+            try:
+                with self._rate_limiter.active():
+                    rsp = await self.llm.ChatCompletion.acreate(**kwargs, stream=stream)
+                break
+            except RateLimitError as e:
+                if attempt == self.max_rate_limit_retries:
+                    raise
+                delay = self._rate_limiter.retry_after(e.headers)
+                logger.warning(f"Rate limited by the API, retry in {delay:.2f}s ({attempt + 1}/{self.max_rate_limit_retries})")
+                await asyncio.sleep(delay)
+            finally:
+                openai.aiosession.reset(session_token)
+        if not stream:
+            usage = rsp.get("usage") or {}
+            self._rate_limiter.settle(estimated, int(usage.get("total_tokens", estimated)))
+        return rsp
 
-    async def _achat_completion_stream(self, messages: list[dict]) -> str:
-        response = await openai.ChatCompletion.acreate(**self._cons_kwargs(messages), stream=True)
+    async def _ahedged(self, attempt: Callable, kwargs: dict, latency: LatencyTracker,
+                       on_loser: Optional[Callable] = None):
+        """`attempt(llm, kwargs)`, duplicated to another endpoint or key when it is slower than usual, see
+        HedgePolicy. Each attempt pays for itself, the loser included"""
+        delay = self.hedge_policy.delay(latency) if self.hedge_policy else None
+        start = time.monotonic()
+        if delay is None:
+            rsp = await attempt(self, kwargs)
+            latency.record(time.monotonic() - start)
+            return rsp
+
+        alternate = (self.hedge_alternate and self.hedge_alternate()) or self
+        hedged = False
+
+        def hedge():
+            nonlocal hedged
+            hedged = True
+            return attempt(alternate, alternate._rebind_kwargs(kwargs))
+
+        rsp = await self.hedge_policy.run(
+            lambda: attempt(self, kwargs),
+            hedge,
+            delay,
+            allow=lambda: self._can_hedge(kwargs, alternate),
+            on_loser=on_loser,
+        )
+        if not hedged:  # the latency of a hedged request is the hedge's, it would lower the percentile it is cut at
+            latency.record(time.monotonic() - start)
+        return rsp
+
+    async def _acreate_charged(self, kwargs: dict):
+        """`_acreate` with its usage charged; a request cancelled in flight, e.g. a lost hedge, is charged its prompt"""
+        try:
+            rsp = await self._acreate(kwargs)
+        except asyncio.CancelledError:
+            self._update_costs(self._calc_usage(kwargs["messages"], ""))
+            raise
+        self._update_costs(rsp.get("usage"))
+        return rsp
 
-        # create variables to collect the stream of chunks
-        collected_chunks = []
-        collected_messages = []
-        # iterate through the stream of events
+    async def _aopen_stream(self, kwargs: dict) -> tuple["OpenAIGPTAPI", list[str], AsyncIterator[str]]:
+        """Send a stream request and wait for its first content, returns this client, the content so far and the
+        rest of the stream. A request cancelled meanwhile, e.g. a lost hedge, is charged its prompt"""
+        try:
+            response = await self._acreate(kwargs, stream=True)
+            contents = self._aiter_contents(response)
+            head = []
+            async for content in contents:
+                head.append(content)
+                break
+        except asyncio.CancelledError:
+            self._update_costs(self._calc_usage(kwargs["messages"], ""))
+            raise
+        return self, head, contents
+
+    @staticmethod
+    async def _aiter_contents(response) -> AsyncIterator[str]:
         async for chunk in response:
-            collected_chunks.append(chunk)  # save the event response
             choices = chunk["choices"]
             if len(choices) > 0:
-                chunk_message = chunk["choices"][0].get("delta", {})  # extract the message
-                collected_messages.append(chunk_message)  # save the message
-                if "content" in chunk_message:
-                    print(chunk_message["content"], end="")
-        print()
-
-        full_reply_content = "".join([m.get("content", "") for m in collected_messages])
-        usage = self._calc_usage(messages, full_reply_content)
+                content = choices[0].get("delta", {}).get("content")
+                if content:
+                    yield content
+
+    def _settle_stream(self, kwargs: dict, collected: list[str]) -> Optional[dict]:
+        """Charge a stream for what it generated and settle its rate limit reservation"""
+        usage = self._calc_usage(kwargs["messages"], "".join(collected))
         self._update_costs(usage)
-        return full_reply_content
+        if usage:
+            estimated = self._estimate_tokens(kwargs)
+            self._rate_limiter.settle(estimated, usage["prompt_tokens"] + usage["completion_tokens"])
+        return usage
+
+    def _can_hedge(self, kwargs: dict, alternate: "OpenAIGPTAPI") -> bool:
+        """A hedge must fit in the alternate's rate limits and keep the running cost within budget"""
+        if alternate._rate_limiter.headroom() <= 0:
+            return False
+        price = TOKEN_COSTS.get(alternate.model, {"prompt": 0, "completion": 0})
+        extra_cost = self._estimate_tokens(kwargs) * max(price["prompt"], price["completion"]) / 1000
+        return self.hedge_policy.within_budget(self._cost_manager.total_cost, extra_cost)
+
+    async def _achat_completion_stream(self, messages: list[dict]) -> str:
+        kwargs = self._cons_kwargs(messages)
+        cache_key = self._cache_key(kwargs)
+        cached = await get_llm_cache().alookup(cache_key)
+        if cached is not None:
+            return await publish_stream(self._aiter_cached(cached))
+        return await llm_single_flight.do(
+            ("stream", cache_key), lambda: publish_stream(self._astream_uncached(messages, kwargs, cache_key))
+        )
+
+    async def _astream(self, messages: list[dict]) -> AsyncIterator[str]:
+        kwargs = self._cons_kwargs(messages)
+        cache_key = self._cache_key(kwargs)
+        cached = await get_llm_cache().alookup(cache_key)
+        chunks = self._aiter_cached(cached) if cached is not None else self._astream_uncached(messages, kwargs, cache_key)
+        async for chunk in chunks:
+            yield chunk
+
+    async def _aiter_cached(self, cached: str) -> AsyncIterator[str]:
+        yield self.get_choice_text(json.loads(cached))
+
+    async def _astream_uncached(self, messages: list[dict], kwargs: dict, cache_key: str) -> AsyncIterator[str]:
+        def close_lost(stream):
+            llm, head, contents = stream
+            llm._settle_stream(kwargs, head)
+            asyncio.ensure_future(contents.aclose())
+
+        # hedged up to the first content: once a stream has started, the other one is not going to catch up
+        llm, collected_messages, contents = await self._ahedged(
+            lambda llm, kw: llm._aopen_stream(kw), kwargs, self._first_content_latency, on_loser=close_lost
+        )
+        try:
+            for content in list(collected_messages):
+                yield content
+            async for content in contents:
+                collected_messages.append(content)
+                yield content
+        finally:
+            # a consumer stopping early still pays for what was generated so far
+            await contents.aclose()
+            usage = llm._settle_stream(kwargs, collected_messages)
+        # record the stream in the same shape as a non-stream response, so both paths share cache entries
+        full_reply_content = "".join(collected_messages)
+        rsp = {"choices": [{"index": 0, "message": {"role": "assistant", "content": full_reply_content}}], "usage": usage}
+        await get_llm_cache().astore(cache_key, json.dumps(rsp))
 
     def _cons_kwargs(self, messages: list[dict], **configs) -> dict:
         kwargs = {
@@ -194,26 +358,60 @@ class OpenAIGPTAPI(BaseGPTAPI, RateLimiter):
         if configs:
             kwargs.update(configs)
 
-        if CONFIG.openai_api_type == "azure":
-            if CONFIG.deployment_name and CONFIG.deployment_id:
+        kwargs.update(self._endpoint_kwargs())
+        return kwargs
+
+    def _endpoint_kwargs(self) -> dict:
+        if self.api_type == "azure":
+            if self.deployment_name and self.deployment_id:
                 raise ValueError("You can only use one of the `deployment_id` or `deployment_name` model")
-            elif not CONFIG.deployment_name and not CONFIG.deployment_id:
+            elif not self.deployment_name and not self.deployment_id:
                 raise ValueError("You must specify `DEPLOYMENT_NAME` or `DEPLOYMENT_ID` parameter")
-            kwargs_mode = (
-                {"engine": CONFIG.deployment_name}
-                if CONFIG.deployment_name
-                else {"deployment_id": CONFIG.deployment_id}
-            )
+            kwargs = {"engine": self.deployment_name} if self.deployment_name else {"deployment_id": self.deployment_id}
         else:
-            kwargs_mode = {"model": self.model}
-        kwargs.update(kwargs_mode)
+            kwargs = {"model": self.model}
+        if self._endpoint is not None:
+            # per-request credentials, so that several endpoints can be used side by side
+            kwargs.update({"api_key": self.api_key, "api_base": self.api_base})
+            if self.api_type:
+                kwargs.update({"api_type": self.api_type, "api_version": self.api_version})
         return kwargs
 
-    async def _achat_completion(self, messages: list[dict]) -> dict:
-        rsp = await self.llm.ChatCompletion.acreate(**self._cons_kwargs(messages))
-        self._update_costs(rsp.get("usage"))
+    def _rebind_kwargs(self, kwargs: dict) -> dict:
+        """The same request, sent to this endpoint"""
+        rebound = {k: v for k, v in kwargs.items() if k not in self.endpoint_kwarg_names}
+        rebound.update(self._endpoint_kwargs())
+        return rebound
+
+    def _cache_key(self, kwargs: dict) -> str:
+        model = kwargs.get("model") or kwargs.get("engine") or kwargs.get("deployment_id")
+        return LLMCache.make_key(
+            provider=self.api_type or "openai",
+            model=model,
+            messages=kwargs["messages"],
+            temperature=kwargs.get("temperature"),
+            max_tokens=kwargs.get("max_tokens"),
+            tools=kwargs.get("tools"),
+        )
+
+    async def _acreate_cached(self, kwargs: dict) -> dict:
+        """ChatCompletion.acreate in front of the LLM cache; cache hits do not add to the running cost
+        and concurrent identical requests share one call"""
+        cache = get_llm_cache()
+        cache_key = self._cache_key(kwargs)
+        cached = await cache.alookup(cache_key)
+        if cached is not None:
+            return convert_to_openai_object(json.loads(cached))
+        return await llm_single_flight.do(("chat", cache_key), lambda: self._acreate_and_store(kwargs, cache_key))
+
+    async def _acreate_and_store(self, kwargs: dict, cache_key: str) -> dict:
+        rsp = await self._ahedged(lambda llm, kw: llm._acreate_charged(kw), kwargs, self._latency)
+        await get_llm_cache().astore(cache_key, json.dumps(rsp))
         return rsp
 
+    async def _achat_completion(self, messages: list[dict]) -> dict:
+        return await self._acreate_cached(self._cons_kwargs(messages))
+
     def _chat_completion(self, messages: list[dict]) -> dict:
         rsp = self.llm.ChatCompletion.create(**self._cons_kwargs(messages))
         self._update_costs(rsp)
@@ -262,9 +460,7 @@ class OpenAIGPTAPI(BaseGPTAPI, RateLimiter):
         return rsp
 
     async def _achat_completion_function(self, messages: list[dict], **chat_configs) -> dict:
-        rsp = await self.llm.ChatCompletion.acreate(**self._func_configs(messages, **chat_configs))
-        self._update_costs(rsp.get("usage"))
-        return rsp
+        return await self._acreate_cached(self._func_configs(messages, **chat_configs))
 
     def _process_message(self, messages: Union[str, Message, list[dict], list[Message], list[str]]) -> list[dict]:
         """convert messages to list[dict]."""
@@ -333,20 +529,11 @@ class OpenAIGPTAPI(BaseGPTAPI, RateLimiter):
             return usage
 
     async def acompletion_batch(self, batch: list[list[dict]]) -> list[dict]:
-        """Return full JSON"""
-        split_batches = self.split_batches(batch)
-        all_results = []
-
-        for small_batch in split_batches:
-            logger.info(small_batch)
-            await self.wait_if_needed(len(small_batch))
-
-            future = [self.acompletion(prompt) for prompt in small_batch]
-            results = await asyncio.gather(*future)
-            logger.info(results)
-            all_results.extend(results)
-
-        return all_results
+        """Return full JSON, each request is paced by the shared RateLimiter"""
+        logger.info(batch)
+        results = await asyncio.gather(*[self.acompletion(prompt) for prompt in batch])
+        logger.info(results)
+        return results
 
     async def acompletion_batch_text(self, batch: list[list[dict]]) -> list[str]:
         """Only return plain text"""
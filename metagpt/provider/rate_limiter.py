@@ -0,0 +1,220 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# @Desc   : token-bucket rate limiting on requests and tokens per minute, shared by all LLM clients of a process
+
+import asyncio
+import hashlib
+import re
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Optional
+
+import aiohttp
+
+from metagpt.logs import logger
+from metagpt.utils.http_session import register_trace_config
+
+# Which limiter the current request belongs to, so that response headers can be routed back to it
+_active_limiter: ContextVar[Optional["RateLimiter"]] = ContextVar("active_rate_limiter", default=None)
+
+_DURATION_PATTERN = re.compile(r"(?P<value>\d+(?:\.\d+)?)(?P<unit>ms|s|m|h)")
+_DURATION_UNITS = {"ms": 0.001, "s": 1, "m": 60, "h": 3600}
+
+
+def parse_reset_duration(value: str) -> Optional[float]:
+    """Parse OpenAI reset durations such as `1s`, `6m0s` or `20ms` into seconds"""
+    if not value:
+        return None
+    matches = list(_DURATION_PATTERN.finditer(value))
+    if not matches:
+        try:
+            return float(value)
+        except ValueError:
+            return None
+    return sum(float(m.group("value")) * _DURATION_UNITS[m.group("unit")] for m in matches)
+
+
+class TokenBucket:
+    """A bucket of `capacity` units refilled continuously over `period` seconds.
+
+    Callers reserve units up front and are told how long to wait; the level may go negative, which queues
+    later callers behind earlier ones without needing a lock that is bound to one event loop.
+    A capacity of 0 means unlimited.
+    """
+
+    def __init__(self, capacity: float, period: float = 60):
+        self.capacity = capacity
+        self.period = period
+        self.level = capacity
+        self.updated = time.monotonic()
+
+    @property
+    def rate(self) -> float:
+        return self.capacity / self.period
+
+    def _refill(self, now: float):
+        if self.capacity:
+            self.level = min(self.capacity, self.level + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def reserve(self, amount: float, now: float) -> float:
+        """Take `amount` units, return the seconds to wait until they are really available"""
+        if not self.capacity:
+            return 0
+        self._refill(now)
+        self.level -= min(amount, self.capacity)
+        return 0 if self.level >= 0 else -self.level / self.rate
+
+    def refund(self, amount: float):
+        if self.capacity:
+            self.level = min(self.capacity, self.level + amount)
+
+    def sync(self, capacity: Optional[float], remaining: Optional[float], reset: Optional[float], now: float):
+        """Align the bucket with what the server reports"""
+        if capacity:
+            self.capacity = capacity
+        if not self.capacity:
+            return
+        self._refill(now)
+        if remaining is not None:
+            self.level = min(self.level, remaining)
+        if reset and self.level < 0:
+            self.level = max(self.level, -reset * self.rate)
+
+
+class RateLimiter:
+    """Rate control on both requests per minute (RPM) and tokens per minute (TPM).
+
+    One limiter is kept per (api base, api key, model) and shared by every client in the process, see `get`.
+    Callers `acquire` before a request with an estimate of prompt + completion tokens, and `settle` afterwards
+    with the real usage. Limits start from configuration and are then learnt from `x-ratelimit-*` headers.
+    """
+
+    _limiters: dict[tuple, "RateLimiter"] = {}
+    _registry_lock = threading.Lock()
+
+    def __init__(self, rpm: int = 0, tpm: int = 0, name: str = ""):
+        self.name = name
+        self.requests = TokenBucket(rpm)
+        self.tokens = TokenBucket(tpm)
+        self._lock = threading.Lock()
+
+    @classmethod
+    def get(cls, api_base: str, api_key: str, model: str, rpm: int = 0, tpm: int = 0) -> "RateLimiter":
+        """Return the process-wide limiter for an endpoint, creating it from the configured limits"""
+        key_hash = hashlib.sha256((api_key or "").encode("utf-8")).hexdigest()[:12]
+        key = (api_base or "", key_hash, model or "")
+        with cls._registry_lock:
+            if key not in cls._limiters:
+                cls._limiters[key] = cls(rpm=rpm, tpm=tpm, name=f"{model}@{api_base or 'default'}")
+            return cls._limiters[key]
+
+    @classmethod
+    def reset_all(cls):
+        with cls._registry_lock:
+            cls._limiters.clear()
+
+    @property
+    def rpm(self) -> float:
+        return self.requests.capacity
+
+    @property
+    def tpm(self) -> float:
+        return self.tokens.capacity
+
+    def headroom(self) -> float:
+        """Fraction (0-1) of the tighter of the two budgets that is currently available, 1 when unlimited"""
+        now = time.monotonic()
+        with self._lock:
+            fractions = []
+            for bucket in (self.requests, self.tokens):
+                if bucket.capacity:
+                    bucket._refill(now)
+                    fractions.append(max(bucket.level, 0) / bucket.capacity)
+        return min(fractions, default=1.0)
+
+    def reserve(self, tokens: int = 0, num_requests: int = 1) -> float:
+        """Reserve capacity for a request, return the delay before it may be sent"""
+        now = time.monotonic()
+        with self._lock:
+            return max(self.requests.reserve(num_requests, now), self.tokens.reserve(tokens, now))
+
+    async def acquire(self, tokens: int = 0, num_requests: int = 1):
+        """Wait until a request of about `tokens` tokens fits in both budgets"""
+        delay = self.reserve(tokens, num_requests)
+        if delay > 0:
+            logger.info(f"Rate limit {self.name}: sleep {delay:.2f}s")
+            await asyncio.sleep(delay)
+
+    def settle(self, estimated: int, used: int):
+        """Give back (or take) the difference between the estimated and the real token usage"""
+        with self._lock:
+            if used < estimated:
+                self.tokens.refund(estimated - used)
+            elif used > estimated:
+                self.tokens.reserve(used - estimated, time.monotonic())
+
+    def update_from_headers(self, headers):
+        """Learn limits from the `x-ratelimit-*` headers of an OpenAI-compatible response"""
+        if not headers:
+            return
+
+        def _number(name):
+            try:
+                return float(headers.get(name))
+            except (TypeError, ValueError):
+                return None
+
+        now = time.monotonic()
+        with self._lock:
+            self.requests.sync(
+                _number("x-ratelimit-limit-requests"),
+                _number("x-ratelimit-remaining-requests"),
+                parse_reset_duration(headers.get("x-ratelimit-reset-requests")),
+                now,
+            )
+            self.tokens.sync(
+                _number("x-ratelimit-limit-tokens"),
+                _number("x-ratelimit-remaining-tokens"),
+                parse_reset_duration(headers.get("x-ratelimit-reset-tokens")),
+                now,
+            )
+
+    def retry_after(self, headers) -> float:
+        """Seconds to wait after a 429, from the response headers or the bucket state"""
+        self.update_from_headers(headers)
+        if headers:
+            for name in ("retry-after-ms", "retry-after"):
+                delay = parse_reset_duration(headers.get(name))
+                if delay is not None:
+                    return delay / 1000 if name == "retry-after-ms" else delay
+        with self._lock:
+            self.requests.level = min(self.requests.level, 0)
+            return self.requests.reserve(0, time.monotonic()) or 1.0
+
+    @contextmanager
+    def active(self):
+        """Route response headers seen by the current task to this limiter"""
+        token = _active_limiter.set(self)
+        try:
+            yield self
+        finally:
+            _active_limiter.reset(token)
+
+
+async def _on_request_end(session, trace_config_ctx, params: aiohttp.TraceRequestEndParams):
+    limiter = _active_limiter.get()
+    if limiter is not None:
+        limiter.update_from_headers(params.response.headers)
+
+
+def rate_limit_trace_config() -> aiohttp.TraceConfig:
+    """aiohttp trace hook feeding response headers to the limiter active in the calling task"""
+    trace_config = aiohttp.TraceConfig()
+    trace_config.on_request_end.append(_on_request_end)
+    return trace_config
+
+
+register_trace_config(rate_limit_trace_config)
@@ -0,0 +1,225 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# @Desc   : route LLM requests across a pool of OpenAI/Azure endpoints with failover and latency-aware balancing
+
+import random
+import time
+from functools import partial
+from typing import AsyncIterator, Awaitable, Callable, Optional, Union
+
+from openai.error import (
+    APIConnectionError,
+    APIError,
+    AuthenticationError,
+    RateLimitError,
+    ServiceUnavailableError,
+    Timeout,
+    TryAgain,
+)
+
+from metagpt.config import CONFIG
+from metagpt.logs import logger
+from metagpt.provider.base_gpt_api import BaseGPTAPI
+from metagpt.provider.openai_api import CostManager, Costs, OpenAIGPTAPI
+from metagpt.schema import Message
+
+# Errors that are specific to one endpoint, so the request is retried on another one.
+# Anything else (e.g. an invalid request) would fail the same way everywhere and is raised directly.
+FAILOVER_ERRORS = (
+    APIConnectionError,
+    APIError,
+    AuthenticationError,
+    RateLimitError,
+    ServiceUnavailableError,
+    Timeout,
+    TryAgain,
+)
+
+
+class Endpoint:
+    """Live health statistics of one endpoint of the pool, with a circuit breaker"""
+
+    alpha = 0.2  # smoothing of the moving averages
+    failure_threshold = 3  # consecutive failures before the circuit opens
+    base_cooldown = 30.0
+    max_cooldown = 300.0
+
+    def __init__(self, llm: OpenAIGPTAPI, name: str, weight: float = 1.0):
+        self.llm = llm
+        self.name = name
+        self.weight = weight
+        self.latency: Optional[float] = None  # moving average of seconds per request
+        self.error_rate = 0.0  # moving average of failed requests
+        self.inflight = 0
+        self.failures = 0
+        self.cooldown = self.base_cooldown
+        self.open_until = 0.0
+
+    @property
+    def available(self) -> bool:
+        """Closed circuit, or open circuit whose cooldown has passed (half-open: let a probe through)"""
+        return time.monotonic() >= self.open_until
+
+    def score(self, default_latency: float) -> float:
+        latency = self.latency if self.latency is not None else default_latency
+        headroom = max(self.llm._rate_limiter.headroom(), 0.01)
+        return self.weight * (1 - self.error_rate) * headroom / (max(latency, 1e-3) * (1 + self.inflight))
+
+    def record_success(self, elapsed: float):
+        self.latency = elapsed if self.latency is None else (1 - self.alpha) * self.latency + self.alpha * elapsed
+        self.error_rate *= 1 - self.alpha
+        self.failures = 0
+        self.cooldown = self.base_cooldown
+        self.open_until = 0.0
+
+    def record_failure(self):
+        self.error_rate = (1 - self.alpha) * self.error_rate + self.alpha
+        self.failures += 1
+        if self.failures >= self.failure_threshold:
+            self.open_until = time.monotonic() + self.cooldown
+            logger.warning(f"LLM endpoint {self.name} is unhealthy, circuit open for {self.cooldown:.0f}s")
+            self.cooldown = min(self.cooldown * 2, self.max_cooldown)
+
+    def __repr__(self):
+        return f"Endpoint({self.name}, latency={self.latency}, error_rate={self.error_rate:.2f})"
+
+
+class RouterGPTAPI(BaseGPTAPI):
+    """Spread requests over the endpoints of LLM_ENDPOINTS, e.g.
+
+    LLM_ENDPOINTS:
+      - name: openai-1
+        api_key: "sk-..."
+        model: gpt-4
+      - name: azure-east
+        api_type: azure
+        api_base: "https://east.openai.azure.com"
+        api_version: "2023-07-01-preview"
+        api_key: "..."
+        deployment_name: gpt-4
+        weight: 2
+
+    Each request goes to the endpoint with the best score, i.e. weight x success rate x rate limit headroom over
+    latency x load. Failing endpoints are retried on the next best one right away instead of sleeping, and are
+    taken out of rotation by a circuit breaker after repeated failures.
+    """
+
+    def __init__(self, endpoints: Optional[list[dict]] = None):
+        endpoints = endpoints or CONFIG.llm_endpoints
+        if not endpoints:
+            raise ValueError("RouterGPTAPI needs at least one entry in LLM_ENDPOINTS")
+        self.endpoints: list[Endpoint] = []
+        for idx, cfg in enumerate(endpoints):
+            llm = OpenAIGPTAPI(endpoint=cfg)
+            llm.max_rate_limit_retries = 0  # fail over instead of waiting on this endpoint
+            name = cfg.get("name") or f"{idx}:{llm.model}"
+            endpoint = Endpoint(llm, name=name, weight=float(cfg.get("weight", 1.0)))
+            llm.hedge_alternate = partial(self._hedge_alternate, endpoint)
+            self.endpoints.append(endpoint)
+        self.model = self.endpoints[0].llm.model
+        self._cost_manager = CostManager()
+
+    def select(self, exclude: tuple = ()) -> Optional[Endpoint]:
+        """The best endpoint not in `exclude`; if every circuit is open, the one closest to recovery"""
+        candidates = [ep for ep in self.endpoints if ep not in exclude]
+        if not candidates:
+            return None
+        healthy = [ep for ep in candidates if ep.available]
+        if not healthy:
+            return min(candidates, key=lambda ep: ep.open_until)
+        known = [ep.latency for ep in healthy if ep.latency is not None]
+        default_latency = min(known) if known else 1.0  # be optimistic about endpoints never used yet
+        best = max(ep.score(default_latency) for ep in healthy)
+        return random.choice([ep for ep in healthy if ep.score(default_latency) >= best])
+
+    def _hedge_alternate(self, endpoint: Endpoint) -> Optional[OpenAIGPTAPI]:
+        """Hedged requests of an endpoint go to the best healthy other endpoint"""
+        other = self.select(exclude=(endpoint,))
+        return other.llm if other is not None and other.available else None
+
+    async def _failover(self, call: Callable[[OpenAIGPTAPI], Awaitable]):
+        tried = []
+        last_error = None
+        while True:
+            endpoint = self.select(exclude=tuple(tried))
+            if endpoint is None:
+                raise last_error
+            tried.append(endpoint)
+            endpoint.inflight += 1
+            start = time.monotonic()
+            try:
+                result = await call(endpoint.llm)
+            except FAILOVER_ERRORS as e:
+                endpoint.record_failure()
+                logger.warning(f"LLM endpoint {endpoint.name} failed: {e!r}, trying another endpoint")
+                last_error = e
+                continue
+            finally:
+                endpoint.inflight -= 1
+            endpoint.record_success(time.monotonic() - start)
+            return result
+
+    async def _astream(self, messages: list[dict]) -> AsyncIterator[str]:
+        """Stream from the best endpoint; fail over only while nothing has been yielded yet"""
+        tried = []
+        while True:
+            endpoint = self.select(exclude=tuple(tried))
+            tried.append(endpoint)
+            started = False
+            start = time.monotonic()
+            try:
+                async for chunk in endpoint.llm._astream(messages):
+                    started = True
+                    yield chunk
+            except FAILOVER_ERRORS as e:
+                endpoint.record_failure()
+                if started or len(tried) == len(self.endpoints):
+                    raise
+                logger.warning(f"LLM endpoint {endpoint.name} failed: {e!r}, trying another endpoint")
+                continue
+            endpoint.record_success(time.monotonic() - start)
+            return
+
+    def completion(self, messages: list[dict]) -> dict:
+        tried = []
+        while True:
+            endpoint = self.select(exclude=tuple(tried))
+            tried.append(endpoint)
+            start = time.monotonic()
+            try:
+                rsp = endpoint.llm.completion(messages)
+            except FAILOVER_ERRORS:
+                endpoint.record_failure()
+                if len(tried) == len(self.endpoints):
+                    raise
+                continue
+            endpoint.record_success(time.monotonic() - start)
+            return rsp
+
+    async def acompletion(self, messages: list[dict]) -> dict:
+        return await self._failover(lambda llm: llm._achat_completion(messages))
+
+    async def acompletion_text(self, messages: list[dict], stream=False) -> str:
+        if stream:
+            return await self._failover(lambda llm: llm._achat_completion_stream(messages))
+        rsp = await self.acompletion(messages)
+        return self.get_choice_text(rsp)
+
+    async def aask_code(self, messages: Union[str, Message, list[dict]], **kwargs) -> dict:
+        return await self._failover(lambda llm: llm.aask_code(messages, **kwargs))
+
+    def get_costs(self) -> Costs:
+        return self._cost_manager.get_costs()
+
+    def stats(self) -> list[dict]:
+        return [
+            {
+                "name": ep.name,
+                "latency": ep.latency,
+                "error_rate": ep.error_rate,
+                "inflight": ep.inflight,
+                "available": ep.available,
+                "headroom": ep.llm._rate_limiter.headroom(),
+            }
+            for ep in self.endpoints
+        ]
@@ -0,0 +1,63 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# @Desc   : single-flight de-duplication of identical in-flight LLM requests
+
+import asyncio
+from typing import Any, Awaitable, Callable, Hashable
+
+from metagpt.config import CONFIG
+from metagpt.logs import logger
+
+
+class SingleFlight:
+    """Coalesce concurrent calls with the same key into one in-flight call.
+
+    The first caller (the leader) starts the call as a task, callers arriving while it is still running await
+    the same task and get the same result or exception. Waiters are shielded from each other: cancelling one
+    of them does not cancel the shared call. Calls are only shared within one event loop.
+    """
+
+    def __init__(self, name: str = ""):
+        self.name = name
+        self.enabled = True
+        self.calls = 0
+        self.shared = 0
+        self._inflight: dict[tuple, asyncio.Task] = {}
+
+    @property
+    def hit_rate(self) -> float:
+        """Fraction of calls that were served by another caller's in-flight request"""
+        return self.shared / self.calls if self.calls else 0.0
+
+    def stats(self) -> dict:
+        return {"calls": self.calls, "shared": self.shared, "hit_rate": self.hit_rate, "inflight": len(self._inflight)}
+
+    async def do(self, key: Hashable, fn: Callable[[], Awaitable[Any]]) -> Any:
+        if not self.enabled:
+            return await fn()
+
+        self.calls += 1
+        flight_key = (id(asyncio.get_running_loop()), key)
+        task = self._inflight.get(flight_key)
+        if task is not None and not task.done():
+            self.shared += 1
+            logger.debug(f"{self.name} single-flight: sharing in-flight request, hit rate {self.hit_rate:.1%}")
+        else:
+            task = asyncio.ensure_future(fn())
+            self._inflight[flight_key] = task
+            task.add_done_callback(lambda t: self._forget(flight_key, t))
+        return await asyncio.shield(task)
+
+    def _forget(self, flight_key: tuple, task: asyncio.Task):
+        if self._inflight.get(flight_key) is task:
+            del self._inflight[flight_key]
+        if not task.cancelled():
+            task.exception()  # mark retrieved, every waiter already got it re-raised
+
+    def reset_stats(self):
+        self.calls = 0
+        self.shared = 0
+
+
+llm_single_flight = SingleFlight("LLM")
+llm_single_flight.enabled = bool(CONFIG.llm_single_flight)
@@ -0,0 +1,159 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# @Desc   : streamed LLM output as async iterators of deltas, fanned out to pluggable sinks
+
+import asyncio
+import sys
+import time
+from dataclasses import dataclass
+from typing import AsyncIterator, Callable, Iterable, Optional, TextIO
+
+from metagpt.config import CONFIG
+from metagpt.logs import logger
+
+
+@dataclass
+class StreamDelta:
+    """One piece of streamed LLM output"""
+
+    content: str
+    index: int  # position of the delta in the stream, from 0
+    elapsed: float  # seconds since the request started
+    time_to_first_token: Optional[float]  # seconds until the first delta of this stream arrived
+
+
+class StreamSink:
+    """Consumer of streamed deltas; sinks are fed from their own task, so a slow sink only slows the
+    stream down once its queue is full (backpressure) and never blocks other sinks"""
+
+    async def send(self, delta: StreamDelta):
+        raise NotImplementedError
+
+    async def close(self):
+        """Called once the stream has ended"""
+
+
+class StdoutSink(StreamSink):
+    """Print deltas in place, the historical behaviour of streamed `aask`"""
+
+    def __init__(self, stream: Optional[TextIO] = None):
+        self.stream = stream
+
+    async def send(self, delta: StreamDelta):
+        (self.stream or sys.stdout).write(delta.content)
+
+    async def close(self):
+        stream = self.stream or sys.stdout
+        stream.write("\n")
+        stream.flush()
+
+
+class LineSink(StreamSink):
+    """Buffer deltas into whole lines for line-oriented consumers, e.g. a log or a websocket"""
+
+    def __init__(self, write_line: Callable[[str], None]):
+        self.write_line = write_line
+        self._buffers: dict[asyncio.Task, str] = {}  # a sink is fed from one task per stream
+
+    async def send(self, delta: StreamDelta):
+        task = asyncio.current_task()
+        *lines, self._buffers[task] = (self._buffers.get(task, "") + delta.content).split("\n")
+        for line in lines:
+            self.write_line(line)
+
+    async def close(self):
+        rest = self._buffers.pop(asyncio.current_task(), "")
+        if rest:
+            self.write_line(rest)
+
+
+class CallbackSink(StreamSink):
+    """Forward every delta to a plain or async callback"""
+
+    def __init__(self, callback: Callable[[StreamDelta], object]):
+        self.callback = callback
+
+    async def send(self, delta: StreamDelta):
+        ret = self.callback(delta)
+        if asyncio.iscoroutine(ret):
+            await ret
+
+
+_default_sinks: list[StreamSink] = [StdoutSink()] if CONFIG.llm_stream_stdout else []
+
+
+def default_sinks() -> list[StreamSink]:
+    return list(_default_sinks)
+
+
+def add_stream_sink(sink: StreamSink):
+    """Subscribe a sink to every streamed LLM response of the process"""
+    if sink not in _default_sinks:
+        _default_sinks.append(sink)
+
+
+def remove_stream_sink(sink: StreamSink):
+    if sink in _default_sinks:
+        _default_sinks.remove(sink)
+
+
+async def stream_deltas(chunks: AsyncIterator[str]) -> AsyncIterator[StreamDelta]:
+    """Wrap raw text chunks with their timing"""
+    start = time.monotonic()
+    first_token = None
+    index = 0
+    async for content in chunks:
+        if not content:
+            continue
+        elapsed = time.monotonic() - start
+        if first_token is None:
+            first_token = elapsed
+            logger.debug(f"Time to first token: {first_token:.2f}s")
+        yield StreamDelta(content=content, index=index, elapsed=elapsed, time_to_first_token=first_token)
+        index += 1
+
+
+class StreamFanout:
+    """Deliver deltas to several sinks through bounded queues"""
+
+    def __init__(self, sinks: Iterable[StreamSink], maxsize: int = 64):
+        self._queues = [(sink, asyncio.Queue(maxsize=maxsize)) for sink in sinks]
+        self._tasks = []
+
+    async def __aenter__(self) -> "StreamFanout":
+        self._tasks = [asyncio.ensure_future(self._consume(sink, queue)) for sink, queue in self._queues]
+        return self
+
+    async def publish(self, delta: StreamDelta):
+        for _, queue in self._queues:
+            await queue.put(delta)
+
+    async def __aexit__(self, exc_type, exc, tb):
+        for _, queue in self._queues:
+            await queue.put(None)
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+
+    @staticmethod
+    async def _consume(sink: StreamSink, queue: asyncio.Queue):
+        failed = False
+        while (delta := await queue.get()) is not None:
+            if failed:
+                continue  # keep draining, so that a broken sink never blocks the stream
+            try:
+                await sink.send(delta)
+            except Exception as e:
+                failed = True
+                logger.error(f"Stream sink {type(sink).__name__} failed and is detached: {e}")
+        if not failed:
+            await sink.close()
+
+
+async def publish_stream(chunks: AsyncIterator[str], sinks: Optional[Iterable[StreamSink]] = None) -> str:
+    """Feed a stream of text chunks to `sinks` (the default sinks when None) and return the full text"""
+    sinks = default_sinks() if sinks is None else sinks
+    collected = []
+    async with StreamFanout(sinks) as fanout:
+        async for delta in stream_deltas(chunks):
+            collected.append(delta.content)
+            await fanout.publish(delta)
+    return "".join(collected)
@@ -4,6 +4,7 @@
 
 from enum import Enum
 import json
+from typing import AsyncIterator
 from tenacity import (
     after_log,
     retry,
@@ -20,6 +21,7 @@ from metagpt.config import CONFIG
 from metagpt.logs import logger
 from metagpt.provider.base_gpt_api import BaseGPTAPI
 from metagpt.provider.openai_api import CostManager, log_and_reraise
+from metagpt.provider.streaming import publish_stream
 from metagpt.provider.zhipuai.zhipu_model_api import ZhiPuModelAPI
 
 
@@ -89,18 +91,18 @@ class ZhiPuAIGPTAPI(BaseGPTAPI):
         return await self._achat_completion(messages)
 
     async def _achat_completion_stream(self, messages: list[dict]) -> str:
+        return await publish_stream(self._astream(messages))
+
+    async def _astream(self, messages: list[dict]) -> AsyncIterator[str]:
         response = await self.llm.asse_invoke(**self._const_kwargs(messages))
-        collected_content = []
         usage = {}
         async for event in response.async_events():
             if event.event == ZhiPuEvent.ADD.value:
-                content = event.data
-                collected_content.append(content)
-                print(content, end="")
+                yield event.data
             elif event.event == ZhiPuEvent.ERROR.value or event.event == ZhiPuEvent.INTERRUPTED.value:
                 content = event.data
-                logger.error(f"event error: {content}", end="")
-                collected_content.append([content])
+                logger.error(f"event error: {content}")
+                yield content
             elif event.event == ZhiPuEvent.FINISH.value:
                 """
                 event.meta
@@ -118,11 +120,9 @@ class ZhiPuAIGPTAPI(BaseGPTAPI):
                 meta = json.loads(event.meta)
                 usage = meta.get("usage")
             else:
-                print(f"zhipuapi else event: {event.data}", end="")
+                logger.warning(f"zhipuapi else event: {event.data}")
 
         self._update_costs(usage)
-        full_content = "".join(collected_content)
-        return full_content
 
     @retry(
         stop=stop_after_attempt(3),
@@ -132,7 +132,7 @@ class Engineer(Role):
 
     def recv(self, message: Message) -> None:
         self._rc.memory.add(message)
-        if message in self._rc.important_memory:
+        if message.cause_by in self._rc.watch:  # it is in memory now, so it is important iff it is watched
             self.todos = self.parse_tasks(message)
 
     async def _act_mp(self) -> Message:
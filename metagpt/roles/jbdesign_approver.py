@@ -49,20 +49,29 @@ class JBDesignApprover(Role):
         self.autoapproval_msg = "AUTO-APPROVE: Design"
         self.approval_found = False
 
+    def dump_state(self) -> dict:
+        return {**super().dump_state(), "approval_found": self.approval_found}
+
+    def load_state(self, state: dict):
+        super().load_state(state)
+        self.approval_found = state["approval_found"]
+        if self.approval_found:
+            self._actions[0].set_autoapproval()
+
     async def _observe(self) -> int:
         """Override to listen for Management Directives to set Auto-Approval but take no response"""
         if not self._rc.env:
             return 0
-        env_msgs = self._rc.env.memory.get()
+        env_msgs = self._new_env_messages()
 
         if not self.approval_found:
-            autoapprovals = self._rc.env.memory.get_by_actions([ManagementAction])
+            autoapprovals = [msg for msg in env_msgs if msg.cause_by == ManagementAction]
             for msg in autoapprovals:
                 if self.autoapproval_msg in msg.content:
                     self._actions[0].set_autoapproval()
                     self.approval_found = True
 
-        observed = self._rc.env.memory.get_by_actions(self._rc.watch)
+        observed = [i for i in env_msgs if i.cause_by in self._rc.watch]
         
         self._rc.news = self._rc.memory.find_news(observed)  # find news (previously unseen messages) from observed messages
 
@@ -128,9 +128,16 @@ class JBEngineer(Role):
         file.write_text(code)
         return file
 
+    def dump_state(self) -> dict:
+        return {**super().dump_state(), "todos": list(self.todos)}
+
+    def load_state(self, state: dict):
+        super().load_state(state)
+        self.todos = list(state["todos"])
+
     def recv(self, message: Message) -> None:
         self._rc.memory.add(message)
-        if message in self._rc.important_memory:
+        if message.cause_by in self._rc.watch:  # it is in memory now, so it is important iff it is watched
             self.todos = self.parse_tasks(message)
 
     async def _act_mp(self) -> Message:
@@ -172,7 +179,7 @@ class JBEngineer(Role):
 
         logger.info(f"Done {self.get_workspace()} generating.")
         msg = Message(
-            content=MSG_SEP.join(code_msg_all), role=self.profile, cause_by=type(self._rc.todo), send_to="JBQaEngineer"
+            content=MSG_SEP.join(code_msg_all), role=self.profile, cause_by=type(self._rc.todo), send_to="QaEngineer"
         )
         return msg
 
@@ -213,7 +220,7 @@ class JBEngineer(Role):
 
         logger.info(f"Done {self.get_workspace()} generating.")
         msg = Message(
-            content=MSG_SEP.join(code_msg_all), role=self.profile, cause_by=type(self._rc.todo), send_to="JBQaEngineer"
+            content=MSG_SEP.join(code_msg_all), role=self.profile, cause_by=type(self._rc.todo), send_to="QaEngineer"
         )
         return msg
 
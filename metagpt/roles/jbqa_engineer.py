@@ -156,6 +156,13 @@ class JBQaEngineer(Role):
             )
             self._publish_message(msg)
 
+    def dump_state(self) -> dict:
+        return {**super().dump_state(), "test_round": self.test_round}
+
+    def load_state(self, state: dict):
+        super().load_state(state)
+        self.test_round = state["test_round"]
+
     async def _observe(self) -> int:
         await super()._observe()
         self._rc.news = [
@@ -7,7 +7,8 @@
 """
 from __future__ import annotations
 
-from typing import Iterable, Type, Union
+import copy
+from typing import Iterable, Optional, Type, Union
 from enum import Enum
 
 from pydantic import BaseModel, Field
@@ -19,6 +20,7 @@ from metagpt.actions import Action, ActionOutput
 from metagpt.llm import LLM, HumanProvider
 from metagpt.logs import logger
 from metagpt.memory import Memory, LongTermMemory
+from metagpt.provider.base_gpt_api import current_action
 from metagpt.schema import Message
 
 PREFIX_TEMPLATE = """You are a {profile}, named {name}, your goal is {goal}, and the constraint is {constraints}. """
@@ -84,6 +86,8 @@ class RoleContext(BaseModel):
     todo: Action = Field(default=None)
     watch: set[Type[Action]] = Field(default_factory=set)
     news: list[Type[Message]] = Field(default=[])
+    env_cursor: Optional[tuple[int, int]] = None  # how far the environment memory has been observed, see `Memory.since`
+    memory_generation: int = 0  # generation of `memory` when env_cursor was taken
     react_mode: RoleReactMode = RoleReactMode.REACT # see `Role._set_react_mode` for definitions of the following two attributes
     max_react_loop: int = 1
 
@@ -94,6 +98,8 @@ class RoleContext(BaseModel):
         if hasattr(CONFIG, "long_term_memory") and CONFIG.long_term_memory:
             self.long_term_memory.recover_memory(role_id, self)
             self.memory = self.long_term_memory  # use memory to act as long_term_memory for unify operation
+            if self.env:
+                self.memory.bind(self.env.store)
 
     @property
     def important_memory(self) -> list[Message]:
@@ -161,6 +167,8 @@ class Role:
         self._rc.watch.update(actions)
         # check RoleContext after adding watch actions
         self._rc.check(self._role_id)
+        if self._rc.env:
+            self._rc.env.subscribe(self)
 
     def _set_state(self, state: int):
         """Update the current state."""
@@ -168,9 +176,27 @@ class Role:
         logger.debug(self._actions)
         self._rc.todo = self._actions[self._rc.state] if state >= 0 else None
 
+    def dump_state(self) -> dict:
+        """Runtime state beyond the memory, for a checkpoint. Subclasses add their own attributes"""
+        return {"state": self._rc.state}
+
+    def load_state(self, state: dict):
+        """Restore what `dump_state` returned"""
+        self._set_state(state["state"])
+
+    def fork(self) -> "Role":
+        """A copy with its own memory and state, to run apart from this role's environment. Actions are shared"""
+        forked = copy.copy(self)
+        forked._rc = RoleContext(watch=set(self._rc.watch), react_mode=self._rc.react_mode,
+                                 max_react_loop=self._rc.max_react_loop)
+        forked._rc.memory.add_batch(self._rc.memory.get())
+        forked.load_state(self.dump_state())
+        return forked
+
     def set_env(self, env: 'Environment'):
         """Set the environment in which the role works. The role can talk to the environment and can also receive messages by observing."""
         self._rc.env = env
+        self._rc.memory.bind(env.store)  # share the environment's message instances rather than holding copies
 
     @property
     def profile(self):
@@ -185,7 +211,11 @@ class Role:
 
     @retry(stop=stop_after_attempt(3), wait=wait_random_exponential(min=30, max=180))
     async def _get_next_state(self, prompt):
-        return await self._llm.aask(prompt)
+        token = current_action.set(type(self).__name__)
+        try:
+            return await self._llm.aask(prompt)
+        finally:
+            current_action.reset(token)
     
     async def _think(self) -> None:
         """Think about what to do and decide on the next action"""
@@ -233,10 +263,10 @@ class Role:
         """Observe from the environment, obtain important information, and add it to memory"""
         if not self._rc.env:
             return 0
-        env_msgs = self._rc.env.memory.get()
+        env_msgs = self._new_env_messages()
+
+        observed = [i for i in env_msgs if i.cause_by in self._rc.watch]
 
-        observed = self._rc.env.memory.get_by_actions(self._rc.watch)
-        
         self._rc.news = self._rc.memory.find_news(observed)  # find news (previously unseen messages) from observed messages
 
         for i in env_msgs:
@@ -247,6 +277,14 @@ class Role:
             logger.debug(f'{self._setting} observed: {news_text}')
         return len(self._rc.news)
 
+    def _new_env_messages(self) -> Iterable[Message]:
+        """Messages published to the environment since the last observe, or all of them once this role's memory was
+        cleared, so that the cost of observing follows the new traffic rather than the whole history"""
+        if self._rc.memory_generation != self._rc.memory.generation:
+            self._rc.env_cursor, self._rc.memory_generation = None, self._rc.memory.generation
+        env_msgs, self._rc.env_cursor = self._rc.env.memory.since(self._rc.env_cursor)
+        return env_msgs
+
     def _publish_message(self, msg):
         """If the role belongs to env, then the role's messages will be broadcast to env"""
         if not self._rc.env:
@@ -299,9 +337,7 @@ class Role:
         """add message to history."""
         # self._history += f"\n{message}"
         # self._context = self._history
-        if message in self._rc.memory.get():
-            return
-        self._rc.memory.add(message)
+        self._rc.memory.add(message)  # dedupes by message id
 
     async def handle(self, message: Message) -> Message:
         """Receive information and reply with actions"""
@@ -7,12 +7,30 @@
 """
 from __future__ import annotations
 
+import hashlib
+import json
 from dataclasses import dataclass, field
+from functools import cached_property
 from typing import Type, TypedDict
 
 from pydantic import BaseModel
 
 from metagpt.logs import logger
+from metagpt.utils.blob_store import BlobRef, content_digest, offload
+
+
+class _Content:
+    """Descriptor of `Message.content`: a body over MESSAGE_BLOB_THRESHOLD lives in the blob store and the message
+    only holds its reference, pickles included. The body is loaded when the content is read"""
+
+    def __get__(self, obj, objtype=None):
+        if obj is None:
+            raise AttributeError("content")  # no default, the field stays required
+        content = obj.__dict__["_content"]
+        return content.load() if isinstance(content, BlobRef) else content
+
+    def __set__(self, obj, value):
+        obj.__dict__["_content"] = offload(value)
 
 
 class RawMessage(TypedDict):
@@ -20,10 +38,14 @@ class RawMessage(TypedDict):
     role: str
 
 
-@dataclass
+@dataclass(eq=False)
 class Message:
-    """list[<role>: <content>]"""
-    content: str
+    """list[<role>: <content>]
+
+    A message is treated as immutable once it is published: equality and hashing go through `id`, a hash of its
+    content computed on first use, so that memories can index and dedupe messages in O(1).
+    """
+    content: str = _Content()
     instruct_content: BaseModel = field(default=None)
     role: str = field(default='user')  # system / user / assistant
     cause_by: Type["Action"] = field(default="")
@@ -38,6 +60,42 @@ class Message:
     def __repr__(self):
         return self.__str__()
 
+    @property
+    def blob(self) -> BlobRef:
+        """Reference of the offloaded body, None when the content is held by the message"""
+        content = self.__dict__["_content"]
+        return content if isinstance(content, BlobRef) else None
+
+    @property
+    def content_digest(self) -> str:
+        blob = self.blob
+        return blob.digest if blob else content_digest(self.content)
+
+    @cached_property
+    def id(self) -> str:
+        """Content hash, the same for equal messages whether instruct_content is a model or its deconstructed dict"""
+        ic = self.instruct_content
+        if isinstance(ic, BaseModel):
+            ic = ic.dict()
+        elif isinstance(ic, dict) and "value" in ic:
+            ic = ic["value"]  # deconstructed by metagpt.utils.serialize
+        cause_by = self.cause_by
+        if isinstance(cause_by, type):
+            cause_by = f"{cause_by.__module__}.{cause_by.__qualname__}"
+        fields = [self.role, self.content_digest, cause_by, self.sent_from, self.send_to, self.restricted_to, ic]
+        text = json.dumps(fields, sort_keys=True, ensure_ascii=False, default=str)
+        return hashlib.blake2b(text.encode("utf-8"), digest_size=16).hexdigest()
+
+    def __eq__(self, other):
+        if self is other:
+            return True
+        if other.__class__ is not self.__class__:
+            return NotImplemented
+        return self.id == other.id
+
+    def __hash__(self):
+        return hash(self.id)
+
     def to_dict(self) -> dict:
         return {
             "role": self.role,
@@ -45,7 +103,7 @@ class Message:
         }
 
 
-@dataclass
+@dataclass(eq=False)
 class UserMessage(Message):
     """便于支持OpenAI的消息
        Facilitate support for OpenAI messages
@@ -54,7 +112,7 @@ class UserMessage(Message):
         super().__init__(content, 'user')
 
 
-@dataclass
+@dataclass(eq=False)
 class SystemMessage(Message):
     """便于支持OpenAI的消息
        Facilitate support for OpenAI messages
@@ -63,7 +121,7 @@ class SystemMessage(Message):
         super().__init__(content, 'system')
 
 
-@dataclass
+@dataclass(eq=False)
 class AIMessage(Message):
     """便于支持OpenAI的消息
        Facilitate support for OpenAI messages
@@ -4,6 +4,7 @@ from __future__ import annotations
 
 import asyncio
 import json
+import threading
 from concurrent import futures
 from typing import Optional
 from urllib.parse import urlparse
@@ -23,6 +24,9 @@ except ImportError:
         "You can install it by running the command: `pip install -e.[search-google]`"
     )
 
+# httplib2 connections are not thread safe, so each executor thread keeps its own client and keep-alive connection
+_thread_local = threading.local()
+
 
 class GoogleAPIWrapper(BaseModel):
     google_api_key: Optional[str] = None
@@ -59,6 +63,14 @@ class GoogleAPIWrapper(BaseModel):
 
     @property
     def google_api_client(self):
+        """The search client of the current thread, built once instead of on every query"""
+        clients = _thread_local.__dict__.setdefault("clients", {})
+        key = (self.google_api_key, CONFIG.global_proxy)
+        if key not in clients:
+            clients[key] = self._build_client()
+        return clients[key]
+
+    def _build_client(self):
         build_kwargs = {"developerKey": self.google_api_key}
         if CONFIG.global_proxy:
             parse_result = urlparse(CONFIG.global_proxy)
@@ -97,7 +109,7 @@ class GoogleAPIWrapper(BaseModel):
         """
         loop = self.loop or asyncio.get_event_loop()
         future = loop.run_in_executor(
-            self.executor, self.google_api_client.list(q=query, num=max_results, cx=self.google_cse_id).execute
+            self.executor, lambda: self.google_api_client.list(q=query, num=max_results, cx=self.google_cse_id).execute()
         )
         try:
             result = await future
@@ -11,6 +11,7 @@ import aiohttp
 from pydantic import BaseModel, Field, validator
 
 from metagpt.config import CONFIG
+from metagpt.utils.http_session import get_session
 
 
 class SerpAPIWrapper(BaseModel):
@@ -57,13 +58,9 @@ class SerpAPIWrapper(BaseModel):
             return url, params
 
         url, params = construct_url_and_params()
-        if not self.aiosession:
-            async with aiohttp.ClientSession() as session:
-                async with session.get(url, params=params) as response:
-                    res = await response.json()
-        else:
-            async with self.aiosession.get(url, params=params) as response:
-                res = await response.json()
+        session = self.aiosession or get_session()
+        async with session.get(url, params=params) as response:
+            res = await response.json()
 
         return res
 
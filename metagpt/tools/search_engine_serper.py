@@ -12,6 +12,7 @@ import aiohttp
 from pydantic import BaseModel, Field, validator
 
 from metagpt.config import CONFIG
+from metagpt.utils.http_session import get_session
 
 
 class SerperWrapper(BaseModel):
@@ -53,13 +54,9 @@ class SerperWrapper(BaseModel):
             return url, payloads, headers
 
         url, payloads, headers = construct_url_and_payload_and_headers()
-        if not self.aiosession:
-            async with aiohttp.ClientSession() as session:
-                async with session.post(url, data=payloads, headers=headers) as response:
-                    res = await response.json()
-        else:
-            async with self.aiosession.get.post(url, data=payloads, headers=headers) as response:
-                res = await response.json()
+        session = self.aiosession or get_session()
+        async with session.post(url, data=payloads, headers=headers) as response:
+            res = await response.json()
 
         return res
 
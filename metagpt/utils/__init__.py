@@ -10,6 +10,7 @@ from metagpt.utils.read_document import read_docx
 from metagpt.utils.singleton import Singleton
 from metagpt.utils.token_counter import (
     TOKEN_COSTS,
+    count_many,
     count_message_tokens,
     count_string_tokens,
 )
@@ -19,6 +20,7 @@ __all__ = [
     "read_docx",
     "Singleton",
     "TOKEN_COSTS",
+    "count_many",
     "count_message_tokens",
     "count_string_tokens",
 ]
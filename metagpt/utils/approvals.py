@@ -0,0 +1,52 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# @Desc   : approvals awaited by runs in their event loop and given from any thread, e.g. by an API call
+
+import asyncio
+import threading
+from typing import Any, Hashable
+
+
+def _set_result(future: asyncio.Future, response: Any):
+    if not future.done():  # timed out or cancelled meanwhile
+        future.set_result(response)
+
+
+class Approvals:
+    """The pending approval requests, at most one per key (e.g. the id of the run asking).
+
+    The waiting coroutine suspends on the future returned by `request` instead of polling, and resumes as soon as
+    `resolve` is called. Cancelling the future, e.g. through `asyncio.wait_for`, withdraws the request.
+    """
+
+    def __init__(self):
+        self._pending: dict[Hashable, asyncio.Future] = {}
+        self._lock = threading.Lock()
+
+    def request(self, key: Hashable) -> asyncio.Future:
+        """A future of the response to `key`, to await in the running loop. Supersedes a pending request of `key`"""
+        future = asyncio.get_running_loop().create_future()
+        with self._lock:
+            previous, self._pending[key] = self._pending.get(key), future
+        if previous is not None:
+            previous.cancel()
+        future.add_done_callback(lambda f: self._forget(key, f))
+        return future
+
+    def _forget(self, key: Hashable, future: asyncio.Future):
+        with self._lock:
+            if self._pending.get(key) is future:
+                del self._pending[key]
+
+    def waiting(self, key: Hashable) -> bool:
+        with self._lock:
+            return key in self._pending
+
+    def resolve(self, key: Hashable, response: Any) -> bool:
+        """Give the response to the request of `key`, from any thread. False if there is no such request"""
+        with self._lock:
+            future = self._pending.pop(key, None)
+        if future is None:
+            return False
+        future.get_loop().call_soon_threadsafe(_set_result, future, response)
+        return True
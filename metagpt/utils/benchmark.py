@@ -0,0 +1,243 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# @Desc   : time breakdown of a pipeline run by stage and by category (llm, parsing, memory, ...), with baselines
+
+import asyncio
+import builtins
+import functools
+import inspect
+import json
+import os
+import resource
+import shutil
+import subprocess
+import sys
+import time
+from collections import defaultdict
+from contextvars import ContextVar
+from pathlib import Path
+from typing import Callable, Optional
+
+from metagpt.logs import logger
+
+FRAMEWORK = "framework"  # wall time not spent in any probed category
+
+
+class _Frame:
+    __slots__ = ("category", "children")
+
+    def __init__(self, category: str):
+        self.category = category
+        self.children = 0.0
+
+
+_active_frame: ContextVar[Optional[_Frame]] = ContextVar("active_benchmark_frame", default=None)
+
+
+def peak_rss_mb() -> float:
+    """Peak resident set size of the process so far"""
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / 1024 / 1024 if sys.platform == "darwin" else peak / 1024  # bytes on macOS, KiB elsewhere
+
+
+class Profiler:
+    """Attributes wall time of a run to stages and to probed categories of work.
+
+    A probe wraps a function so that the time spent in it is booked to a category. Time is exclusive: a probed call
+    made inside another probed call of a different category (e.g. file I/O while parsing) is subtracted from the
+    outer one, and re-entrant calls of the same category are booked once. Whatever is not covered by a probe is
+    reported as "framework" time.
+
+        profiler = Profiler()
+        profiler.probe(OutputParser, "parse_data_with_mapping", "parsing")
+        with profiler:
+            profiler.start_stage("Requirements")
+            ...
+        profiler.report()
+    """
+
+    def __init__(self):
+        self._patches: list[tuple[object, str, object, bool]] = []
+        self._stage: Optional[str] = None
+        self._stage_start = 0.0
+        self._start = 0.0
+        self.stages: dict[str, dict] = {}
+        self.times: dict[str, dict[str, float]] = defaultdict(lambda: defaultdict(float))
+        self.calls: dict[str, dict[str, int]] = defaultdict(lambda: defaultdict(int))
+        self.wall = 0.0
+
+    def _record(self, category: str, elapsed: float):
+        stage = self._stage or "setup"
+        self.times[stage][category] += elapsed
+        self.calls[stage][category] += 1
+
+    def _wrap(self, fn: Callable, category: str) -> Callable:
+        profiler = self
+
+        def enter():
+            parent = _active_frame.get()
+            if parent is not None and parent.category == category:
+                return parent, None, None
+            frame = _Frame(category)
+            return parent, frame, _active_frame.set(frame)
+
+        def leave(parent, frame, token, start):
+            elapsed = time.perf_counter() - start
+            _active_frame.reset(token)
+            profiler._record(category, max(elapsed - frame.children, 0.0))
+            if parent is not None:
+                parent.children += elapsed
+
+        if inspect.iscoroutinefunction(fn):
+
+            @functools.wraps(fn)
+            async def async_wrapper(*args, **kwargs):
+                parent, frame, token = enter()
+                if frame is None:
+                    return await fn(*args, **kwargs)
+                start = time.perf_counter()
+                try:
+                    return await fn(*args, **kwargs)
+                finally:
+                    leave(parent, frame, token, start)
+
+            return async_wrapper
+
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            parent, frame, token = enter()
+            if frame is None:
+                return fn(*args, **kwargs)
+            start = time.perf_counter()
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                leave(parent, frame, token, start)
+
+        return wrapper
+
+    def probe(self, owner, name: str, category: str):
+        """Book the time spent in `owner.name` (a module function or a class attribute) to `category`"""
+        original = inspect.getattr_static(owner, name)
+        if isinstance(original, (classmethod, staticmethod)):
+            patched = type(original)(self._wrap(original.__func__, category))
+        else:
+            patched = self._wrap(original, category)
+        self._patches.append((owner, name, original, name in vars(owner)))
+        setattr(owner, name, patched)
+
+    def unpatch(self):
+        while self._patches:
+            owner, name, original, owned = self._patches.pop()
+            if owned:
+                setattr(owner, name, original)
+            else:  # inherited, drop the override so that the base class is seen again
+                delattr(owner, name)
+
+    def start_stage(self, stage: str):
+        """Close the running stage and start timing `stage`"""
+        now = time.perf_counter()
+        self._close_stage(now)
+        self._stage, self._stage_start = stage, now
+
+    def _close_stage(self, now: float):
+        if self._stage is None:
+            return
+        entry = self.stages.setdefault(self._stage, {"wall": 0.0})
+        entry["wall"] += now - self._stage_start
+        entry["peak_rss_mb"] = peak_rss_mb()
+
+    def __enter__(self):
+        self._start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        now = time.perf_counter()
+        self._close_stage(now)
+        self._stage = None
+        self.wall = now - self._start
+        self.unpatch()
+
+    def report(self) -> dict:
+        """Seconds per stage and category, "total" sums the stages; categories include the uncovered framework time"""
+        stages = {}
+        for stage, entry in self.stages.items():
+            categories = {k: round(v, 4) for k, v in sorted(self.times[stage].items())}
+            categories[FRAMEWORK] = round(max(entry["wall"] - sum(self.times[stage].values()), 0.0), 4)
+            stages[stage] = {
+                "wall": round(entry["wall"], 4),
+                "categories": categories,
+                "calls": dict(sorted(self.calls[stage].items())),
+                "peak_rss_mb": round(entry["peak_rss_mb"], 1),
+            }
+        total = defaultdict(float)
+        for stage in stages.values():
+            for category, seconds in stage["categories"].items():
+                total[category] += seconds
+        return {
+            "wall": round(self.wall, 4),
+            "stages": stages,
+            "total": {k: round(v, 4) for k, v in sorted(total.items())},
+            "peak_rss_mb": round(peak_rss_mb(), 1),
+        }
+
+
+def probe_io(profiler: Profiler):
+    """Probe file I/O and subprocesses, which are not owned by any module of the framework"""
+    for name in ["read_text", "write_text", "read_bytes", "write_bytes", "mkdir", "unlink"]:
+        profiler.probe(Path, name, "file_io")
+    profiler.probe(shutil, "rmtree", "file_io")
+    profiler.probe(builtins, "open", "file_io")  # opening only, reads and writes on the file object are not seen
+    for name in ["communicate", "wait"]:
+        profiler.probe(subprocess.Popen, name, "subprocess")
+        profiler.probe(asyncio.subprocess.Process, name, "subprocess")
+    profiler.probe(subprocess, "run", "subprocess")
+    profiler.probe(os, "system", "subprocess")
+
+
+def median_report(reports: list[dict]) -> dict:
+    """Merge the reports of repeated runs by taking the median of every number"""
+    first = reports[0]
+    if isinstance(first, dict):
+        keys = [k for k in first if all(k in r for r in reports)]
+        return {k: median_report([r[k] for r in reports]) for k in keys}
+    values = sorted(reports)
+    return values[len(values) // 2]
+
+
+def _flatten(report: dict, prefix: str = "") -> dict[str, float]:
+    flat = {}
+    for key, value in report.items():
+        if isinstance(value, dict):
+            flat.update(_flatten(value, f"{prefix}{key}."))
+        elif isinstance(value, (int, float)):
+            flat[f"{prefix}{key}"] = value
+    return flat
+
+
+def compare_reports(current: dict, baseline: dict, tolerance: float = 0.2, min_delta: float = 0.05) -> list[str]:
+    """Metrics of `current` more than `tolerance` (relative) and `min_delta` (absolute) above the baseline.
+
+    Call counts are compared too, an unexpected change in the number of LLM or memory calls usually explains a
+    change in time.
+    """
+    regressions = []
+    now, before = _flatten(current), _flatten(baseline)
+    for key, old in before.items():
+        new = now.get(key)
+        if new is None:
+            regressions.append(f"{key}: missing, baseline {old}")
+        elif new > old * (1 + tolerance) and new - old > (0 if "calls" in key.split(".") else min_delta):
+            regressions.append(f"{key}: {new} vs baseline {old} (+{(new - old) / old if old else float('inf'):.0%})")
+    return regressions
+
+
+def save_report(report: dict, path: Path):
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_text(json.dumps(report, indent=2), encoding="utf-8")
+    logger.info(f"Benchmark report saved to {path}")
+
+
+def load_report(path: Path) -> dict:
+    return json.loads(Path(path).read_text(encoding="utf-8"))
@@ -0,0 +1,149 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# @Desc   : content-addressed on-disk store for large message bodies, loaded lazily
+
+import hashlib
+import os
+import re
+import tempfile
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Optional, Union
+
+from metagpt.logs import logger
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+ZSTD_SUFFIX = ".zst"
+
+
+def content_digest(text: str) -> str:
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+@dataclass(frozen=True)
+class BlobRef:
+    """What a message keeps of an offloaded body: the address of the body and where to load it from"""
+
+    digest: str
+    size: int  # characters
+    root: str  # where it was written, only read when the configured store does not have the body
+
+    def load(self) -> str:
+        """The body from the configured store, so that a moved or shared blob directory still resolves"""
+        from metagpt.config import CONFIG
+
+        store = open_blob_store(CONFIG.message_blob_path)
+        try:
+            return store.get(self.digest)
+        except FileNotFoundError:
+            if str(store.root) == self.root:
+                raise
+        return open_blob_store(self.root).get(self.digest)
+
+
+class BlobStore:
+    """Bodies stored once per sha256 under <root>/<2 hex>/<digest>[.zst], so identical payloads dedupe across
+    messages, rounds and runs. Files are written atomically and never change, any process can read them.
+    The most recently loaded bodies are kept in memory, up to `cache_size` of them.
+    """
+
+    def __init__(self, root: Union[str, Path], compression: str = "none", cache_size: int = 32):
+        assert compression in ("none", "zstd"), "compression must be none or zstd"
+        if compression == "zstd" and zstandard is None:
+            logger.warning("MESSAGE_BLOB_COMPRESSION is zstd but zstandard is not installed, storing uncompressed")
+            compression = "none"
+        self.root = Path(root)
+        self.compression = compression
+        self.cache_size = cache_size
+        self._cache: OrderedDict[str, str] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _path(self, digest: str) -> Path:
+        if not re.fullmatch(r"[0-9a-f]{64}", digest):  # digests come from API clients too
+            raise ValueError(f"Not a blob digest: {digest!r}")
+        return self.root / digest[:2] / digest
+
+    def _remember(self, digest: str, text: str):
+        with self._lock:
+            self._cache[digest] = text
+            self._cache.move_to_end(digest)
+            while len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+
+    def put(self, text: str) -> BlobRef:
+        digest = content_digest(text)
+        path = self._path(digest)
+        if not path.exists() and not path.with_suffix(ZSTD_SUFFIX).exists():
+            data = text.encode("utf-8")
+            if self.compression == "zstd":
+                data, path = zstandard.ZstdCompressor().compress(data), path.with_suffix(ZSTD_SUFFIX)
+            path.parent.mkdir(parents=True, exist_ok=True)
+            fd, tmp = tempfile.mkstemp(dir=path.parent)
+            with os.fdopen(fd, "wb") as f:
+                f.write(data)
+            os.replace(tmp, path)
+        self._remember(digest, text)
+        return BlobRef(digest=digest, size=len(text), root=str(self.root))
+
+    def get(self, digest: str) -> str:
+        with self._lock:
+            text = self._cache.get(digest)
+        if text is not None:
+            return text
+        path = self._path(digest)
+        if path.exists():
+            text = path.read_bytes().decode("utf-8")
+        elif path.with_suffix(ZSTD_SUFFIX).exists():
+            if zstandard is None:
+                raise RuntimeError(f"Blob {digest} is zstd compressed, install zstandard to read it")
+            text = zstandard.ZstdDecompressor().decompress(path.with_suffix(ZSTD_SUFFIX).read_bytes()).decode("utf-8")
+        else:
+            raise FileNotFoundError(f"Blob {digest} not found in {self.root}")
+        self._remember(digest, text)
+        return text
+
+    def __contains__(self, digest: str) -> bool:
+        path = self._path(digest)
+        return path.exists() or path.with_suffix(ZSTD_SUFFIX).exists()
+
+
+_blob_stores: dict[str, BlobStore] = {}
+_blob_stores_lock = threading.Lock()
+
+
+def open_blob_store(root: Union[str, Path]) -> BlobStore:
+    """The store at `root`, one instance per process so that its cache is shared"""
+    # metagpt.schema imports this module and must not need a configured key
+    from metagpt.config import CONFIG
+
+    root = str(root)
+    with _blob_stores_lock:
+        if root not in _blob_stores:
+            _blob_stores[root] = BlobStore(root, CONFIG.message_blob_compression, CONFIG.message_blob_cache_size)
+        return _blob_stores[root]
+
+
+def offload(content: str) -> Union[str, BlobRef]:
+    """A reference to `content` in the configured blob store if it is longer than MESSAGE_BLOB_THRESHOLD (0 keeps
+    every body in the message), otherwise `content` itself"""
+    from metagpt.config import CONFIG
+
+    threshold = CONFIG.message_blob_threshold
+    if not threshold or not isinstance(content, str) or len(content) < threshold:
+        return content
+    return open_blob_store(CONFIG.message_blob_path).put(content)
+
+
+def set_blob_store(store: Optional[BlobStore]):
+    """Register an explicitly configured store under its root, or forget all of them with None"""
+    with _blob_stores_lock:
+        if store is None:
+            _blob_stores.clear()
+        else:
+            _blob_stores[str(store.root)] = store
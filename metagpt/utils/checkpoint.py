@@ -0,0 +1,79 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# @Desc   : snapshot of the environment and role state between rounds, to resume a run where it stopped
+
+from typing import Iterator, Union
+
+from metagpt.environment import Environment
+from metagpt.memory import Memory
+from metagpt.schema import Message
+from metagpt.utils.serialize import deserialize_message, serialize_message
+
+CHECKPOINT_VERSION = 1
+
+# A role memory is a list of entries: [start, stop) ranges of environment messages, which is how most of it looks
+# since roles receive everything published, and the serialized messages that only the role holds.
+MemoryEntry = Union[list, bytes]
+
+
+def _memory_entries(memory: Memory, positions: dict[str, int]) -> list[MemoryEntry]:
+    entries = []
+    for message in memory.get():
+        position = positions.get(message.id)
+        if position is None:
+            entries.append(serialize_message(message))
+        elif entries and isinstance(entries[-1], list) and entries[-1][1] == position:
+            entries[-1][1] = position + 1
+        else:
+            entries.append([position, position + 1])
+    return entries
+
+
+def _memory_messages(entries: list[MemoryEntry], messages: list[Message]) -> Iterator[Message]:
+    for entry in entries:
+        if isinstance(entry, bytes):
+            yield deserialize_message(entry)
+        else:
+            yield from messages[entry[0] : entry[1]]
+
+
+def take_checkpoint(env: Environment, **extra) -> dict:
+    """State of `env` and its roles. The environment messages themselves are not included: they are the first
+    `messages` records of the event log, `last_id` tells whether a log still matches"""
+    messages = env.memory.get()
+    positions = {m.id: i for i, m in enumerate(messages)}
+    roles = {}
+    for profile, role in env.get_roles().items():
+        cursor, rc = role._rc.env_cursor, role._rc
+        observed = cursor is not None and cursor[0] == env.memory.generation
+        roles[profile] = {
+            "memory": _memory_entries(rc.memory, positions),
+            "cursor": cursor[1] if observed and rc.memory_generation == rc.memory.generation else None,
+            "state": role.dump_state(),
+        }
+    return {
+        "version": CHECKPOINT_VERSION,
+        "messages": len(messages),
+        "last_id": messages[-1].id if messages else None,
+        "pending": sorted(env.pending),
+        "roles": roles,
+        **extra,
+    }
+
+
+def restore_checkpoint(env: Environment, checkpoint: dict, messages: list[Message]):
+    """Put `env` and its roles back in the state of `checkpoint`, `messages` being the environment messages.
+    Roles missing from the checkpoint observe everything on their next run."""
+    env.memory.clear()
+    env.memory.add_batch(messages)
+    for profile, saved in checkpoint["roles"].items():
+        role = env.get_role(profile)
+        if role is None:
+            continue
+        rc = role._rc
+        rc.memory.clear()
+        rc.memory.add_batch(_memory_messages(saved["memory"], messages))
+        rc.memory_generation = rc.memory.generation
+        rc.env_cursor = None if saved["cursor"] is None else (env.memory.generation, saved["cursor"])
+        role.load_state(saved["state"])
+    env.wake(checkpoint["pending"])
@@ -0,0 +1,166 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# @Desc   : append-only, length-prefixed log of published messages, read back as a stream
+
+import ast
+import os
+import struct
+import tempfile
+import threading
+from pathlib import Path
+from typing import BinaryIO, Iterable, Iterator, Optional
+
+import fire
+
+from metagpt.logs import logger
+from metagpt.schema import Message
+from metagpt.utils.serialize import deserialize_message, serialize_message
+
+MAGIC = b"MGPTLOG"
+VERSION = 1
+HEADER = struct.Struct(">7sH")  # magic, format version
+LENGTH = struct.Struct(">I")  # bytes of the record that follows
+
+
+class EventLogError(Exception):
+    """The file is not an event log, or one of a version this code cannot read"""
+
+
+def read_header(f: BinaryIO) -> int:
+    """Check the header at the start of `f` and return the format version"""
+    raw = f.read(HEADER.size)
+    if len(raw) < HEADER.size:
+        raise EventLogError(f"{getattr(f, 'name', 'event log')} is too short to be an event log")
+    magic, version = HEADER.unpack(raw)
+    if magic != MAGIC:
+        raise EventLogError(f"{getattr(f, 'name', 'event log')} is not an event log, see migrate_history")
+    if version > VERSION:
+        raise EventLogError(f"Event log version {version} is newer than the supported {VERSION}")
+    return version
+
+
+def _records(f: BinaryIO) -> Iterator[tuple[int, bytes]]:
+    """Offsets and payloads of the complete records after the header, a torn last record ends the stream"""
+    while True:
+        offset = f.tell()
+        prefix = f.read(LENGTH.size)
+        if not prefix:
+            return
+        size = LENGTH.unpack(prefix)[0] if len(prefix) == LENGTH.size else -1
+        payload = f.read(size) if size >= 0 else b""
+        if len(payload) != size:
+            logger.warning(f"Event log {getattr(f, 'name', '')} ends with a torn record at byte {offset}, ignored")
+            return
+        yield offset, payload
+
+
+def read_events(path: Path) -> Iterator[Message]:
+    """Messages of the log in publication order, deserialized one at a time"""
+    with open(path, "rb") as f:
+        read_header(f)
+        for _, payload in _records(f):
+            yield deserialize_message(payload)
+
+
+class EventLog:
+    """Messages appended to a file as they are published, so that a crash loses at most the record being written.
+
+    The file starts with MAGIC and the format version, followed by one record per message: a 4 byte big-endian
+    length and the pickled, deconstructed message of metagpt.utils.serialize.
+    """
+
+    def __init__(self, path: Path, fsync: bool = False):
+        self.path = Path(path)
+        self.fsync = fsync
+        self._f: Optional[BinaryIO] = None
+        self._lock = threading.Lock()
+
+    def _open(self) -> BinaryIO:
+        if self._f is None:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            f = open(self.path, "r+b" if self.path.exists() else "w+b")
+            if f.seek(0, os.SEEK_END) == 0:
+                f.write(HEADER.pack(MAGIC, VERSION))
+            else:
+                # drop a record torn by a crash, or the next appends would be unreadable
+                f.seek(0)
+                read_header(f)
+                end = HEADER.size
+                for offset, payload in _records(f):
+                    end = offset + LENGTH.size + len(payload)
+                f.truncate(end)
+                f.seek(end)
+            self._f = f
+        return self._f
+
+    def _flush(self, f: BinaryIO):
+        f.flush()
+        if self.fsync:
+            os.fsync(f.fileno())
+
+    def append(self, message: Message):
+        payload = serialize_message(message)
+        with self._lock:
+            f = self._open()
+            f.write(LENGTH.pack(len(payload)) + payload)
+            self._flush(f)
+
+    def rewrite(self, messages: Iterable[Message]):
+        """Replace the log with `messages`, atomically"""
+        with self._lock:
+            self._close()
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            fd, tmp = tempfile.mkstemp(dir=self.path.parent)
+            with os.fdopen(fd, "wb") as f:
+                f.write(HEADER.pack(MAGIC, VERSION))
+                for message in messages:
+                    payload = serialize_message(message)
+                    f.write(LENGTH.pack(len(payload)) + payload)
+                self._flush(f)
+            os.replace(tmp, self.path)
+
+    def truncate(self, count: int):
+        """Keep the first `count` records only, to roll back to an earlier state"""
+        with self._lock:
+            self._close()
+            with open(self.path, "r+b") as f:
+                read_header(f)
+                end = HEADER.size
+                for i, (offset, payload) in enumerate(_records(f)):
+                    if i == count:
+                        break
+                    end = offset + LENGTH.size + len(payload)
+                f.truncate(end)
+
+    def _close(self):
+        if self._f is not None:
+            self._f.close()
+            self._f = None
+
+    def close(self):
+        with self._lock:
+            self._close()
+
+
+def read_legacy_history(path: Path) -> list[Message]:
+    """Messages of a history.pickle, the str() of a list of pickled messages written before the event log"""
+    return [deserialize_message(m) for m in ast.literal_eval(Path(path).read_text())]
+
+
+def migrate_history(legacy: str, output: str = "") -> Path:
+    """
+    Convert a history.pickle into an event log, by default history.log next to it.
+
+    Usage:
+    python -m metagpt.utils.event_log workspace/<user>/<product>/history.pickle
+    """
+    legacy = Path(legacy)
+    output = Path(output) if output else legacy.with_name("history.log")
+    messages = read_legacy_history(legacy)
+    EventLog(output).rewrite(messages)
+    logger.info(f"Migrated {len(messages)} messages from {legacy} to {output}")
+    return output
+
+
+if __name__ == "__main__":
+    fire.Fire(migrate_history)
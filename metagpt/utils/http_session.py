@@ -0,0 +1,78 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# @Desc   : process-wide, loop-aware registry of pooled aiohttp sessions shared by LLM providers and tools
+
+import asyncio
+import atexit
+import threading
+import weakref
+from typing import Callable
+
+import aiohttp
+
+from metagpt.config import CONFIG
+from metagpt.logs import logger
+
+_sessions: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, aiohttp.ClientSession]" = weakref.WeakKeyDictionary()
+_all_sessions: "weakref.WeakSet[aiohttp.ClientSession]" = weakref.WeakSet()
+_lock = threading.Lock()
+_trace_config_factories: list[Callable[[], aiohttp.TraceConfig]] = []
+
+
+def register_trace_config(factory: Callable[[], aiohttp.TraceConfig]):
+    """Add a trace hook to every session created from now on, e.g. to read rate limit headers"""
+    if factory not in _trace_config_factories:
+        _trace_config_factories.append(factory)
+
+
+def _new_session() -> aiohttp.ClientSession:
+    connector = aiohttp.TCPConnector(
+        limit=CONFIG.http_pool_limit,
+        limit_per_host=CONFIG.http_pool_limit_per_host,
+        ttl_dns_cache=CONFIG.http_dns_cache_ttl,
+        keepalive_timeout=CONFIG.http_keepalive_timeout,
+    )
+    return aiohttp.ClientSession(connector=connector, trace_configs=[factory() for factory in _trace_config_factories])
+
+
+def get_session() -> aiohttp.ClientSession:
+    """The shared session of the running event loop.
+
+    aiohttp sessions are bound to the loop they were created in, so each loop (e.g. the main loop and the loop of
+    a background thread) gets its own pool of keep-alive connections. Callers must not close it, see `close_sessions`.
+    """
+    loop = asyncio.get_running_loop()
+    with _lock:
+        session = _sessions.get(loop)
+        if session is None or session.closed:
+            session = _new_session()
+            _sessions[loop] = session
+            _all_sessions.add(session)
+    return session
+
+
+async def close_sessions():
+    """Close the shared session of the running loop, call it before the loop ends (e.g. at the end of `asyncio.run`)"""
+    with _lock:
+        session = _sessions.pop(asyncio.get_running_loop(), None)
+    if session is not None and not session.closed:
+        await session.close()
+
+
+@atexit.register
+def _close_leftover_sessions():
+    with _lock:
+        by_loop = list(_sessions.items())
+    for loop, session in by_loop:
+        if session.closed:
+            continue
+        if not loop.is_closed() and not loop.is_running():
+            loop.run_until_complete(session.close())
+        else:
+            # the loop is gone together with its sockets, drop the connector so that no warning is emitted
+            logger.debug("Detaching an http session whose event loop has already been closed")
+            session.detach()
+    registered = {id(session) for _, session in by_loop}
+    for session in list(_all_sessions):
+        if not session.closed and id(session) not in registered:
+            session.detach()  # replaced or left by a loop no longer registered, there is no loop to close it on
@@ -0,0 +1,119 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# @Desc   : bounded buffer of the latest log records, paged by sequence number by any number of readers
+
+import itertools
+import json
+import os
+import threading
+import time
+from collections import deque
+from dataclasses import asdict, dataclass
+from pathlib import Path
+from typing import Iterator, Optional
+
+
+@dataclass(frozen=True)
+class LogRecord:
+    seq: int
+    time: float
+    level: str
+    text: str
+    run_id: Optional[str] = None
+
+    def to_dict(self) -> dict:
+        return asdict(self)
+
+
+class LogRing:
+    """The last `capacity` log records, numbered from 1 in the order they were written.
+
+    Readers keep their own cursor, the seq of the last record they got, and page with `read(since_seq)`: nothing
+    is consumed, so several frontends can follow the same log independently. Older records fall off the ring, and
+    memory stays the same however long the process runs.
+
+    With `spill_path` every record is also appended to that file as a JSON line, and a reader behind the ring reads
+    from it instead (a scan of the file, for catching up rather than for following). The file is rotated to
+    `<spill_path>.1` at `spill_max_bytes`, so at most twice that is kept on disk. Safe to use from any thread.
+    """
+
+    def __init__(
+        self, capacity: int = 10000, spill_path: Optional[Path] = None, spill_max_bytes: int = 100 * 1024 * 1024
+    ):
+        self.capacity = capacity
+        self.spill_path = Path(spill_path) if spill_path else None
+        self.spill_max_bytes = spill_max_bytes
+        self._records: deque[LogRecord] = deque(maxlen=capacity)
+        self._seq = itertools.count(1)
+        self._lock = threading.Lock()
+        self._spill = None
+        if self.spill_path is not None:
+            self.spill_path.parent.mkdir(parents=True, exist_ok=True)
+            self._rotated_path.unlink(missing_ok=True)  # the seqs of a previous process start over
+            self._spill = open(self.spill_path, "w", encoding="utf-8")
+
+    @property
+    def last_seq(self) -> int:
+        """Seq of the latest record, 0 if there is none"""
+        with self._lock:
+            return self._records[-1].seq if self._records else 0
+
+    def write(
+        self, text: str, level: str = "INFO", run_id: Optional[str] = None, created: Optional[float] = None
+    ) -> int:
+        """Append a record, returns its seq"""
+        with self._lock:
+            record = LogRecord(seq=next(self._seq), time=created or time.time(), level=level, text=text, run_id=run_id)
+            self._records.append(record)
+            if self._spill is not None:
+                self._spill.write(json.dumps(record.to_dict(), ensure_ascii=False) + "\n")
+                if self._spill.tell() >= self.spill_max_bytes:
+                    self._rotate()
+        return record.seq
+
+    def _rotate(self):
+        self._spill.close()
+        os.replace(self.spill_path, self._rotated_path)
+        self._spill = open(self.spill_path, "w", encoding="utf-8")
+
+    @property
+    def _rotated_path(self) -> Path:
+        return self.spill_path.with_name(self.spill_path.name + ".1")
+
+    def read(
+        self, since_seq: int = 0, max_lines: int = 100, run_id: Optional[str] = None
+    ) -> tuple[list[LogRecord], bool]:
+        """Up to `max_lines` records after `since_seq`, of `run_id` only if given, and whether more follow them.
+        A reader continues from the seq of the last record returned. Records lost off the ring without a spill file
+        are skipped"""
+        with self._lock:
+            first = self._records[0].seq if self._records else since_seq + 1
+            behind = self._spill is not None and since_seq + 1 < first
+            if behind:
+                self._spill.flush()
+            ring = [r for r in self._records if r.seq > since_seq]  # a copy, the ring goes on while the spill is read
+        spilled = self._read_spill(since_seq, first) if behind else iter(())
+        matching = (r for r in itertools.chain(spilled, ring) if run_id is None or r.run_id == run_id)
+        records = list(itertools.islice(matching, max_lines + 1))
+        return records[:max_lines], len(records) > max_lines
+
+    def _read_spill(self, since_seq: int, until_seq: int) -> Iterator[LogRecord]:
+        for path in (self._rotated_path, self.spill_path):
+            if not path.exists():
+                continue
+            with open(path, encoding="utf-8") as file:
+                for line in file:
+                    try:
+                        record = LogRecord(**json.loads(line))
+                    except (ValueError, TypeError):
+                        continue  # a line cut short by a crash
+                    if record.seq >= until_seq:
+                        return
+                    if record.seq > since_seq:
+                        yield record
+
+    def close(self):
+        with self._lock:
+            if self._spill is not None:
+                self._spill.close()
+                self._spill = None
@@ -8,8 +8,9 @@
 import base64
 import os
 
-from aiohttp import ClientSession,ClientError
+from aiohttp import ClientError
 from metagpt.logs import logger
+from metagpt.utils.http_session import get_session
 
 
 async def mermaid_to_file(mermaid_code, output_file_without_suffix):
@@ -24,18 +25,17 @@ async def mermaid_to_file(mermaid_code, output_file_without_suffix):
         output_file = f"{output_file_without_suffix}.{suffix}"
         path_type = "svg" if suffix == "svg" else "img"
         url = f"https://mermaid.ink/{path_type}/{encoded_string}"
-        async with ClientSession() as session:
-            try:
-                async with session.get(url) as response:
-                    if response.status == 200:
-                        text = await response.content.read()
-                        with open(output_file, 'wb') as f:
-                            f.write(text)
-                        logger.info(f"Generating {output_file}..")
-                    else:
-                        logger.error(f"Failed to generate {output_file}")
-                        return -1
-            except ClientError as e:
-                logger.error(f"network error: {e}")
-                return -1
+        try:
+            async with get_session().get(url) as response:
+                if response.status == 200:
+                    text = await response.content.read()
+                    with open(output_file, 'wb') as f:
+                        f.write(text)
+                    logger.info(f"Generating {output_file}..")
+                else:
+                    logger.error(f"Failed to generate {output_file}")
+                    return -1
+        except ClientError as e:
+            logger.error(f"network error: {e}")
+            return -1
     return 0
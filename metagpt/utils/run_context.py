@@ -0,0 +1,96 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# @Desc   : per-run values of the process-wide singletons, so that several projects can share one event loop
+
+import functools
+import inspect
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Optional
+
+_MISSING = object()
+
+
+class RunContext:
+    """The values a run gives to the `Scoped` attributes of CONFIG, PRODUCT_CONFIG and CostManager.
+
+    While a context is active, reading such an attribute returns the value of the context and assigning it only
+    changes the context. Asyncio tasks inherit the context active where they are created, so everything a run
+    awaits or gathers sees the same values, and runs in other contexts do not see them.
+
+    ctx = RunContext()
+    with ctx.activate():
+        CONFIG.max_budget = 3.0
+    """
+
+    def __init__(self, parent: Optional["RunContext"] = None):
+        self.values: dict["Scoped", Any] = dict(parent.values) if parent else {}
+
+    @contextmanager
+    def activate(self):
+        token = _current.set(self)
+        try:
+            yield self
+        finally:
+            _current.reset(token)
+
+
+_current: ContextVar[Optional[RunContext]] = ContextVar("run_context", default=None)
+
+
+def current_context() -> Optional[RunContext]:
+    return _current.get()
+
+
+class Scoped:
+    """Attribute of a singleton whose value depends on the active RunContext, see there.
+
+    Outside any context it behaves like a plain instance attribute. In a context where it was not assigned yet,
+    it reads as the process-wide value if `inherit` (settings), as `default` otherwise (per-run state such as the
+    running cost, which must start from zero).
+    """
+
+    def __init__(self, default: Any = None, inherit: bool = True):
+        self.default = default
+        self.inherit = inherit
+
+    def __set_name__(self, owner, name):
+        self.name = name
+
+    def __get__(self, obj, objtype=None):
+        if obj is None:
+            return self
+        ctx = _current.get()
+        if ctx is not None:
+            value = ctx.values.get(self, _MISSING)
+            if value is not _MISSING:
+                return value
+            if not self.inherit:
+                return self.default
+        return obj.__dict__.get(self.name, self.default)
+
+    def __set__(self, obj, value):
+        ctx = _current.get()
+        if ctx is not None:
+            ctx.values[self] = value
+        else:
+            obj.__dict__[self.name] = value
+
+
+def in_context(method):
+    """Run the method of an object with a `context` attribute in that context"""
+    if inspect.iscoroutinefunction(method):
+
+        @functools.wraps(method)
+        async def wrapper(self, *args, **kwargs):
+            with self.context.activate():
+                return await method(self, *args, **kwargs)
+
+    else:
+
+        @functools.wraps(method)
+        def wrapper(self, *args, **kwargs):
+            with self.context.activate():
+                return method(self, *args, **kwargs)
+
+    return wrapper
@@ -0,0 +1,422 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# @Desc   : queue of project runs executed concurrently within a global and a per-user limit
+
+import asyncio
+import concurrent.futures
+import itertools
+import multiprocessing
+import threading
+import time
+import traceback
+import uuid
+from contextvars import ContextVar
+from dataclasses import dataclass, field
+from enum import Enum
+from typing import Any, Callable, Optional
+
+from metagpt.logs import logger
+from metagpt.utils.http_session import close_sessions
+
+
+class RunStatus(str, Enum):
+    QUEUED = "Queued"
+    RUNNING = "Running"
+    COMPLETE = "Complete"
+    FAILED = "Failed"
+    CANCELLED = "Cancelled"
+
+
+FINISHED = (RunStatus.COMPLETE, RunStatus.FAILED, RunStatus.CANCELLED)
+
+_current_run: ContextVar[Optional[str]] = ContextVar("current_run", default=None)
+
+
+# hands an event of the current run, ("info", dict) or ("log", (text, level, created)), to its scheduler
+_reporter: ContextVar[Optional[Callable[[str, Any], None]]] = ContextVar("reporter", default=None)
+_worker_events: Optional[multiprocessing.SimpleQueue] = None  # to the scheduler, in a process worker
+_asker: ContextVar[Optional["_Asker"]] = ContextVar("asker", default=None)
+
+
+def current_run_id() -> Optional[str]:
+    """Id of the run the calling task belongs to, None outside of a run"""
+    return _current_run.get()
+
+
+def report(**info):
+    """Update the info of the current run from within it, e.g. the stage it works on, also from a process worker"""
+    reporter = _reporter.get()
+    if reporter is not None:
+        reporter("info", info)
+
+
+def report_log(text: str, level: str = "INFO"):
+    """Hand a log line of the current run to the `on_log` of its scheduler, also from a process worker"""
+    reporter = _reporter.get()
+    if reporter is not None:
+        reporter("log", (text, level, time.time()))
+
+
+def ask(question: Any) -> asyncio.Future:
+    """Ask the scheduler's side a question from a run in a process worker, e.g. for an approval: a future of what
+    `RunScheduler.answer` is given. Cancelling the future withdraws the question. Runs of asyncio workers share the
+    objects of the server and wait on those instead"""
+    asker = _asker.get()
+    if asker is None:
+        raise RuntimeError("Only a run in a process worker can ask the scheduler")
+    return asker.ask(question)
+
+
+class _Asker:
+    """The questions of a run in a process worker; the answers come back in a queue of the scheduler's manager,
+    read by a thread of the run"""
+
+    def __init__(self, send: Callable[[str, Any], None], replies):
+        self._send = send
+        self._replies = replies
+        self._pending: dict[int, asyncio.Future] = {}
+        self._ids = itertools.count()
+        self._loop = asyncio.get_running_loop()
+        self._thread = threading.Thread(target=self._receive, name="run-answers", daemon=True)
+        self._thread.start()
+
+    def ask(self, question: Any) -> asyncio.Future:
+        ask_id = next(self._ids)
+        future = self._loop.create_future()
+        self._pending[ask_id] = future
+        future.add_done_callback(lambda f: self._withdraw(ask_id, f))
+        self._send("ask", (ask_id, question))
+        return future
+
+    def _withdraw(self, ask_id: int, future: asyncio.Future):
+        self._pending.pop(ask_id, None)
+        if future.cancelled():  # e.g. timed out
+            self._send("withdraw", ask_id)
+
+    def _receive(self):
+        while (reply := self._replies.get()) is not None:
+            self._loop.call_soon_threadsafe(self._resolve, *reply)
+
+    def _resolve(self, ask_id: int, answer: Any):
+        future = self._pending.get(ask_id)
+        if future is not None and not future.done():
+            future.set_result(answer)
+
+    def close(self):
+        self._replies.put(None)
+        self._thread.join()
+
+
+@dataclass(eq=False)
+class Run:
+    run_id: str
+    user: str
+    project: str
+    fn: Callable = field(repr=False)
+    args: tuple = field(repr=False)
+    kwargs: dict = field(repr=False)
+    priority: int = 0
+    seq: int = 0
+    status: RunStatus = RunStatus.QUEUED
+    submitted: float = field(default_factory=time.time)
+    started: Optional[float] = None
+    finished: Optional[float] = None
+    result: Any = field(default=None, repr=False)
+    error: str = ""
+    info: dict = field(default_factory=dict)  # left to the caller, e.g. the stage being worked on, see `report`
+    _future: Optional[concurrent.futures.Future] = field(default=None, repr=False)
+    _callbacks: list[Callable[["Run"], None]] = field(default_factory=list, repr=False)
+    _replies: Any = field(default=None, repr=False)  # answers to a run in a process worker, a queue proxy
+    _asked: Optional[int] = field(default=None, repr=False)  # the question of a process run waiting for an answer
+    _done: threading.Event = field(default_factory=threading.Event, repr=False)
+
+    @property
+    def done(self) -> bool:
+        return self.status in FINISHED
+
+
+def _init_worker(events: multiprocessing.SimpleQueue):
+    global _worker_events
+    _worker_events = events
+
+
+def _run_in_process(run_id: str, fn: Callable, args: tuple, kwargs: dict, replies):
+    """A run in a process worker, its reports, questions and log records are sent to the scheduler. A SimpleQueue
+    writes them at once, so they are ahead of the result"""
+
+    def send(kind: str, payload: Any):
+        _worker_events.put((run_id, kind, payload))
+
+    def forward(message):
+        record = message.record
+        send("log", (message.rstrip("\n"), record["level"].name, record["time"].timestamp()))
+
+    async def main():
+        _current_run.set(run_id)
+        _reporter.set(send)
+        asker = _Asker(send, replies)
+        _asker.set(asker)
+        with logger.contextualize(run_id=run_id):
+            try:
+                return await fn(*args, **kwargs)
+            finally:
+                asker.close()
+                await close_sessions()
+
+    sink = logger.add(forward, level="INFO", filter=lambda record: record["extra"].get("run_id") == run_id)
+    try:
+        return asyncio.run(main())
+    finally:
+        logger.remove(sink)
+
+
+class RunScheduler:
+    """Runs coroutine functions for users and projects, at most `max_runs` at once and `max_runs_per_user` per user,
+    never two of the same project at once.
+
+    The next run is the queued run of highest priority; between runs of equal priority the user with the fewest runs
+    going, then the user served longest ago (so that a user queueing many runs does not starve the others), then the
+    run submitted first.
+
+    With asyncio workers the runs are tasks of one event loop, in a thread of the scheduler, and can be cancelled at
+    any time. With process workers every run is `asyncio.run` in a process of a pool: `fn` and its arguments must be
+    picklable, a run cannot be cancelled once it started, and it `ask`s for what it needs of the server, e.g. an
+    approval, which is given with `answer`. Either way a run updates its `info` with `report` and
+    its log records, and the lines given to `report_log`, go to `on_log(run_id, text, level, created)`; records
+    logged in the scheduler's own process are left to the sinks of that process. All methods can be called from any
+    thread.
+    """
+
+    def __init__(
+        self,
+        max_runs: int = 4,
+        max_runs_per_user: int = 1,
+        workers: str = "asyncio",
+        keep_finished: int = 100,
+        on_log: Optional[Callable[[str, str, str, float], None]] = None,
+    ):
+        assert workers in ("asyncio", "process"), "workers must be asyncio or process"
+        self.max_runs = max_runs
+        self.max_runs_per_user = max_runs_per_user
+        self.workers = workers
+        self.keep_finished = keep_finished
+        self.on_log = on_log
+        self._runs: dict[str, Run] = {}
+        self._queue: list[Run] = []
+        self._running: dict[str, int] = {}  # user: runs going
+        self._projects: set[tuple[str, str]] = set()  # (user, project) of the runs going
+        self._served: dict[str, int] = {}  # user: when a run of theirs last started, in dispatches
+        self._seq = itertools.count()
+        self._dispatches = itertools.count()
+        self._lock = threading.RLock()
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._thread: Optional[threading.Thread] = None
+        self._pool: Optional[concurrent.futures.ProcessPoolExecutor] = None
+        self._events: Optional[multiprocessing.SimpleQueue] = None
+        self._events_thread: Optional[threading.Thread] = None
+        self._manager = None  # of the queues of answers to process runs
+
+    def submit(self, user: str, project: str, fn: Callable, *args, priority: int = 0, **kwargs) -> Run:
+        """Queue `fn(*args, **kwargs)`, a coroutine function, and start it as soon as the limits allow"""
+        run = Run(
+            run_id=uuid.uuid4().hex[:12],
+            user=user,
+            project=project,
+            fn=fn,
+            args=args,
+            kwargs=kwargs,
+            priority=priority,
+            seq=next(self._seq),
+        )
+        with self._lock:
+            self._runs[run.run_id] = run
+            self._queue.append(run)
+            logger.info(f"Run {run.run_id} of {user}/{project} queued with priority {priority}")
+            self._dispatch()
+        return run
+
+    def get(self, run_id: str) -> Optional[Run]:
+        return self._runs.get(run_id)
+
+    def runs(self, user: Optional[str] = None) -> list[Run]:
+        """Known runs in submission order, of `user` only if given"""
+        with self._lock:
+            return [r for r in self._runs.values() if user is None or r.user == user]
+
+    def active(self, user: str, project: str) -> Optional[Run]:
+        """The queued or running run of a project, if any"""
+        with self._lock:
+            return next((r for r in self._runs.values() if (r.user, r.project) == (user, project) and not r.done), None)
+
+    def add_done_callback(self, run_id: str, fn: Callable[[Run], None]):
+        """Call `fn(run)` once the run is finished, at once if it is. Called in a thread of the scheduler"""
+        with self._lock:
+            run = self._runs[run_id]
+            if not run.done:
+                run._callbacks.append(fn)
+                return
+        fn(run)
+
+    def answer(self, run_id: str, answer: Any) -> bool:
+        """Answer the question a run in a process worker is waiting on, False if it is not waiting"""
+        with self._lock:
+            run = self._runs.get(run_id)
+            if run is None or run._asked is None:
+                return False
+            ask_id, run._asked = run._asked, None
+            run._replies.put((ask_id, answer))
+        return True
+
+    def cancel(self, run_id: str) -> bool:
+        """Cancel a queued run, or a running one with asyncio workers. False if it could not be cancelled"""
+        with self._lock:
+            run = self._runs.get(run_id)
+            if run is None or run.done:
+                return False
+            if run.status is RunStatus.QUEUED:
+                self._queue.remove(run)
+                self._complete(run, RunStatus.CANCELLED)
+            else:
+                return run._future.cancel()  # runs _finish, except for a process worker already going
+        self._notify(run)
+        return True
+
+    def wait(self, run_id: str, timeout: Optional[float] = None) -> Run:
+        """Block until the run is finished, or `timeout` seconds passed"""
+        run = self._runs[run_id]
+        run._done.wait(timeout)
+        return run
+
+    def shutdown(self):
+        """Cancel the queued and running runs and stop the workers"""
+        with self._lock:
+            for run in list(self._queue) + [r for r in self._runs.values() if r.status is RunStatus.RUNNING]:
+                self.cancel(run.run_id)
+        if self._loop is not None:
+            asyncio.run_coroutine_threadsafe(close_sessions(), self._loop).result()
+            self._loop.call_soon_threadsafe(self._loop.stop)
+            self._thread.join()
+            self._loop.close()
+            self._loop = None
+        if self._pool is not None:
+            self._pool.shutdown(wait=True, cancel_futures=True)
+            self._pool = None
+            self._events.put(None)
+            self._events_thread.join()
+            self._events = self._events_thread = None
+            self._manager.shutdown()
+            self._manager = None
+
+    def _next(self) -> Optional[Run]:
+        eligible = [
+            r
+            for r in self._queue
+            if self._running.get(r.user, 0) < self.max_runs_per_user and (r.user, r.project) not in self._projects
+        ]
+        if not eligible:
+            return None
+        return min(
+            eligible, key=lambda r: (-r.priority, self._running.get(r.user, 0), self._served.get(r.user, -1), r.seq)
+        )
+
+    def _dispatch(self):
+        while sum(self._running.values()) < self.max_runs and (run := self._next()) is not None:
+            self._queue.remove(run)
+            self._running[run.user] = self._running.get(run.user, 0) + 1
+            self._projects.add((run.user, run.project))
+            self._served[run.user] = next(self._dispatches)
+            run.status, run.started = RunStatus.RUNNING, time.time()
+            logger.info(f"Run {run.run_id} of {run.user}/{run.project} started")
+            run._future = self._start(run)
+            if self.workers == "process":
+                # finished after the events the run sent before its result, they are in the queue ahead of this one
+                run._future.add_done_callback(lambda _, run_id=run.run_id: self._events.put((run_id, "done", None)))
+            else:
+                run._future.add_done_callback(lambda future, run=run: self._finish(run, future))
+
+    def _start(self, run: Run) -> concurrent.futures.Future:
+        if self.workers == "process":
+            if self._pool is None:
+                self._events = multiprocessing.SimpleQueue()
+                self._events_thread = threading.Thread(
+                    target=self._receive_events, name="run-scheduler-events", daemon=True
+                )
+                self._events_thread.start()
+                self._pool = concurrent.futures.ProcessPoolExecutor(
+                    max_workers=self.max_runs, initializer=_init_worker, initargs=(self._events,)
+                )
+                self._manager = multiprocessing.Manager()
+            run._replies = self._manager.Queue()
+            return self._pool.submit(_run_in_process, run.run_id, run.fn, run.args, run.kwargs, run._replies)
+        if self._loop is None:
+            self._loop = asyncio.new_event_loop()
+            self._thread = threading.Thread(target=self._loop.run_forever, name="run-scheduler", daemon=True)
+            self._thread.start()
+        return asyncio.run_coroutine_threadsafe(self._execute(run), self._loop)
+
+    async def _execute(self, run: Run):
+        # the task runs in a copy of the context, nothing to reset
+        _current_run.set(run.run_id)
+        _reporter.set(lambda kind, payload: self._on_event(run.run_id, kind, payload))
+        with logger.contextualize(run_id=run.run_id):
+            return await run.fn(*run.args, **run.kwargs)
+
+    def _receive_events(self):
+        events = self._events
+        while (event := events.get()) is not None:
+            self._on_event(*event)
+
+    def _on_event(self, run_id: str, kind: str, payload: Any):
+        run = self._runs.get(run_id)
+        if run is None:
+            return
+        if kind == "info":
+            run.info.update(payload)
+        elif kind == "log":
+            if self.on_log is not None:
+                self.on_log(run_id, *payload)
+        elif kind == "ask":
+            with self._lock:
+                run._asked = payload[0]
+        elif kind == "withdraw":
+            with self._lock:
+                if run._asked == payload:
+                    run._asked = None
+        elif kind == "done":
+            self._finish(run, run._future)
+
+    def _finish(self, run: Run, future: concurrent.futures.Future):
+        with self._lock:
+            run._asked = run._replies = None
+            self._running[run.user] -= 1
+            if not self._running[run.user]:
+                del self._running[run.user]
+            self._projects.discard((run.user, run.project))
+            if future.cancelled():
+                self._complete(run, RunStatus.CANCELLED)
+            elif future.exception() is not None:
+                run.error = "".join(traceback.format_exception(future.exception()))
+                self._complete(run, RunStatus.FAILED)
+            else:
+                run.result = future.result()
+                self._complete(run, RunStatus.COMPLETE)
+            self._dispatch()
+        self._notify(run)
+
+    @staticmethod
+    def _notify(run: Run):
+        """Call the done callbacks of a finished run, then wake its waiters"""
+        callbacks, run._callbacks = run._callbacks, []
+        for fn in callbacks:
+            try:
+                fn(run)
+            except Exception as e:
+                logger.exception(f"Callback of run {run.run_id} failed: {e}")
+        run._done.set()
+
+    def _complete(self, run: Run, status: RunStatus):
+        run.status, run.finished = status, time.time()
+        logger.info(f"Run {run.run_id} of {run.user}/{run.project}: {status.value}")
+        finished = [r for r in self._runs.values() if r.done]
+        for old in finished[: max(0, len(finished) - self.keep_finished)]:
+            del self._runs[old.run_id]
@@ -4,7 +4,9 @@
 
 import copy
 import pickle
-from typing import Dict, List
+from typing import Dict, List, Type
+
+from pydantic import BaseModel
 
 from metagpt.actions.action_output import ActionOutput
 from metagpt.schema import Message
@@ -42,6 +44,17 @@ def actionoutout_schema_to_mapping(schema: Dict) -> Dict:
     return mapping
 
 
+_schema_mappings: Dict[Type[BaseModel], tuple[str, Dict]] = {}
+
+
+def schema_mapping(model_class: Type[BaseModel]) -> tuple[str, Dict]:
+    """Title and field mapping of a model class, computed once per class. The mapping is shared, do not modify it"""
+    if model_class not in _schema_mappings:
+        schema = model_class.schema()
+        _schema_mappings[model_class] = schema["title"], actionoutout_schema_to_mapping(schema)
+    return _schema_mappings[model_class]
+
+
 def serialize_message(message: Message):
     return pickle.dumps(deconstruct(message))
 
@@ -59,14 +72,14 @@ def reconstruct(message_cp):
     return message_cp
     
 def deconstruct(message: Message):
-    message_cp = copy.deepcopy(message)  # avoid `instruct_content` value update by reference
+    # a shallow copy is enough: `instruct_content` is replaced rather than updated, the other fields are immutable
+    message_cp = copy.copy(message)
     ic = message_cp.instruct_content
     if ic:
         # model create by pydantic create_model like `pydantic.main.prd`, can't pickle.dump directly
-        schema = ic.schema()
-        mapping = actionoutout_schema_to_mapping(schema)
+        class_name, mapping = schema_mapping(type(ic))
 
-        message_cp.instruct_content = {"class": schema["title"], "mapping": mapping, "value": ic.dict()}
+        message_cp.instruct_content = {"class": class_name, "mapping": mapping, "value": ic.dict()}
     return message_cp
 
 
@@ -0,0 +1,207 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# @Desc   : run the next stage on a deliverable while its approval is pending, keep the result if it is approved as is
+
+import asyncio
+import filecmp
+import os
+import shutil
+from pathlib import Path
+from typing import Optional
+
+from metagpt.config import CONFIG
+from metagpt.environment import Environment
+from metagpt.logs import logger
+from metagpt.product_config import PRODUCT_CONFIG
+from metagpt.provider.human_provider import APPROVALS
+from metagpt.provider.openai_api import CostManager
+from metagpt.roles import Role
+from metagpt.schema import Message
+from metagpt.utils.run_context import RunContext
+
+SPECULATION_DIR = ".speculation"
+# files of the product root that belong to the real run only
+NOT_COPIED = (SPECULATION_DIR, "history.log", "checkpoint.pickle", "checkpoint.tmp", "history.pickle")
+
+
+class Speculation:
+    """The roles of the next stage, run on what the approver will publish if the deliverable is approved unchanged.
+
+    Forks of the roles work in a sandbox: an environment of their own and, through a child RunContext, a copy of
+    the product root, so that nothing of the real run changes until the branch is committed. The approver's message
+    is predicted from the deliverable on disk and, messages being content hashed, the real one has the same id if
+    and only if the deliverable was approved as it was. Then the real roles are held back from working on it and
+    `settle` commits the branch: the memories and state of the forks, the messages they published and the files
+    they wrote. An edit, a rejection or a timeout discards the branch.
+
+    The spend of the sandbox is charged to the run and capped at `max_cost`, checked between the sandbox rounds.
+    """
+
+    def __init__(
+        self,
+        env: Environment,
+        context: RunContext,
+        approver: Role,
+        stage: str,
+        pending: asyncio.Future,
+        roles: list[Role],
+        max_cost: float,
+    ):
+        self.env = env
+        self.context = context
+        self.stage = stage
+        self.roles = roles
+        self.max_cost = max_cost
+        self.held = False  # the approval matched the prediction, the real roles wait for the branch
+        self.closed = False
+        self.outputs: list[Message] = []
+        self.spent = 0.0
+
+        action = approver._actions[0]
+        output = action.approved_output()
+        self.predicted = Message(
+            content=output.content,
+            instruct_content=output.instruct_content,
+            role=approver.profile,
+            cause_by=type(action),
+        )
+
+        self.root: Path = PRODUCT_CONFIG.product_root
+        self.sandbox_root = self.root / SPECULATION_DIR / stage
+        shutil.rmtree(self.sandbox_root, ignore_errors=True)
+        shutil.copytree(self.root, self.sandbox_root, ignore=shutil.ignore_patterns(*NOT_COPIED))
+        self.copied = set(self._files(self.sandbox_root))
+
+        self.sandbox = Environment()
+        self.forks = {role.profile: role.fork() for role in roles}
+        self.sandbox.add_roles(self.forks.values())
+
+        self.child = RunContext(context)
+        with self.child.activate():
+            PRODUCT_CONFIG.product_root = self.sandbox_root
+            PRODUCT_CONFIG.set_product_config(dict(PRODUCT_CONFIG.product_config))
+            CONFIG.max_budget = min(CONFIG.max_budget, CONFIG.total_cost + max_cost)
+            self.task = asyncio.create_task(self._run())
+
+        self._loop = asyncio.get_running_loop()
+        pending.add_done_callback(self._on_verdict)
+        env.add_publish_hook(self._on_publish)
+        logger.info(f"Speculating on the approval of {stage} with {', '.join(self.forks)}")
+
+    @staticmethod
+    def _files(root: Path) -> list[str]:
+        return [str(p.relative_to(root)) for p in root.rglob("*") if p.is_file()]
+
+    async def _run(self):
+        costs = CostManager().get_costs()
+        total_cost = CONFIG.total_cost
+        try:
+            self.sandbox.publish_message(self.predicted)
+            while self.sandbox.pending and CONFIG.total_cost - total_cost < self.max_cost:
+                await self.sandbox.run()
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.warning(f"Speculation on {self.stage} failed: {e}")
+        finally:
+            self._charge(costs, total_cost)
+        self.outputs = [m for m in self.sandbox.memory.get() if m.id != self.predicted.id]
+
+    def _charge(self, costs, total_cost: float):
+        """Charge what the sandbox spent to the run, whatever becomes of the branch"""
+        cost_manager = CostManager()
+        prompt_tokens = cost_manager.total_prompt_tokens - costs.total_prompt_tokens
+        completion_tokens = cost_manager.total_completion_tokens - costs.total_completion_tokens
+        cost = cost_manager.total_cost - costs.total_cost
+        self.spent = CONFIG.total_cost - total_cost
+        with self.context.activate():
+            cost_manager.total_prompt_tokens += prompt_tokens
+            cost_manager.total_completion_tokens += completion_tokens
+            cost_manager.total_cost += cost
+            CONFIG.total_cost += self.spent
+        logger.info(f"Speculation on {self.stage} spent ${self.spent:.3f}")
+
+    def _on_verdict(self, pending: asyncio.Future):
+        if pending.cancelled() or pending.exception() is not None or pending.result() not in APPROVALS:
+            self.discard()
+
+    def _on_publish(self, message: Message):
+        if message.cause_by is not self.predicted.cause_by:
+            return
+        if message.id != self.predicted.id:
+            logger.info(f"The {self.stage} deliverable was approved with changes, discarding the speculation")
+            self.discard()
+            return
+        self.env.remove_publish_hook(self._on_publish)
+        self.held = True
+        for role in self._real_roles():
+            role.recv(message)  # seen already, the role does not work on it unless the branch is released
+
+    def _real_roles(self) -> list[Role]:
+        return [role for role in (self.env.get_role(p) for p in self.forks) if role is not None]
+
+    async def settle(self):
+        """Wait for a held branch and commit it, or release the real roles if it produced nothing"""
+        try:
+            await self.task
+        except asyncio.CancelledError:
+            pass
+        if self.closed:
+            return
+        if not self.outputs:
+            logger.info(f"Speculation on {self.stage} produced nothing, the stage runs as usual")
+            for role in self._real_roles():
+                if self.predicted in role._rc.memory:
+                    role._rc.memory.delete(self.predicted)
+            self.env.wake(self.forks)
+            self._close()
+            return
+
+        for role in self._real_roles():
+            fork = self.forks[role.profile]
+            role._rc.memory.add_batch(fork._rc.memory.get())
+            role.load_state(fork.dump_state())
+        for message in self.outputs:
+            self.env.publish_message(message)
+        self._mirror_files()
+        logger.info(f"Committed the speculation on {self.stage}: {len(self.outputs)} messages")
+        self._close()
+
+    def _mirror_files(self):
+        sandbox_files = set(self._files(self.sandbox_root))
+        for name in sandbox_files:
+            source, target = self.sandbox_root / name, self.root / name
+            if not target.exists() or not filecmp.cmp(source, target, shallow=False):
+                target.parent.mkdir(parents=True, exist_ok=True)
+                shutil.copy2(source, target)
+        for name in self.copied - sandbox_files:
+            (self.root / name).unlink(missing_ok=True)
+
+    def discard(self):
+        """Drop the branch, its spend stays charged"""
+        if self.closed:
+            return
+        logger.info(f"Discarding the speculation on {self.stage}")
+        self.task.cancel()
+        if self.held:
+            for role in self._real_roles():
+                if self.predicted in role._rc.memory:
+                    role._rc.memory.delete(self.predicted)
+            self.env.wake(self.forks)
+        self._close()
+
+    def abandon(self):
+        """`discard` from any thread, e.g. when the deliverable is edited through the API"""
+        self._loop.call_soon_threadsafe(self.discard)
+
+    def _close(self):
+        self.closed = True
+        self.env.remove_publish_hook(self._on_publish)
+        shutil.rmtree(self.sandbox_root, ignore_errors=True)
+        parent: Optional[Path] = self.sandbox_root.parent
+        if parent.exists() and not os.listdir(parent):
+            parent.rmdir()
+
+    @property
+    def live(self) -> bool:
+        return not self.closed
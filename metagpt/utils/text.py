@@ -1,6 +1,6 @@
 from typing import Generator, Sequence
 
-from metagpt.utils.token_counter import TOKEN_MAX, count_string_tokens
+from metagpt.utils.token_counter import TOKEN_MAX, count_many, count_string_tokens
 
 
 def reduce_message_length(msgs: Generator[str, None, None], model_name: str, system_text: str, reserved: int = 0,) -> str:
@@ -46,6 +46,7 @@ def generate_prompt_chunk(
         The chunk of text.
     """
     paragraphs = text.splitlines(keepends=True)
+    count_many(paragraphs, model_name)  # encode all paragraphs as one batch, the loop below then hits the memo
     current_token = 0
     current_lines = []
 
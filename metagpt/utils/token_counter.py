@@ -8,8 +8,16 @@ ref1: https://github.com/openai/openai-cookbook/blob/main/examples/How_to_count_
 ref2: https://github.com/Significant-Gravitas/Auto-GPT/blob/master/autogpt/llm/token_counter.py
 ref3: https://github.com/hwchase17/langchain/blob/master/langchain/chat_models/openai.py
 """
+import hashlib
+import threading
+from collections import OrderedDict
+from functools import lru_cache
+from typing import Optional
+
 import tiktoken
 
+from metagpt.logs import logger
+
 TOKEN_COSTS = {
     "gpt-3.5-turbo": {"prompt": 0.0015, "completion": 0.002},
     "gpt-3.5-turbo-0301": {"prompt": 0.0015, "completion": 0.002},
@@ -22,7 +30,9 @@ TOKEN_COSTS = {
     "gpt-4-32k-0314": {"prompt": 0.06, "completion": 0.12},
     "gpt-4-0613": {"prompt": 0.06, "completion": 0.12},
     "text-embedding-ada-002": {"prompt": 0.0004, "completion": 0.0},
-    "chatglm_turbo": {"prompt": 0.0, "completion": 0.00069}  # 32k version, prompt + completion tokens=0.005￥/k-tokens
+    "chatglm_turbo": {"prompt": 0.0, "completion": 0.00069},  # 32k version, prompt + completion tokens=0.005￥/k-tokens
+    "claude-2": {"prompt": 0.01102, "completion": 0.03268},
+    "claude-instant-1": {"prompt": 0.00163, "completion": 0.00551},
 }
 
 
@@ -38,17 +48,14 @@ TOKEN_MAX = {
     "gpt-4-32k-0314": 32768,
     "gpt-4-0613": 8192,
     "text-embedding-ada-002": 8192,
-    "chatglm_turbo": 32768
+    "chatglm_turbo": 32768,
+    "claude-2": 100000,
+    "claude-instant-1": 100000,
 }
 
 
-def count_message_tokens(messages, model="gpt-3.5-turbo-0613"):
-    """Return the number of tokens used by a list of messages."""
-    try:
-        encoding = tiktoken.encoding_for_model(model)
-    except KeyError:
-        print("Warning: model not found. Using cl100k_base encoding.")
-        encoding = tiktoken.get_encoding("cl100k_base")
+def _message_format(model: str) -> tuple[str, int, int]:
+    """(model to count as, tokens per message, tokens per name) for a chat model"""
     if model in {
         "gpt-3.5-turbo-0613",
         "gpt-3.5-turbo-16k-0613",
@@ -57,47 +64,168 @@ def count_message_tokens(messages, model="gpt-3.5-turbo-0613"):
         "gpt-4-0613",
         "gpt-4-32k-0613",
     }:
-        tokens_per_message = 3
-        tokens_per_name = 1
+        return model, 3, 1
     elif model == "gpt-3.5-turbo-0301":
-        tokens_per_message = 4  # every message follows <|start|>{role/name}\n{content}<|end|>\n
-        tokens_per_name = -1  # if there's a name, the role is omitted
+        # every message follows <|start|>{role/name}\n{content}<|end|>\n; if there's a name, the role is omitted
+        return model, 4, -1
     elif "gpt-3.5-turbo" in model:
-        print("Warning: gpt-3.5-turbo may update over time. Returning num tokens assuming gpt-3.5-turbo-0613.")
-        return count_message_tokens(messages, model="gpt-3.5-turbo-0613")
+        _warn_once(f"Warning: {model} may update over time. Returning num tokens assuming gpt-3.5-turbo-0613.")
+        return _message_format("gpt-3.5-turbo-0613")
     elif "gpt-4" in model:
-        print("Warning: gpt-4 may update over time. Returning num tokens assuming gpt-4-0613.")
-        return count_message_tokens(messages, model="gpt-4-0613")
-    else:
-        raise NotImplementedError(
-            f"num_tokens_from_messages() is not implemented for model {model}. "
-            f"See https://github.com/openai/openai-python/blob/main/chatml.md "
-            f"for information on how messages are converted to tokens."
-        )
-    num_tokens = 0
-    for message in messages:
-        num_tokens += tokens_per_message
-        for key, value in message.items():
-            num_tokens += len(encoding.encode(value))
-            if key == "name":
-                num_tokens += tokens_per_name
-    num_tokens += 3  # every reply is primed with <|start|>assistant<|message|>
-    return num_tokens
-
-
-def count_string_tokens(string: str, model_name: str) -> int:
+        _warn_once(f"Warning: {model} may update over time. Returning num tokens assuming gpt-4-0613.")
+        return _message_format("gpt-4-0613")
+    raise NotImplementedError(
+        f"num_tokens_from_messages() is not implemented for model {model}. "
+        f"See https://github.com/openai/openai-python/blob/main/chatml.md "
+        f"for information on how messages are converted to tokens."
+    )
+
+
+_warned = set()
+
+
+def _warn_once(message: str):
+    if message not in _warned:
+        _warned.add(message)
+        logger.warning(message)
+
+
+@lru_cache(maxsize=None)
+def get_encoding(model: str) -> tiktoken.Encoding:
+    """The tiktoken encoding of a model, loaded once per process. Raises KeyError for a model tiktoken does not know"""
+    return tiktoken.encoding_for_model(model)
+
+
+def approximate_tokens(text: str) -> int:
+    """Rough estimate without encoding: ~4 characters per token for ASCII, 1 token per other character. Close for
+    English prose, but not a bound: code and CJK text can take more tokens than estimated"""
+    non_ascii = (len(text.encode("utf-8")) - len(text)) // 2
+    return (len(text) - non_ascii + 3) // 4 + non_ascii
+
+
+class TokenCounter:
+    """Token counting with per-model cached encoders and an LRU memo of counts keyed by a hash of the text.
+
+    The same system prompts and contexts are counted over and over (max completion tokens, usage, prompt
+    chunking), so repeated texts are served from the memo instead of being encoded again.
+    """
+
+    def __init__(self, memo_size: int = 8192, num_threads: int = 4):
+        self.memo_size = memo_size
+        self.num_threads = num_threads
+        self.hits = 0
+        self.misses = 0
+        self._memo: OrderedDict[tuple[str, bytes], int] = OrderedDict()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _key(encoding: tiktoken.Encoding, text: str) -> tuple[str, bytes]:
+        return encoding.name, hashlib.blake2b(text.encode("utf-8", "surrogatepass"), digest_size=16).digest()
+
+    def _lookup(self, key) -> Optional[int]:
+        with self._lock:
+            count = self._memo.get(key)
+            if count is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+                self._memo.move_to_end(key)
+            return count
+
+    def _store(self, key, count: int):
+        with self._lock:
+            self._memo[key] = count
+            self._memo.move_to_end(key)
+            while len(self._memo) > self.memo_size:
+                self._memo.popitem(last=False)
+
+    def count(self, text: str, model: str, approximate: bool = False) -> int:
+        if approximate:
+            return approximate_tokens(text)
+        if not text:
+            return 0
+        encoding = get_encoding(model)
+        key = self._key(encoding, text)
+        count = self._lookup(key)
+        if count is None:
+            count = len(encoding.encode(text))
+            self._store(key, count)
+        return count
+
+    def count_many(self, texts: list[str], model: str, approximate: bool = False) -> list[int]:
+        """Count several texts at once, the ones not in the memo are encoded as a batch across threads"""
+        if approximate:
+            return [approximate_tokens(text) for text in texts]
+        encoding = get_encoding(model)
+        counts: list[Optional[int]] = []
+        missing: dict[tuple, list[int]] = {}  # key -> positions, identical texts are encoded once
+        missing_texts = []
+        for idx, text in enumerate(texts):
+            if not text:
+                counts.append(0)
+                continue
+            key = self._key(encoding, text)
+            count = self._lookup(key)
+            counts.append(count)
+            if count is None:
+                if key not in missing:
+                    missing[key] = []
+                    missing_texts.append(text)
+                missing[key].append(idx)
+        if missing_texts:
+            encoded = encoding.encode_batch(missing_texts, num_threads=self.num_threads)
+            for (key, positions), tokens in zip(missing.items(), encoded):
+                self._store(key, len(tokens))
+                for idx in positions:
+                    counts[idx] = len(tokens)
+        return counts
+
+    def count_messages(self, messages: list[dict], model: str = "gpt-3.5-turbo-0613", approximate: bool = False) -> int:
+        model, tokens_per_message, tokens_per_name = _message_format(model)
+        values = [value for message in messages for value in message.values()]
+        num_tokens = sum(self.count_many(values, model, approximate=approximate))
+        num_tokens += tokens_per_message * len(messages)
+        num_tokens += tokens_per_name * sum(1 for message in messages if "name" in message)
+        num_tokens += 3  # every reply is primed with <|start|>assistant<|message|>
+        return num_tokens
+
+    def stats(self) -> dict:
+        total = self.hits + self.misses
+        return {"hits": self.hits, "misses": self.misses, "hit_rate": self.hits / total if total else 0.0, "size": len(self._memo)}
+
+    def clear(self):
+        with self._lock:
+            self._memo.clear()
+            self.hits = 0
+            self.misses = 0
+
+
+TOKEN_COUNTER = TokenCounter()
+
+
+def count_message_tokens(messages, model="gpt-3.5-turbo-0613", approximate: bool = False):
+    """Return the number of tokens used by a list of messages."""
+    return TOKEN_COUNTER.count_messages(messages, model, approximate=approximate)
+
+
+def count_string_tokens(string: str, model_name: str, approximate: bool = False) -> int:
     """
     Returns the number of tokens in a text string.
 
     Args:
         string (str): The text string.
         model_name (str): The name of the encoding to use. (e.g., "gpt-3.5-turbo")
+        approximate (bool): Estimate without encoding, good enough for budgeting.
 
     Returns:
         int: The number of tokens in the text string.
     """
-    encoding = tiktoken.encoding_for_model(model_name)
-    return len(encoding.encode(string))
+    return TOKEN_COUNTER.count(string, model_name, approximate=approximate)
+
+
+def count_many(strings: list[str], model_name: str, approximate: bool = False) -> list[int]:
+    """Returns the number of tokens of each text string, encoding the uncached ones as one batch."""
+    return TOKEN_COUNTER.count_many(strings, model_name, approximate=approximate)
 
 
 def get_max_completion_tokens(messages: list[dict], model: str, default: int) -> int:
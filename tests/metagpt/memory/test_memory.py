@@ -0,0 +1,113 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# @Desc   : unittest of `metagpt/memory/memory.py`
+
+import copy
+
+import pytest
+
+from metagpt.actions import BossRequirement, WritePRD
+from metagpt.actions.action_output import ActionOutput
+from metagpt.memory import Memory, MessageStore
+from metagpt.schema import Message
+from metagpt.utils.serialize import deconstruct, deserialize_message, serialize_message
+
+
+def test_message_id():
+    message = Message(role="BOSS", content="Write a cli snake game", cause_by=BossRequirement)
+    same = Message(role="BOSS", content="Write a cli snake game", cause_by=BossRequirement)
+    other = Message(role="BOSS", content="Write a cli snake game", cause_by=WritePRD)
+    assert message.id == same.id and message == same and hash(message) == hash(same)
+    assert message.id != other.id and message != other
+    assert len({message, same, other}) == 2
+
+    ic_obj = ActionOutput.create_model_class("prd", {"field1": (str, ...), "field2": (list[str], ...)})
+    message = Message(content="prd", instruct_content=ic_obj(field1="a", field2=["b"]), cause_by=WritePRD)
+    assert deconstruct(message).id == message.id == deserialize_message(serialize_message(message)).id
+    assert copy.deepcopy(message) == message
+
+
+def test_memory_dedupe_and_news():
+    memory = Memory()
+    first = Message(role="BOSS", content="idea", cause_by=BossRequirement)
+    second = Message(role="PM", content="prd", cause_by=WritePRD)
+    assert memory.add(first) is True
+    assert memory.add(Message(role="BOSS", content="idea", cause_by=BossRequirement)) is False
+    memory.add(second)
+    assert memory.count() == 2 and first in memory
+
+    third = Message(role="PM", content="prd v2", cause_by=WritePRD)
+    assert memory.find_news([first, second, third]) == [third]
+    assert memory.find_news([first, second, third], k=1) == [first, third]
+    assert memory.get_by_action(WritePRD) == [second]
+    assert memory.get_by_action(BossRequirement)[-1] is first
+    assert len(memory.get_by_action(type(memory))) == 0 and type(memory) not in memory.index
+
+
+def test_memory_views():
+    memory = Memory()
+    messages = [Message(role="PM", content=str(i), cause_by=WritePRD) for i in range(4)]
+    memory.add_batch(messages[:3])
+
+    view = memory.get()
+    last = memory.get(k=2)
+    memory.add(messages[3])
+    assert view == messages[:3] and len(view) == 3  # a window, unaffected by later adds
+    assert list(last) == messages[1:3] and last[0] is messages[1] and last[-1] is messages[2]
+    assert last[::-1] == [messages[2], messages[1]]
+    assert memory.get(k=1)[0] is messages[3]
+    with pytest.raises(TypeError):
+        view[0] = messages[3]
+
+    memory.delete(messages[0])
+    assert view == messages[:3]  # delete replaces the lists, outstanding views keep theirs
+    assert memory.get() == messages[1:] and memory.get_by_action(WritePRD) == messages[1:]
+    assert messages[0] not in memory
+    with pytest.raises(ValueError):
+        memory.delete(messages[0])
+
+    memory.clear()
+    assert memory.count() == 0 and memory.find_news(messages) == messages
+
+
+def test_memory_since():
+    memory = Memory()
+    messages = [Message(role="PM", content=str(i), cause_by=WritePRD) for i in range(4)]
+    memory.add_batch(messages[:2])
+    news, cursor = memory.since()
+    assert news == messages[:2]
+    memory.add_batch(messages[2:])
+    news, cursor = memory.since(cursor)
+    assert news == messages[2:]
+    news, cursor = memory.since(cursor)
+    assert len(news) == 0
+
+    memory.delete(messages[0])  # positions moved, the next read starts over
+    news, _ = memory.since(cursor)
+    assert news == messages[1:]
+    assert Memory().since(cursor)[0] == []
+
+
+def test_memories_share_a_store():
+    store = MessageStore()
+    env_memory, role_memory = Memory(store), Memory()
+    message = Message(role="PM", content="prd", cause_by=WritePRD)
+    env_memory.add(message)
+
+    replayed = copy.deepcopy(message)  # e.g. recovered from long-term memory
+    role_memory.add(replayed)
+    assert role_memory.get()[0] is replayed
+    role_memory.bind(store)
+    assert role_memory.get()[0] is message and role_memory.get_by_action(WritePRD)[0] is message
+    assert role_memory.add(copy.deepcopy(message)) is False
+
+    other = Message(role="PM", content="prd v2", cause_by=WritePRD)
+    role_memory.add(copy.deepcopy(other))
+    env_memory.add(other)
+    assert env_memory.get()[-1] is role_memory.get()[-1]
+    assert len(store) == 2 and message.id in store
+
+    env_memory.clear()
+    role_memory.clear()
+    del message, replayed, other
+    assert len(store) == 0  # entries go with the last memory holding them
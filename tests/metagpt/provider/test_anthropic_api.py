@@ -0,0 +1,82 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# @Desc   : the unittest of the async Anthropic provider
+
+from types import SimpleNamespace
+
+import anthropic
+import httpx
+import pytest
+
+from metagpt.provider.anthropic_api import Claude2
+from metagpt.provider.rate_limiter import RateLimiter
+
+
+class FakeCompletions:
+    def __init__(self):
+        self.calls = []
+
+    async def create(self, stream=False, **kwargs):
+        self.calls.append(kwargs)
+        if not stream:
+            return SimpleNamespace(completion=" Hello world")
+
+        async def gen():
+            for part in [" Hello", " world"]:
+                yield SimpleNamespace(completion=part)
+
+        return gen()
+
+
+@pytest.fixture
+def completions(mocker):
+    completions = FakeCompletions()
+    mocker.patch("metagpt.provider.anthropic_api._async_client", return_value=SimpleNamespace(completions=completions))
+    mocker.patch.object(Claude2, "count_tokens", side_effect=lambda text: len(text) // 4)
+    mocker.patch.object(Claude2, "acount_tokens", side_effect=lambda text: len(text) // 4)
+    return completions
+
+
+def test_messages_to_prompt():
+    prompt = Claude2()._messages_to_prompt(
+        [{"role": "system", "content": "Be brief."}, {"role": "user", "content": "hi"}]
+    )
+    assert prompt == "Be brief.\n\nHuman: hi\n\nAssistant:"
+
+
+@pytest.mark.asyncio
+async def test_aask(completions):
+    llm = Claude2()
+    cost_before = llm.get_costs().total_cost
+    assert await llm.aask("hi") == " Hello world"
+    assert completions.calls[0]["prompt"].endswith("Human: hi\n\nAssistant:")
+    assert llm.get_costs().total_cost > cost_before
+
+
+@pytest.mark.asyncio
+async def test_aask_stream(completions):
+    deltas = [delta async for delta in Claude2().aask_stream("hi")]
+    assert [d.content for d in deltas] == [" Hello", " world"]
+
+
+@pytest.mark.asyncio
+async def test_retries_reuse_the_reservation(mocker, completions):
+    RateLimiter.reset_all()
+    request = httpx.Request("POST", "https://api.anthropic.com/v1/complete")
+    response = httpx.Response(429, request=request)
+    create = completions.create
+
+    async def rate_limited(stream=False, **kwargs):
+        if len(completions.calls) < 2:
+            completions.calls.append(kwargs)
+            raise anthropic.RateLimitError("slow down", body=None, request=request, response=response)
+        return await create(stream=stream, **kwargs)
+
+    completions.create = rate_limited
+    llm = Claude2()
+    llm._rate_limiter = RateLimiter(rpm=60)
+    mocker.patch.object(llm._rate_limiter, "retry_after", return_value=0)
+    assert await llm.aask("hi") == " Hello world"
+    assert len(completions.calls) == 3
+    assert llm._rate_limiter.requests.level == pytest.approx(59, abs=0.1)  # charged once, not three times
+    RateLimiter.reset_all()
@@ -0,0 +1,163 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# @Desc   : the unittest of hedged requests
+
+import asyncio
+
+import pytest
+
+from metagpt.config import CONFIG
+from metagpt.provider.hedging import HedgePolicy, LatencyTracker
+from metagpt.provider.llm_cache import LLMCache
+from metagpt.provider.openai_api import CostManager, OpenAIGPTAPI
+from metagpt.provider.router_api import RouterGPTAPI
+
+
+def test_percentile():
+    tracker = LatencyTracker()
+    for i in range(1, 101):
+        tracker.record(i / 100)
+    assert tracker.percentile(50) == 0.5
+    assert tracker.percentile(95) == 0.95
+    assert tracker.percentile(100) == 1.0
+    assert HedgePolicy(min_samples=200).delay(tracker) is None
+
+
+@pytest.mark.asyncio
+async def test_hedge_wins_and_loser_is_cancelled():
+    policy = HedgePolicy()
+    cancelled = []
+
+    async def slow():
+        try:
+            await asyncio.sleep(1)
+        except asyncio.CancelledError:
+            cancelled.append("slow")
+            raise
+        return "slow"
+
+    async def fast():
+        await asyncio.sleep(0.01)
+        return "fast"
+
+    assert await policy.run(slow, fast, delay=0.02, allow=lambda: True) == "fast"
+    await asyncio.sleep(0)
+    assert cancelled == ["slow"]
+    assert policy.stats() == {"hedged": 1, "hedge_wins": 1}
+
+    # no hedge when not allowed, e.g. over budget
+    assert await policy.run(fast, slow, delay=0.001, allow=lambda: False) == "fast"
+    assert policy.hedged == 1
+
+
+@pytest.mark.asyncio
+async def test_failed_request_falls_back_to_the_other():
+    async def broken():
+        await asyncio.sleep(0.05)
+        raise ValueError("boom")
+
+    async def ok():
+        await asyncio.sleep(0.1)
+        return "ok"
+
+    assert await HedgePolicy().run(broken, ok, delay=0.01, allow=lambda: True) == "ok"
+
+
+@pytest.mark.asyncio
+async def test_completed_loser_is_handed_over():
+    hedge_done = asyncio.Event()
+
+    async def primary():
+        await hedge_done.wait()
+        return "primary"
+
+    async def hedge():
+        hedge_done.set()
+        return "hedge"
+
+    losers = []
+    winner = await HedgePolicy().run(primary, hedge, delay=0.01, allow=lambda: True, on_loser=losers.append)
+    assert losers == [{"primary": "hedge", "hedge": "primary"}[winner]]
+
+
+def test_budget(mocker):
+    mocker.patch.object(CONFIG, "max_budget", 10.0)
+    policy = HedgePolicy(budget_ratio=0.9)
+    assert policy.within_budget(total_cost=5, extra_cost=1)
+    assert not policy.within_budget(total_cost=8.5, extra_cost=1)
+
+
+@pytest.mark.asyncio
+async def test_router_hedges_to_another_endpoint(mocker):
+    mocker.patch("metagpt.provider.openai_api.get_llm_cache", return_value=LLMCache("unused", mode="off"))
+    LatencyTracker.reset_all()
+    calls = []
+
+    async def acreate(**kwargs):
+        calls.append(kwargs["api_key"])
+        await asyncio.sleep(1 if kwargs["api_key"] == "sk-slow" else 0.01)
+        return {
+            "choices": [{"index": 0, "message": {"role": "assistant", "content": kwargs["api_key"]}}],
+            "usage": {"prompt_tokens": 10, "completion_tokens": 5},
+        }
+
+    mocker.patch("openai.ChatCompletion.acreate", side_effect=acreate)
+    router = RouterGPTAPI([{"api_key": "sk-slow", "rpm": 0}, {"api_key": "sk-fast", "rpm": 0}])
+    slow, fast = router.endpoints
+    for ep in router.endpoints:
+        ep.llm.hedge_policy = HedgePolicy(min_samples=3)
+    for _ in range(3):
+        slow.llm._latency.record(0.02)
+    fast.record_failure()  # make sure the first request goes to the slow endpoint
+    mocker.patch.object(OpenAIGPTAPI, "_calc_usage", return_value={"prompt_tokens": 10, "completion_tokens": 0})
+    prompt_tokens = CostManager().total_prompt_tokens
+
+    assert await router.acompletion_text([{"role": "user", "content": "hi"}]) == "sk-fast"
+    assert calls == ["sk-slow", "sk-fast"]
+    await asyncio.sleep(0.01)
+    assert CostManager().total_prompt_tokens - prompt_tokens == 20  # the cancelled request is charged its prompt
+    assert len(slow.llm._latency) == 3  # nor is the hedged request a latency sample
+    LatencyTracker.reset_all()
+
+
+@pytest.mark.asyncio
+async def test_stream_hedged_to_the_first_content(mocker):
+    mocker.patch("metagpt.provider.openai_api.get_llm_cache", return_value=LLMCache("unused", mode="off"))
+    LatencyTracker.reset_all()
+    closed = []
+
+    async def chunks(api_key):
+        try:
+            await asyncio.sleep(1 if api_key == "sk-slow" else 0.01)
+            for content in (api_key, " done"):
+                yield {"choices": [{"index": 0, "delta": {"content": content}}]}
+        finally:
+            closed.append(api_key)
+
+    async def acreate(**kwargs):
+        assert kwargs["stream"]
+        return chunks(kwargs["api_key"])
+
+    mocker.patch("openai.ChatCompletion.acreate", side_effect=acreate)
+    router = RouterGPTAPI([{"api_key": "sk-slow", "rpm": 0}, {"api_key": "sk-fast", "rpm": 0}])
+    slow, fast = router.endpoints
+    for ep in router.endpoints:
+        ep.llm.hedge_policy = HedgePolicy(min_samples=3)
+    for _ in range(3):
+        slow.llm._first_content_latency.record(0.02)
+    fast.record_failure()
+    mocker.patch.object(
+        OpenAIGPTAPI,
+        "_calc_usage",
+        side_effect=lambda messages, rsp: {"prompt_tokens": 10, "completion_tokens": len(rsp.split())},
+    )
+    costs = CostManager().get_costs()
+
+    assert await router.acompletion_text([{"role": "user", "content": "hi"}], stream=True) == "sk-fast done"
+    await asyncio.sleep(0.01)
+    assert closed == ["sk-fast", "sk-slow"]
+    # the winner pays for its two words, the slow stream cancelled before its first one for its prompt
+    assert CostManager().total_prompt_tokens - costs.total_prompt_tokens == 20
+    assert CostManager().total_completion_tokens - costs.total_completion_tokens == 2
+    assert len(slow.llm._first_content_latency) == 3 and slow.llm.hedge_policy.stats()["hedge_wins"] == 1
+    LatencyTracker.reset_all()
@@ -0,0 +1,93 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# @Desc   : the unittest of LLMCache
+
+import threading
+
+import pytest
+
+from metagpt.provider.llm_cache import LLMCache, LLMCacheMissError, set_llm_cache
+from metagpt.provider.openai_api import OpenAIGPTAPI
+
+messages = [{"role": "user", "content": "who are you"}]
+
+default_resp = {
+    "choices": [{"index": 0, "message": {"role": "assistant", "content": "I'm a cached answer"}}],
+    "usage": {"prompt_tokens": 10, "completion_tokens": 5},
+}
+
+
+def test_make_key_is_stable():
+    key1 = LLMCache.make_key("openai", "gpt-4", messages, temperature=0.3, max_tokens=100)
+    key2 = LLMCache.make_key("openai", "gpt-4", [dict(reversed(list(messages[0].items())))], 0.3, 100)
+    key3 = LLMCache.make_key("openai", "gpt-4", messages, temperature=0.5, max_tokens=100)
+    assert key1 == key2
+    assert key1 != key3
+
+
+def test_cache_modes(tmp_path):
+    path = tmp_path / "cache.sqlite3"
+
+    cache = LLMCache(path, mode="record")
+    assert cache.lookup("k") is None
+    cache.store("k", "v")
+    assert cache.lookup("k") is None  # record mode always calls the LLM
+    cache.close()
+
+    cache = LLMCache(path, mode="read-through")
+    assert cache.lookup("k") == "v"
+    assert cache.lookup("missing") is None
+    assert (cache.hits, cache.misses) == (1, 1)
+    cache.close()
+
+    cache = LLMCache(path, mode="replay")
+    assert cache.lookup("k") == "v"
+    with pytest.raises(LLMCacheMissError):
+        cache.lookup("missing")
+    cache.store("new", "x")  # replay mode never writes
+    assert cache.count() == 1
+    cache.close()
+
+
+def test_cache_lru_eviction(tmp_path):
+    cache = LLMCache(tmp_path / "cache.sqlite3", mode="read-through", max_entries=2)
+    cache.store("a", "1")
+    cache.store("b", "2")
+    cache.lookup("a")  # b is now the least recently used
+    cache.store("c", "3")
+    assert cache.count() == 2
+    assert cache.lookup("b") is None
+    assert cache.lookup("a") == "1"
+
+    cache = LLMCache(tmp_path / "bytes.sqlite3", mode="read-through", max_bytes=10)
+    cache.store("a", "x" * 6)
+    cache.store("b", "y" * 6)
+    assert cache.count() == 1
+    assert cache.lookup("b") == "y" * 6
+
+
+@pytest.mark.asyncio
+async def test_async_access_leaves_the_event_loop(mocker, tmp_path):
+    cache = LLMCache(tmp_path / "cache.sqlite3", mode="read-through")
+    threads = []
+    connect = cache._connect
+    mocker.patch.object(cache, "_connect", side_effect=lambda: threads.append(threading.current_thread()) or connect())
+    await cache.astore("k", "v")
+    assert await cache.alookup("k") == "v"
+    assert len(threads) == 2 and threading.current_thread() not in threads
+    cache.close()
+
+
+@pytest.mark.asyncio
+async def test_openai_read_through(mocker, tmp_path):
+    acreate = mocker.patch("openai.ChatCompletion.acreate", return_value=default_resp)
+    set_llm_cache(LLMCache(tmp_path / "cache.sqlite3", mode="read-through"))
+    try:
+        llm = OpenAIGPTAPI()
+        rsp1 = await llm.acompletion_text(messages)
+        rsp2 = await llm.acompletion_text(messages, stream=True)
+    finally:
+        set_llm_cache(None)
+
+    assert rsp1 == rsp2 == "I'm a cached answer"
+    assert acreate.call_count == 1
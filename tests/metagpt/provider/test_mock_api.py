@@ -0,0 +1,110 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# @Desc   : the unittest of the offline fixture-replaying LLM provider
+
+import random
+import statistics
+
+import openai
+import pytest
+
+from metagpt.actions.action import Action
+from metagpt.config import CONFIG
+from metagpt.llm import LLM
+from metagpt.provider.base_gpt_api import current_action
+from metagpt.provider.mock_api import (
+    Distribution,
+    FixtureNotFoundError,
+    MockGPTAPI,
+    prompt_fingerprint,
+    write_fixture,
+)
+
+
+class WriteGreeting(Action):
+    async def run(self, name: str):
+        return await self._aask(f"Greet {name}")
+
+
+@pytest.fixture
+def llm(tmp_path, mocker):
+    mocker.patch.object(CONFIG, "mock_llm_fixtures", tmp_path)
+    mocker.patch.object(CONFIG, "calc_usage", False)
+    return MockGPTAPI()
+
+
+def test_prompt_fingerprint_ignores_whitespace():
+    a = [{"role": "user", "content": "hello  world\n"}]
+    b = [{"role": "user", "content": "hello world"}]
+    assert prompt_fingerprint(a) == prompt_fingerprint(b)
+    assert prompt_fingerprint(a) != prompt_fingerprint([{"role": "system", "content": "hello world"}])
+
+
+@pytest.mark.asyncio
+async def test_match_by_action_and_fingerprint(llm, tmp_path):
+    messages = [{"role": "user", "content": "write the prd"}]
+    write_fixture(tmp_path, "WriteJBPRD", messages, ["first prd", "second prd"])
+    (tmp_path / "WriteJBPRD" / "default.md").write_text("any prd")
+    (tmp_path / "default.txt").write_text("anything")
+
+    token = current_action.set("WriteJBPRD")
+    try:
+        assert await llm.acompletion_text(messages) == "first prd"
+        assert await llm.acompletion_text(messages, stream=True) == "second prd"
+        assert await llm.acompletion_text(messages) == "second prd"  # the last scripted answer repeats
+        assert await llm.acompletion_text([{"role": "user", "content": "other"}]) == "any prd"
+    finally:
+        current_action.reset(token)
+    assert await llm.acompletion_text(messages) == "anything"
+
+
+@pytest.mark.asyncio
+async def test_missing_fixture(llm):
+    with pytest.raises(FixtureNotFoundError, match="default.json"):
+        await llm.acompletion_text([{"role": "user", "content": "unknown"}])
+
+
+@pytest.mark.asyncio
+async def test_action_sets_current_action(mocker, tmp_path):
+    mocker.patch.object(CONFIG, "mock_llm_fixtures", tmp_path)
+    (tmp_path / "WriteGreeting").mkdir()
+    (tmp_path / "WriteGreeting" / "default.md").write_text("Hello Alice")
+    action = WriteGreeting(llm=MockGPTAPI())
+    assert await action.run("Alice") == "Hello Alice"
+    assert current_action.get() == ""
+
+
+@pytest.mark.asyncio
+async def test_usage_and_latency_overrides(llm, tmp_path, mocker):
+    messages = [{"role": "user", "content": "hi"}]
+    write_fixture(tmp_path, "", messages, "hello", usage={"completion_tokens": 42}, latency=0)
+    sleep = mocker.patch("asyncio.sleep")
+    rsp = await llm.acompletion(messages)
+    assert rsp["usage"]["completion_tokens"] == 42
+    sleep.assert_awaited_once_with(0.0)
+
+
+@pytest.mark.asyncio
+async def test_error_injection(llm, tmp_path):
+    (tmp_path / "default.md").write_text("ok")
+    llm.rate_limit_error_rate = 1.0
+    with pytest.raises(openai.error.RateLimitError):
+        await llm.acompletion_text([{"role": "user", "content": "hi"}])
+    llm.rate_limit_error_rate, llm.timeout_error_rate = 0.0, 1.0
+    with pytest.raises(openai.error.Timeout):
+        await llm.acompletion_text([{"role": "user", "content": "hi"}], stream=True)
+
+
+def test_distribution():
+    rng = random.Random(0)
+    assert Distribution(0, 1).sample(rng) == 0.0
+    assert Distribution(2, 0).sample(rng) == 2.0
+    samples = [Distribution(2, 1).sample(rng) for _ in range(5000)]
+    assert min(samples) > 0
+    assert statistics.mean(samples) == pytest.approx(2, rel=0.05)
+    assert statistics.stdev(samples) == pytest.approx(1, rel=0.1)
+
+
+def test_llm_selects_mock(mocker):
+    mocker.patch.object(CONFIG, "mock_llm", True)
+    assert isinstance(LLM(), MockGPTAPI)
@@ -0,0 +1,87 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# @Desc   : the unittest of RateLimiter
+
+import pytest
+
+from metagpt.provider.rate_limiter import RateLimiter, parse_reset_duration
+
+
+def test_parse_reset_duration():
+    assert parse_reset_duration("1s") == 1
+    assert parse_reset_duration("6m0s") == 360
+    assert parse_reset_duration("20ms") == pytest.approx(0.02)
+    assert parse_reset_duration("2.5") == 2.5
+    assert parse_reset_duration("") is None
+
+
+def test_reserve_requests_queue_up():
+    limiter = RateLimiter(rpm=60)
+    delays = [limiter.reserve() for _ in range(62)]
+    assert delays[:60] == [0] * 60
+    # the bucket refills at one request per second, later callers queue behind earlier ones
+    assert delays[60] == pytest.approx(1, abs=0.05)
+    assert delays[61] == pytest.approx(2, abs=0.05)
+
+
+def test_reserve_tokens_and_settle():
+    limiter = RateLimiter(tpm=6000)
+    assert limiter.reserve(tokens=6000) == 0
+    assert limiter.reserve(tokens=100) == pytest.approx(1, abs=0.05)
+    limiter.settle(estimated=6000, used=1000)  # the first request used much less than estimated
+    assert limiter.reserve(tokens=100) == 0
+
+
+def test_unlimited_by_default():
+    limiter = RateLimiter()
+    assert all(limiter.reserve(tokens=10**6) == 0 for _ in range(100))
+
+
+def test_update_from_headers():
+    limiter = RateLimiter(rpm=3)
+    limiter.update_from_headers(
+        {
+            "x-ratelimit-limit-requests": "3500",
+            "x-ratelimit-remaining-requests": "0",
+            "x-ratelimit-reset-requests": "17ms",
+            "x-ratelimit-limit-tokens": "90000",
+            "x-ratelimit-remaining-tokens": "89000",
+            "x-ratelimit-reset-tokens": "666ms",
+        }
+    )
+    assert limiter.rpm == 3500
+    assert limiter.tpm == 90000
+    assert 0 < limiter.reserve() < 0.1
+
+
+def test_shared_per_endpoint():
+    RateLimiter.reset_all()
+    limiter = RateLimiter.get("https://api.openai.com/v1", "sk-1", "gpt-4", rpm=10)
+    assert RateLimiter.get("https://api.openai.com/v1", "sk-1", "gpt-4") is limiter
+    assert RateLimiter.get("https://api.openai.com/v1", "sk-2", "gpt-4") is not limiter
+    RateLimiter.reset_all()
+
+
+@pytest.mark.asyncio
+async def test_retries_reuse_the_reservation(mocker):
+    from openai.error import RateLimitError
+
+    from metagpt.provider.openai_api import OpenAIGPTAPI
+
+    RateLimiter.reset_all()
+    attempts = []
+
+    async def acreate(**kwargs):
+        attempts.append(1)
+        if len(attempts) < 3:
+            raise RateLimitError("slow down")
+        return {"choices": [{"index": 0, "message": {"role": "assistant", "content": "ok"}}], "usage": {}}
+
+    mocker.patch("openai.ChatCompletion.acreate", side_effect=acreate)
+    llm = OpenAIGPTAPI()
+    llm._rate_limiter = RateLimiter(rpm=60)
+    mocker.patch.object(llm._rate_limiter, "retry_after", return_value=0)
+    await llm._acreate({"messages": [{"role": "user", "content": "hi"}], "model": "gpt-4"})
+    assert len(attempts) == 3
+    assert llm._rate_limiter.requests.level == pytest.approx(59, abs=0.1)  # charged once, not three times
+    RateLimiter.reset_all()
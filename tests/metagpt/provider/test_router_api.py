@@ -0,0 +1,76 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# @Desc   : the unittest of RouterGPTAPI
+
+import pytest
+from openai.error import InvalidRequestError, RateLimitError
+
+from metagpt.provider.llm_cache import LLMCache
+from metagpt.provider.router_api import RouterGPTAPI
+
+messages = [{"role": "user", "content": "write a haiku about routers"}]
+
+endpoints = [
+    {"name": "primary", "api_key": "sk-primary", "api_base": "https://primary.example.com/v1", "rpm": 0},
+    {"name": "secondary", "api_key": "sk-secondary", "api_base": "https://secondary.example.com/v1", "rpm": 0},
+]
+
+
+def make_resp(content):
+    return {
+        "choices": [{"index": 0, "message": {"role": "assistant", "content": content}}],
+        "usage": {"prompt_tokens": 10, "completion_tokens": 5},
+    }
+
+
+@pytest.fixture(autouse=True)
+def no_cache(mocker):
+    mocker.patch("metagpt.provider.openai_api.get_llm_cache", return_value=LLMCache("unused", mode="off"))
+    mocker.patch("metagpt.provider.singleflight.llm_single_flight.enabled", False)
+
+
+@pytest.mark.asyncio
+async def test_failover_on_rate_limit(mocker):
+    calls = []
+
+    async def acreate(**kwargs):
+        calls.append(kwargs["api_key"])
+        if kwargs["api_key"] == "sk-primary":
+            raise RateLimitError("slow down")
+        return make_resp(kwargs["api_base"])
+
+    mocker.patch("openai.ChatCompletion.acreate", side_effect=acreate)
+    router = RouterGPTAPI(endpoints)
+    for _ in range(4):
+        assert await router.acompletion_text(messages) == "https://secondary.example.com/v1"
+
+    # the failing endpoint is demoted right away instead of being retried on every request
+    assert calls.count("sk-primary") <= 1
+    assert calls.count("sk-secondary") == 4
+
+    primary, secondary = router.endpoints
+    assert secondary.latency is not None
+    for _ in range(3):
+        primary.record_failure()
+    assert not primary.available  # circuit opened after consecutive failures
+
+
+@pytest.mark.asyncio
+async def test_prefers_lower_latency(mocker):
+    mocker.patch("openai.ChatCompletion.acreate", side_effect=lambda **kw: make_resp(kw["api_base"]))
+    router = RouterGPTAPI(endpoints)
+    primary, secondary = router.endpoints
+    primary.record_success(2.0)
+    secondary.record_success(0.1)
+    assert router.select() is secondary
+    secondary.inflight = 100
+    assert router.select() is primary
+
+
+@pytest.mark.asyncio
+async def test_invalid_request_is_not_retried(mocker):
+    acreate = mocker.patch("openai.ChatCompletion.acreate", side_effect=InvalidRequestError("too long", "messages"))
+    router = RouterGPTAPI(endpoints)
+    with pytest.raises(InvalidRequestError):
+        await router.acompletion_text(messages)
+    assert acreate.call_count == 1
@@ -0,0 +1,72 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# @Desc   : the unittest of SingleFlight
+
+import asyncio
+
+import pytest
+
+from metagpt.provider.openai_api import OpenAIGPTAPI
+from metagpt.provider.singleflight import SingleFlight
+
+messages = [{"role": "user", "content": "choose the next state"}]
+
+default_resp = {
+    "choices": [{"index": 0, "message": {"role": "assistant", "content": "0"}}],
+    "usage": {"prompt_tokens": 10, "completion_tokens": 1},
+}
+
+
+@pytest.mark.asyncio
+async def test_concurrent_calls_are_shared():
+    flight = SingleFlight("test")
+    calls = []
+
+    async def fn():
+        calls.append(1)
+        await asyncio.sleep(0.05)
+        return "result"
+
+    results = await asyncio.gather(*[flight.do("key", fn) for _ in range(5)])
+    assert results == ["result"] * 5
+    assert len(calls) == 1
+    assert flight.stats()["shared"] == 4
+    assert flight.hit_rate == pytest.approx(0.8)
+
+    await flight.do("key", fn)  # the first flight has landed, a later call goes out again
+    assert len(calls) == 2
+
+
+@pytest.mark.asyncio
+async def test_exception_and_cancellation():
+    flight = SingleFlight("test")
+
+    async def fail():
+        await asyncio.sleep(0.01)
+        raise ValueError("boom")
+
+    results = await asyncio.gather(flight.do("k", fail), flight.do("k", fail), return_exceptions=True)
+    assert all(isinstance(r, ValueError) for r in results)
+
+    async def slow():
+        await asyncio.sleep(0.05)
+        return "ok"
+
+    first = asyncio.ensure_future(flight.do("s", slow))
+    second = asyncio.ensure_future(flight.do("s", slow))
+    await asyncio.sleep(0.01)
+    first.cancel()
+    assert await second == "ok"
+
+
+@pytest.mark.asyncio
+async def test_openai_identical_requests_coalesce(mocker):
+    async def slow_acreate(*args, **kwargs):
+        await asyncio.sleep(0.05)
+        return default_resp
+
+    acreate = mocker.patch("openai.ChatCompletion.acreate", side_effect=slow_acreate)
+    llm = OpenAIGPTAPI()
+    results = await asyncio.gather(*[llm.acompletion_text(messages) for _ in range(3)])
+    assert results == ["0"] * 3
+    assert acreate.call_count == 1
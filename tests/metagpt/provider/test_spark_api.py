@@ -1,5 +1,12 @@
+import asyncio
+import json
+from types import SimpleNamespace
+
+import aiohttp
+import pytest
+
 from metagpt.logs import logger
-from metagpt.provider.spark_api import SparkAPI
+from metagpt.provider.spark_api import SparkAPI, SparkAPIError
 
 
 def test_message():
@@ -9,3 +16,67 @@ def test_message():
     result = llm.ask('写一篇五百字的日记')
     logger.info(result)
     assert len(result) > 100
+
+
+def frame(content, status, code=0):
+    data = {
+        "header": {"code": code, "message": "error" if code else "Success"},
+        "payload": {"choices": {"status": status, "seq": 0, "text": [{"content": content, "role": "assistant"}]}},
+    }
+    return SimpleNamespace(type=aiohttp.WSMsgType.TEXT, data=json.dumps(data))
+
+
+class FakeWebSocket:
+    def __init__(self, frames, delay=0.0):
+        self.frames = list(frames)
+        self.delay = delay
+        self.sent = []
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *args):
+        pass
+
+    async def send_str(self, data):
+        self.sent.append(json.loads(data))
+
+    async def receive(self, timeout=None):
+        await asyncio.sleep(self.delay)
+        return self.frames.pop(0)
+
+
+def fake_session(make_ws):
+    async def ws_connect(url, **kwargs):
+        return make_ws()
+
+    return SimpleNamespace(ws_connect=ws_connect)
+
+
+@pytest.fixture
+def spark(mocker):
+    mocker.patch.object(SparkAPI, "_create_url", return_value="ws://spark.example.com/v2.1/chat")
+    return SparkAPI()
+
+
+@pytest.mark.asyncio
+async def test_concurrent_streams(mocker, spark):
+    session = fake_session(lambda: FakeWebSocket([frame("你", 1), frame("好", 2)], delay=0.05))
+    mocker.patch("metagpt.provider.spark_api.get_session", return_value=session)
+
+    loop = asyncio.get_running_loop()
+    start = loop.time()
+    results = await asyncio.gather(*[spark.acompletion_text([{"role": "user", "content": "hi"}]) for _ in range(5)])
+    assert results == ["你好"] * 5
+    assert loop.time() - start < 0.5  # requests ran side by side, not one after another
+
+    deltas = [d.content async for d in spark.aask_stream("hi")]
+    assert deltas == ["你", "好"]
+
+
+@pytest.mark.asyncio
+async def test_error_code(mocker, spark):
+    session = fake_session(lambda: FakeWebSocket([frame("", 0, code=10013)]))
+    mocker.patch("metagpt.provider.spark_api.get_session", return_value=session)
+    with pytest.raises(SparkAPIError):
+        await spark.acompletion([{"role": "user", "content": "hi"}])
@@ -0,0 +1,72 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# @Desc   : the unittest of streamed LLM output and sinks
+
+import asyncio
+
+import pytest
+
+from metagpt.provider.llm_cache import LLMCache
+from metagpt.provider.openai_api import OpenAIGPTAPI
+from metagpt.provider.streaming import (
+    CallbackSink,
+    LineSink,
+    StreamSink,
+    publish_stream,
+)
+
+
+async def chunks(*parts, delay=0.0):
+    for part in parts:
+        await asyncio.sleep(delay)
+        yield part
+
+
+class BrokenSink(StreamSink):
+    async def send(self, delta):
+        raise RuntimeError("socket closed")
+
+
+@pytest.mark.asyncio
+async def test_publish_stream_to_sinks():
+    lines = []
+    deltas = []
+    text = await publish_stream(
+        chunks("Hello ", "wor", "ld\nsecond", " line"),
+        sinks=[LineSink(lines.append), CallbackSink(deltas.append), BrokenSink()],
+    )
+    assert text == "Hello world\nsecond line"
+    assert lines == ["Hello world", "second line"]
+    assert [d.index for d in deltas] == [0, 1, 2, 3]
+    assert all(d.time_to_first_token == deltas[0].elapsed for d in deltas)
+
+
+@pytest.mark.asyncio
+async def test_slow_sink_applies_backpressure():
+    received = []
+
+    async def slow(delta):
+        await asyncio.sleep(0.01)
+        received.append(delta.content)
+
+    parts = [str(i) for i in range(20)]
+    assert await publish_stream(chunks(*parts), sinks=[CallbackSink(slow)]) == "".join(parts)
+    assert received == parts  # nothing is dropped, the producer waited for the sink
+
+
+@pytest.mark.asyncio
+async def test_openai_aask_stream(mocker):
+    mocker.patch("metagpt.provider.openai_api.get_llm_cache", return_value=LLMCache("unused", mode="off"))
+
+    async def stream(**kwargs):
+        async def gen():
+            for part in ["def ", "hello", "():"]:
+                yield {"choices": [{"index": 0, "delta": {"content": part}}]}
+
+        return gen()
+
+    mocker.patch("openai.ChatCompletion.acreate", side_effect=stream)
+    llm = OpenAIGPTAPI()
+    deltas = [delta async for delta in llm.aask_stream("write hello")]
+    assert "".join(d.content for d in deltas) == "def hello():"
+    assert deltas[0].time_to_first_token is not None
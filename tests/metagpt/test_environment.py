@@ -6,9 +6,12 @@
 @File    : test_environment.py
 """
 
+import asyncio
+
 import pytest
 
-from metagpt.actions import BossRequirement
+from metagpt.actions import BossRequirement, WriteDesign, WritePRD, WriteTasks
+from metagpt.config import CONFIG
 from metagpt.environment import Environment
 from metagpt.logs import logger
 from metagpt.manager import Manager
@@ -54,3 +57,55 @@ async def test_publish_and_process_message(env: Environment):
     await env.run(k=2)
     logger.info(f"{env.history=}")
     assert len(env.history) > 10
+
+
+class Relay(Role):
+    """Passes on what it observes, caused by its own action"""
+
+    def __init__(self, profile, watch, action):
+        super().__init__(profile=profile)
+        self._watch([watch])
+        self.action = action
+        self.runs = 0
+
+    async def run(self, message=None):
+        self.runs += 1
+        if await self._observe():
+            await asyncio.sleep(0.01)
+            self._publish_message(Message(content=self.profile, role=self.profile, cause_by=self.action))
+
+
+@pytest.mark.asyncio
+async def test_publish_wakes_subscribers_only(env: Environment, monkeypatch):
+    monkeypatch.setattr(CONFIG, "long_term_memory", False)
+    pm, architect = Relay("PM", BossRequirement, WritePRD), Relay("Architect", WritePRD, WriteDesign)
+    env.add_roles([pm, architect])
+    await env.run()  # new roles observe once
+    assert (pm.runs, architect.runs) == (1, 1)
+
+    env.publish_message(Message(content="idea", cause_by=BossRequirement))
+    await env.run()
+    assert (pm.runs, architect.runs) == (2, 1)
+    await env.run()
+    assert (pm.runs, architect.runs) == (2, 2)
+    await env.run()
+    assert (pm.runs, architect.runs) == (2, 2)  # nothing published, nobody runs
+
+    env.publish_message(Message(content="ping", send_to="Architect"))
+    await env.run()
+    assert (pm.runs, architect.runs) == (2, 3)
+
+
+@pytest.mark.asyncio
+async def test_run_continuously(env: Environment, monkeypatch):
+    monkeypatch.setattr(CONFIG, "long_term_memory", False)
+    roles = [Relay("PM", BossRequirement, WritePRD), Relay("Architect", WritePRD, WriteDesign)]
+    roles += [Relay(f"Reviewer{i}", WriteDesign, WriteTasks) for i in range(3)]
+    env.add_roles(roles)
+    env.publish_message(Message(content="idea", cause_by=BossRequirement))
+
+    runs = await env.run_continuously()
+    assert [m.content for m in env.memory.get()][:3] == ["idea", "PM", "Architect"]
+    assert env.memory.count() == 6
+    assert runs == sum(role.runs for role in roles)
+    assert await env.run_continuously() == 0
@@ -0,0 +1,44 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# @Desc   : unittest of `metagpt/jbrunner.py`, a run in a process worker approved through the scheduler
+
+import tempfile
+import time
+
+from metagpt.jbrunner import run_team
+from metagpt.jbteam import Team
+from metagpt.product_config import PRODUCT_CONFIG
+from metagpt.utils.run_scheduler import RunScheduler, RunStatus
+
+
+def wait_until(condition, timeout: float = 60):
+    deadline = time.time() + timeout
+    while not condition():
+        assert time.time() < deadline, "timed out"
+        time.sleep(0.05)
+
+
+def test_run_team_approved_through_the_scheduler():
+    from jbbench import EMAIL, FIXTURES, IDEA, mock_llm_config
+
+    with tempfile.TemporaryDirectory() as workspace, mock_llm_config(
+        mock_llm=True, mock_llm_fixtures=FIXTURES, workspace_root=workspace, long_term_memory=False
+    ):
+        Team.create_project(email=EMAIL, product_name="worker", idea=IDEA)
+        scheduler = RunScheduler(workers="process")  # the workers are forked with the mock configured
+        try:
+            run = scheduler.submit(EMAIL, "worker", run_team, EMAIL, "worker", investment=1e6)
+            wait_until(lambda: run.info.get("Waiting"))
+            assert run.info["Stage"] == "Requirements" and run.status is RunStatus.RUNNING
+            assert scheduler.answer(run.run_id, "yes")
+            assert not scheduler.answer(run.run_id, "yes")  # answered already
+
+            assert scheduler.wait(run.run_id, timeout=60).status is RunStatus.COMPLETE, run.error
+            assert run.info["Waiting"] is False and 0 < run.info["balance"] < 1e6
+        finally:
+            scheduler.shutdown()
+
+        team = Team(product_name="worker")
+        team.load_product_config(email=EMAIL)
+        with team.context.activate():
+            assert (PRODUCT_CONFIG.product_root / "docs" / "prd.md").exists()
@@ -5,10 +5,39 @@
 @Author  : alexanderwu
 @File    : test_role.py
 """
+import pytest
+
+from metagpt.actions import BossRequirement, WritePRD
+from metagpt.config import CONFIG
+from metagpt.environment import Environment
 from metagpt.roles import Role
+from metagpt.schema import Message
 
 
 def test_role_desc():
     i = Role(profile='Sales', desc='Best Seller')
     assert i.profile == 'Sales'
     assert i._setting.desc == 'Best Seller'
+
+
+@pytest.mark.asyncio
+async def test_role_observes_incrementally(monkeypatch):
+    monkeypatch.setattr(CONFIG, "long_term_memory", False)
+    env = Environment()
+    role = Role(profile='Architect')
+    role._watch([WritePRD])
+    env.add_role(role)
+
+    env.publish_message(Message(content='idea', cause_by=BossRequirement))
+    env.publish_message(Message(content='prd', cause_by=WritePRD))
+    assert await role._observe() == 1
+    assert role._rc.memory.count() == 2
+
+    env.publish_message(Message(content='prd v2', cause_by=WritePRD))
+    news, cursor = env.memory.since(role._rc.env_cursor)
+    assert [m.content for m in news] == ['prd v2']
+    assert await role._observe() == 1 and role._rc.news[0].content == 'prd v2'
+    assert await role._observe() == 0
+
+    role._rc.memory.clear()  # e.g. a rejected approval, everything watched is news again
+    assert await role._observe() == 2
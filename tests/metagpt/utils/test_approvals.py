@@ -0,0 +1,58 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# @Desc   : unittest of `metagpt/utils/approvals.py` and of approvals awaited by HumanProvider
+
+import asyncio
+import threading
+
+from metagpt.config import CONFIG
+from metagpt.provider.human_provider import HumanProvider
+from metagpt.utils.approvals import Approvals
+
+APPROVED = '[CONTENT]{ "Approval Response": "yes" }[/CONTENT]'
+REJECTED = '[CONTENT]{ "Approval Response": "no" }[/CONTENT]'
+
+
+def test_resolve_from_another_thread():
+    approvals = Approvals()
+    ticks = []
+
+    async def other_role():
+        while len(ticks) < 5:
+            ticks.append(len(ticks))
+            await asyncio.sleep(0.01)
+
+    async def main():
+        future = approvals.request("run1")
+        assert approvals.waiting("run1") and not approvals.resolve("run2", "yes")
+        threading.Timer(0.05, approvals.resolve, ("run1", "yes")).start()
+        response, _ = await asyncio.gather(future, other_role())
+        return response
+
+    assert asyncio.run(main()) == "yes"
+    assert ticks == list(range(5))  # the loop went on while the approval was pending
+    assert not approvals.waiting("run1") and not approvals.resolve("run1", "no")
+
+
+def test_human_provider_awaits_callback(monkeypatch):
+    approvals = Approvals()
+    llm = HumanProvider()
+    llm.set_callback(lambda action, stage: approvals.request(stage))
+
+    async def approve_later():
+        while not approvals.waiting("Design"):
+            await asyncio.sleep(0)
+        approvals.resolve("Design", "y")
+
+    async def main():
+        return await asyncio.gather(llm.aask("Approve?", ["Design"]), approve_later())
+
+    assert asyncio.run(main())[0] == APPROVED
+
+    monkeypatch.setattr(CONFIG, "approval_timeout", 0.05)
+    assert asyncio.run(llm.aask("Approve?", ["Design"])) == REJECTED
+    assert not approvals.waiting("Design")  # the request was withdrawn
+
+    llm.set_callback(lambda action, stage: "yes")  # answers at once, as jbbench does
+    assert asyncio.run(llm.aask("Approve?", ["Design"])) == APPROVED
+    assert asyncio.run(llm.aask("Approve?", ["Design", True])) == APPROVED
@@ -0,0 +1,66 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# @Desc   : the unittest of the pipeline profiler and the offline jbteam benchmark
+
+import asyncio
+import inspect
+import time
+
+from metagpt.utils.benchmark import FRAMEWORK, Profiler, compare_reports, median_report
+
+
+class Work:
+    @classmethod
+    def parse(cls, seconds):
+        time.sleep(seconds)
+        return cls.read(seconds)
+
+    @classmethod
+    def read(cls, seconds):
+        time.sleep(seconds)
+        return "done"
+
+    async def ask(self, seconds):
+        await asyncio.sleep(seconds)
+        return self.parse(seconds)
+
+
+def test_profiler_books_exclusive_time():
+    profiler = Profiler()
+    profiler.probe(Work, "ask", "llm")
+    profiler.probe(Work, "parse", "parsing")
+    profiler.probe(Work, "read", "file_io")
+    with profiler:
+        profiler.start_stage("Requirements")
+        assert asyncio.run(Work().ask(0.02)) == "done"
+        profiler.start_stage("Design")
+        time.sleep(0.02)
+    report = profiler.report()
+
+    requirements = report["stages"]["Requirements"]
+    assert requirements["calls"] == {"file_io": 1, "llm": 1, "parsing": 1}
+    for category in ["llm", "parsing", "file_io"]:
+        assert 0.02 <= requirements["categories"][category] < 0.04
+    assert report["stages"]["Design"]["categories"][FRAMEWORK] >= 0.02
+    assert report["total"]["llm"] == requirements["categories"]["llm"]
+    assert isinstance(inspect.getattr_static(Work, "parse"), classmethod)  # the probes are gone
+
+
+def test_compare_and_median():
+    runs = [{"wall": 1.0, "calls": {"llm": 5}}, {"wall": 3.0, "calls": {"llm": 5}}, {"wall": 2.0, "calls": {"llm": 5}}]
+    baseline = median_report(runs)
+    assert baseline == {"wall": 2.0, "calls": {"llm": 5}}
+    assert compare_reports({"wall": 2.3, "calls": {"llm": 5}}, baseline) == []
+    regressions = compare_reports({"wall": 3.0, "calls": {"llm": 7}}, baseline)
+    assert [r.split(":")[0] for r in regressions] == ["wall", "calls.llm"]
+    assert compare_reports({"wall": 0.03}, {"wall": 0.01}) == []  # below the absolute noise floor
+
+
+def test_jbteam_benchmark_offline():
+    from jbbench import STAGE_LIST, benchmark
+
+    report = benchmark(repeat=1)
+    assert list(report["stages"]) == STAGE_LIST  # the pipeline runs end to end
+    for stage, entry in report["stages"].items():
+        assert entry["calls"].get("llm", 0) > 0, f"no LLM work booked to {stage}"
+    assert report["peak_rss_mb"] > 0
@@ -0,0 +1,76 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# @Desc   : unittest of `metagpt/utils/blob_store.py`
+
+import pickle
+import shutil
+
+import pytest
+
+from metagpt.config import CONFIG
+from metagpt.schema import Message
+from metagpt.utils.blob_store import BlobStore, open_blob_store, set_blob_store
+
+
+def test_blob_store_dedupes(tmp_path):
+    store = BlobStore(tmp_path, cache_size=1)
+    ref = store.put("print('hello')\n" * 10)
+    assert store.put("print('hello')\n" * 10) == ref
+    assert len(list(tmp_path.rglob("*"))) == 2  # a fan-out directory and one file
+    store.put("other")  # pushes the first body out of the memory cache
+    assert store.get(ref.digest) == "print('hello')\n" * 10
+    assert ref.digest in store and "0" * 64 not in store
+    with pytest.raises(ValueError):
+        store.get("../secret")
+    with pytest.raises(FileNotFoundError):
+        store.get("0" * 64)
+
+
+def test_blob_store_zstd(tmp_path):
+    pytest.importorskip("zstandard")
+    text = "def f():\n    return 1\n" * 100
+    ref = BlobStore(tmp_path, compression="zstd").put(text)
+    path = next(tmp_path.rglob("*.zst"))
+    assert path.stat().st_size < len(text)
+    assert BlobStore(tmp_path).get(ref.digest) == text  # readable whatever the configured compression
+
+
+def test_message_offload(tmp_path, monkeypatch):
+    code = "import os\n" * 1000
+    plain = Message(content=code, role="Engineer")
+    monkeypatch.setattr(CONFIG, "message_blob_threshold", 1024)
+    monkeypatch.setattr(CONFIG, "message_blob_path", tmp_path)
+    set_blob_store(None)
+    try:
+        message = Message(content=code, role="Engineer")
+        assert message.blob is not None and message.blob.size == len(code)
+        assert message.content == code and message.id == plain.id
+        assert Message(content="short").blob is None
+
+        data = pickle.dumps(message)
+        assert len(data) < len(code) / 10
+        set_blob_store(None)  # a fresh process: nothing cached, the body is read from disk when needed
+        loaded = pickle.loads(data)
+        assert loaded.blob == message.blob and loaded.content == code
+        assert open_blob_store(tmp_path).get(message.blob.digest) == code
+    finally:
+        set_blob_store(None)
+
+
+def test_ref_resolves_against_the_configured_store(tmp_path, monkeypatch):
+    code = "import sys\n" * 1000
+    monkeypatch.setattr(CONFIG, "message_blob_threshold", 1024)
+    monkeypatch.setattr(CONFIG, "message_blob_path", tmp_path / "old")
+    set_blob_store(None)
+    try:
+        data = pickle.dumps(Message(content=code, role="Engineer"))
+        shutil.move(tmp_path / "old", tmp_path / "new")  # e.g. the workspace moved to another machine
+        monkeypatch.setattr(CONFIG, "message_blob_path", tmp_path / "new")
+        set_blob_store(None)
+        assert pickle.loads(data).content == code
+
+        shutil.move(tmp_path / "new", tmp_path / "old")  # not in the configured store: where it was written
+        set_blob_store(None)
+        assert pickle.loads(data).content == code
+    finally:
+        set_blob_store(None)
@@ -0,0 +1,109 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# @Desc   : unittest of `metagpt/utils/checkpoint.py` and of resuming a jbteam run from a checkpoint
+
+import asyncio
+import pickle
+import tempfile
+
+from metagpt.actions import BossRequirement, WriteJBPRD, WritePRD
+from metagpt.config import CONFIG
+from metagpt.environment import Environment
+from metagpt.product_config import PRODUCT_CONFIG
+from metagpt.roles import JBEngineer, Role
+from metagpt.schema import Message
+from metagpt.utils.checkpoint import restore_checkpoint, take_checkpoint
+
+
+def hire(env: Environment):
+    pm = Role(profile="PM")
+    pm._init_actions([WritePRD])
+    pm._watch([BossRequirement])
+    engineer = JBEngineer()
+    env.add_roles([pm, engineer])
+    return pm, engineer
+
+
+def test_checkpoint_round_trip(monkeypatch):
+    monkeypatch.setattr(CONFIG, "long_term_memory", False)
+    env = Environment()
+    pm, engineer = hire(env)
+    idea = Message(content="idea", cause_by=BossRequirement)
+    env.publish_message(idea)
+    asyncio.run(pm._observe())
+    draft = Message(content="private draft", role="PM", cause_by=WritePRD)
+    pm._rc.memory.add(draft)
+    pm._set_state(0)
+    engineer.todos = ["main.py", "app.py"]
+    env.publish_message(Message(content="prd", cause_by=WritePRD))
+
+    checkpoint = pickle.loads(pickle.dumps(take_checkpoint(env, stage="Design")))
+    assert checkpoint["messages"] == 2 and checkpoint["stage"] == "Design"
+    assert checkpoint["roles"]["PM"]["memory"][0] == [0, 1]  # environment messages by position
+
+    env = Environment()
+    pm, engineer = hire(env)
+    messages = [idea, Message(content="prd", cause_by=WritePRD)]
+    restore_checkpoint(env, checkpoint, messages)
+    assert [m.content for m in pm._rc.memory.get()] == ["idea", "private draft"]
+    assert pm._rc.state == 0 and isinstance(pm._rc.todo, WritePRD)
+    assert engineer.todos == ["main.py", "app.py"]
+    assert asyncio.run(pm._observe()) == 0  # "idea" was observed before the checkpoint
+    assert pm._rc.memory.count() == 3
+
+
+def test_jbteam_resume():
+    from jbbench import FIXTURES, hire_team, mock_llm_config
+
+    async def run(end_stage, resume=False):
+        team = hire_team("resume")
+        team.invest(1e6)
+        team.start_project("resume", stage="Requirements", end_stage=end_stage)
+        await team.run(start_stage="Requirements", end_stage=end_stage, resume=resume)
+        return [m.cause_by for m in team.environment.memory.get()]
+
+    with tempfile.TemporaryDirectory() as workspace, mock_llm_config(
+        mock_llm=True, mock_llm_fixtures=FIXTURES, workspace_root=workspace, long_term_memory=False
+    ):
+        first = asyncio.run(run("Requirements"))
+        assert first.count(WriteJBPRD) == 1
+        resumed = asyncio.run(run("Design", resume=True))
+        assert resumed[: len(first)] == first
+        assert resumed.count(BossRequirement) == 1 and resumed.count(WriteJBPRD) == 1  # nothing done twice
+        assert len(resumed) > len(first)
+
+
+def test_jbteam_resume_after_get_project(monkeypatch):
+    from jbbench import FIXTURES, hire_team, mock_llm_config
+
+    prds = []
+    write_prd = WriteJBPRD.run
+
+    async def counted(self, *args, **kwargs):
+        prds.append(1)
+        return await write_prd(self, *args, **kwargs)
+
+    monkeypatch.setattr(WriteJBPRD, "run", counted)
+
+    async def run(team, end_stage, resume=False):
+        team.invest(1e6)
+        team.start_project("opened", stage="Requirements", end_stage=end_stage)
+        await team.run(start_stage="Requirements", end_stage=end_stage, resume=resume)
+
+    with tempfile.TemporaryDirectory() as workspace, mock_llm_config(
+        mock_llm=True, mock_llm_fixtures=FIXTURES, workspace_root=workspace, long_term_memory=False
+    ):
+        asyncio.run(run(hire_team("opened"), "Requirements"))
+        assert prds == [1]
+
+        team = hire_team("opened")  # as jbcode does: get_project, then run_project
+        with team.context.activate():
+            root = PRODUCT_CONFIG.product_root
+        history = (root / "history.log").read_bytes()
+        assert (root / "checkpoint.pickle").exists()
+        assert "prd" in team.get_project()
+        assert (root / "history.log").read_bytes() == history and (root / "checkpoint.pickle").exists()
+        assert team.environment._event_log is None
+
+        asyncio.run(run(team, "Design", resume=True))
+        assert prds == [1]  # resumed from the checkpoint, the PRD was not written again
@@ -0,0 +1,86 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# @Desc   : unittest of `metagpt/utils/event_log.py`
+
+import pytest
+
+from metagpt.actions import BossRequirement, WritePRD
+from metagpt.actions.action_output import ActionOutput
+from metagpt.environment import Environment
+from metagpt.schema import Message
+from metagpt.utils.event_log import (
+    HEADER,
+    EventLog,
+    EventLogError,
+    migrate_history,
+    read_events,
+)
+from metagpt.utils.serialize import serialize_message
+
+
+def make_messages():
+    ic_obj = ActionOutput.create_model_class("prd", {"field1": (str, ...)})
+    return [
+        Message(role="Human", content="idea", cause_by=BossRequirement),
+        Message(role="PM", content="prd", instruct_content=ic_obj(field1="a"), cause_by=WritePRD),
+    ]
+
+
+def test_append_and_read(tmp_path):
+    path = tmp_path / "history.log"
+    messages = make_messages()
+    log = EventLog(path)
+    for message in messages:
+        log.append(message)
+    log.close()
+    loaded = list(read_events(path))
+    assert loaded == messages
+    assert loaded[1].instruct_content.dict() == {"field1": "a"}
+
+    log.rewrite(messages[:1])
+    assert list(read_events(path)) == messages[:1]
+
+
+def test_torn_record_is_dropped(tmp_path):
+    path = tmp_path / "history.log"
+    log = EventLog(path)
+    first, second = make_messages()
+    log.append(first)
+    log.close()
+    with open(path, "ab") as f:  # a crash in the middle of the second append
+        f.write(b"\x00\x00\x10\x00partial")
+    assert list(read_events(path)) == [first]
+
+    log.append(second)
+    log.close()
+    assert list(read_events(path)) == [first, second]
+
+
+def test_header_is_checked(tmp_path):
+    path = tmp_path / "history.log"
+    path.write_bytes(b"[b'not a log']")
+    with pytest.raises(EventLogError):
+        list(read_events(path))
+    path.write_bytes(HEADER.pack(b"MGPTLOG", 99))
+    with pytest.raises(EventLogError):
+        list(read_events(path))
+
+
+def test_migrate_history(tmp_path):
+    messages = make_messages()
+    legacy = tmp_path / "history.pickle"
+    legacy.write_text(str([serialize_message(m) for m in messages]))
+    output = migrate_history(str(legacy))
+    assert output == tmp_path / "history.log"
+    assert list(read_events(output)) == messages
+
+
+def test_environment_logs_published_messages(tmp_path):
+    env = Environment()
+    env.set_event_log(EventLog(tmp_path / "history.log"))
+    first, second = make_messages()
+    env.publish_message(first)
+    env.publish_message(first)
+    env.publish_message(second)
+    assert list(read_events(tmp_path / "history.log")) == [first, second]  # readable while the run goes on
+    env.set_event_log(None)
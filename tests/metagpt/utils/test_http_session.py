@@ -0,0 +1,50 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# @Desc   : the unittest of the shared http session registry
+
+import asyncio
+
+import pytest
+
+from metagpt.provider import rate_limiter  # noqa: F401, registers its trace hook
+from metagpt.utils.http_session import (
+    _close_leftover_sessions,
+    close_sessions,
+    get_session,
+)
+
+
+@pytest.mark.asyncio
+async def test_one_session_per_loop():
+    session = get_session()
+    assert get_session() is session
+    assert session.connector.limit_per_host > 0
+    assert session.trace_configs  # the rate limiter sees the response headers
+
+    async def other_loop_session():
+        s = get_session()
+        await close_sessions()
+        return s
+
+    other = await asyncio.get_running_loop().run_in_executor(None, asyncio.run, other_loop_session())
+    assert other is not session
+    assert other.closed
+
+    await close_sessions()
+    assert session.closed
+    assert get_session() is not session
+    await close_sessions()
+
+
+def test_leftover_sessions_closed_at_exit():
+    loop = asyncio.new_event_loop()
+
+    async def leave_open():
+        return get_session()
+
+    try:
+        session = loop.run_until_complete(leave_open())
+        _close_leftover_sessions()  # run at exit, on the loop the session was registered for
+        assert session.closed
+    finally:
+        loop.close()
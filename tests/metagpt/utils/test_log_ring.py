@@ -0,0 +1,70 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# @Desc   : unittest of `metagpt/utils/log_ring.py`
+
+import threading
+
+from metagpt.utils.log_ring import LogRing
+
+
+def test_readers_page_independently():
+    ring = LogRing(capacity=100)
+    for i in range(10):
+        ring.write(f"line {i}", run_id="a" if i % 2 else "b")
+    assert ring.last_seq == 10
+
+    first, more = ring.read(0, max_lines=4)
+    assert [r.seq for r in first] == [1, 2, 3, 4] and more
+    rest, more = ring.read(first[-1].seq, max_lines=100)
+    assert [r.seq for r in rest] == list(range(5, 11)) and not more
+
+    other, more = ring.read(0, max_lines=3)  # nothing was consumed by the first reader
+    assert [r.text for r in other] == ["line 0", "line 1", "line 2"] and more
+
+    runs, more = ring.read(4, run_id="a")
+    assert [r.seq for r in runs] == [6, 8, 10] and not more
+    assert ring.read(10) == ([], False)
+
+
+def test_bounded_memory_and_spill(tmp_path):
+    ring = LogRing(capacity=5)
+    for i in range(20):
+        ring.write(f"line {i}")
+    records, more = ring.read(0, max_lines=100)
+    assert [r.seq for r in records] == list(range(16, 21)) and not more  # the older ones are lost
+
+    spill = tmp_path / "logs" / "runs.jsonl"
+    ring = LogRing(capacity=5, spill_path=spill, spill_max_bytes=1000)
+    for i in range(50):
+        ring.write(f"line {i}", level="DEBUG")
+    assert len(ring._records) == 5
+    assert spill.stat().st_size < 1000 and spill.with_name("runs.jsonl.1").exists()
+
+    tail, _ = ring.read(0, max_lines=100)
+    kept = [r.seq for r in tail]
+    assert kept[-5:] == list(range(46, 51)) and kept == list(range(kept[0], 51))  # from the spill, then the ring
+    page, more = ring.read(kept[0], max_lines=3)
+    assert [r.seq for r in page] == kept[1:4] and more and page[0].level == "DEBUG"
+    ring.close()
+
+    restarted = LogRing(capacity=5, spill_path=spill)  # a new process numbers from 1 again
+    restarted.write("first")
+    assert [r.text for r in restarted.read(0)[0]] == ["first"]
+    restarted.close()
+
+
+def test_concurrent_writers():
+    ring = LogRing(capacity=10000)
+
+    def write(name):
+        for i in range(500):
+            ring.write(f"{name} {i}", run_id=name)
+
+    threads = [threading.Thread(target=write, args=(f"run{n}",)) for n in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    records, _ = ring.read(0, max_lines=10000)
+    assert [r.seq for r in records] == list(range(1, 2001))
+    assert [r.text for r in ring.read(0, max_lines=1000, run_id="run2")[0]] == [f"run2 {i}" for i in range(500)]
@@ -0,0 +1,77 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# @Desc   : unittest of `metagpt/utils/run_context.py`
+
+import asyncio
+import tempfile
+
+from metagpt.config import CONFIG
+from metagpt.product_config import PRODUCT_CONFIG
+from metagpt.provider.openai_api import CostManager
+from metagpt.utils.run_context import RunContext, current_context
+
+
+def test_scoped_attributes(monkeypatch):
+    monkeypatch.setattr(CONFIG, "max_budget", 10.0)
+    ctx = RunContext()
+    with ctx.activate():
+        assert current_context() is ctx
+        assert CONFIG.max_budget == 10.0 and CONFIG.total_cost == 0.0  # settings inherited, state starts over
+        CONFIG.max_budget = 3.0
+        CONFIG.openai_api_model = "gpt-3.5-turbo"
+        with RunContext(ctx).activate():
+            assert CONFIG.max_budget == 3.0
+            CONFIG.max_budget = 1.0
+        assert CONFIG.max_budget == 3.0
+    assert current_context() is None
+    assert CONFIG.max_budget == 10.0 and CONFIG.openai_api_model != "gpt-3.5-turbo"
+    with ctx.activate():
+        assert CONFIG.openai_api_model == "gpt-3.5-turbo"
+
+
+def test_concurrent_contexts():
+    async def run(budget, tokens):
+        with RunContext().activate():
+            CONFIG.max_budget = budget
+            PRODUCT_CONFIG.product_name = f"product{tokens}"
+            for _ in range(3):
+                CostManager().update_cost(tokens, tokens, "gpt-3.5-turbo")
+                await asyncio.sleep(0)
+            await asyncio.gather(*(asyncio.sleep(0) for _ in range(2)))  # tasks see their parent's context
+            return CONFIG.max_budget, PRODUCT_CONFIG.product_name, CostManager().total_prompt_tokens, CONFIG.total_cost
+
+    async def main():
+        return await asyncio.gather(run(1.0, 100), run(2.0, 200))
+
+    before = CostManager().total_prompt_tokens
+    first, second = asyncio.run(main())
+    assert first[:3] == (1.0, "product100", 300) and second[:3] == (2.0, "product200", 600)
+    assert second[3] == 2 * first[3] > 0
+    assert CostManager().total_prompt_tokens == before
+
+
+def test_concurrent_teams():
+    from jbbench import FIXTURES, hire_team, mock_llm_config
+
+    async def run(product_name):
+        team = hire_team(product_name)
+        team.invest(1e6)
+        team.start_project(product_name, stage="Requirements", end_stage="Requirements")
+        await team.run(start_stage="Requirements", end_stage="Requirements")
+        return team
+
+    async def main():
+        return await asyncio.gather(run("first"), run("second"))
+
+    total_cost = CONFIG.total_cost
+    with tempfile.TemporaryDirectory() as workspace, mock_llm_config(
+        mock_llm=True, mock_llm_fixtures=FIXTURES, workspace_root=workspace, long_term_memory=False
+    ):
+        teams = asyncio.run(main())
+        for team in teams:
+            assert team.get_balance() > 0
+            assert team.has_history()
+            with team.context.activate():
+                assert PRODUCT_CONFIG.product_name == team.product_name
+                assert (PRODUCT_CONFIG.product_root / "docs" / "prd.md").exists()
+    assert CONFIG.total_cost == total_cost  # the process-wide cost is not what the teams spent
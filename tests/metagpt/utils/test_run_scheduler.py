@@ -0,0 +1,141 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# @Desc   : unittest of `metagpt/utils/run_scheduler.py`
+
+import asyncio
+import threading
+
+import pytest
+
+from metagpt.logs import logger
+from metagpt.utils.run_scheduler import (
+    RunScheduler,
+    RunStatus,
+    current_run_id,
+    report,
+    report_log,
+)
+
+
+async def job(name: str, started: list, gate: threading.Event = None):
+    started.append(name)
+    while gate is not None and not gate.is_set():
+        await asyncio.sleep(0.01)
+    return name
+
+
+async def square(x: int) -> int:
+    return x * x
+
+
+async def reporting(x: int) -> str:
+    report(stage="Design")
+    logger.info(f"working on {x}")
+    report_log("streamed", level="STREAM")
+    return current_run_id()
+
+
+@pytest.fixture
+def scheduler():
+    schedulers = []
+
+    def make(**kwargs):
+        schedulers.append(RunScheduler(**kwargs))
+        return schedulers[-1]
+
+    yield make
+    for s in schedulers:
+        s.shutdown()
+
+
+def test_priority_and_fair_share(scheduler):
+    s = scheduler(max_runs=1, max_runs_per_user=2)
+    started, gate = [], threading.Event()
+    blocker = s.submit("a", "p0", job, "blocker", started, gate)
+    runs = [
+        s.submit("a", "p1", job, "a1", started),
+        s.submit("a", "p2", job, "a2", started),
+        s.submit("b", "p1", job, "b1", started),
+        s.submit("c", "p1", job, "c1", started, priority=1),
+    ]
+    assert blocker.status is RunStatus.RUNNING and all(r.status is RunStatus.QUEUED for r in runs)
+    gate.set()
+    for run in runs:
+        assert s.wait(run.run_id, timeout=5).status is RunStatus.COMPLETE
+    assert started == ["blocker", "c1", "b1", "a1", "a2"]  # b was not served yet, a was
+    assert runs[0].result == "a1"
+
+
+def test_limits(scheduler):
+    s = scheduler(max_runs=3, max_runs_per_user=1)
+    started, gate = [], threading.Event()
+    a1 = s.submit("a", "p1", job, "a1", started, gate)
+    a2 = s.submit("a", "p2", job, "a2", started, gate)
+    b1 = s.submit("b", "p1", job, "b1", started, gate)
+    b1_again = s.submit("b", "p1", job, "b1 again", started, gate)
+    assert [r.status for r in (a1, a2, b1, b1_again)] == [RunStatus.RUNNING, RunStatus.QUEUED] + [
+        RunStatus.RUNNING,
+        RunStatus.QUEUED,
+    ]
+    assert s.active("b", "p1") is b1 and s.active("c", "p1") is None
+    gate.set()
+    assert s.wait(b1_again.run_id, timeout=5).status is RunStatus.COMPLETE
+    assert s.wait(a2.run_id, timeout=5).status is RunStatus.COMPLETE
+    assert [r.run_id for r in s.runs(user="a")] == [a1.run_id, a2.run_id]
+
+
+def test_cancel_and_failure(scheduler):
+    s = scheduler(max_runs=1)
+    started, gate = [], threading.Event()
+    running = s.submit("a", "p1", job, "running", started, gate)
+    queued = s.submit("b", "p1", job, "queued", started, gate)
+    assert s.cancel(queued.run_id) and queued.status is RunStatus.CANCELLED
+    assert s.cancel(running.run_id) and s.wait(running.run_id, timeout=5).status is RunStatus.CANCELLED
+    assert not s.cancel(running.run_id) and not s.cancel("unknown")
+
+    async def fail():
+        raise ValueError("boom")
+
+    failed = s.submit("a", "p1", fail)
+    assert s.wait(failed.run_id, timeout=5).status is RunStatus.FAILED and "ValueError: boom" in failed.error
+
+
+def test_run_identity(scheduler):
+    s = scheduler()
+    records = []
+    sink = logger.add(lambda message: records.append(message.record["extra"].get("run_id")), level="INFO")
+
+    async def whoami():
+        logger.info("working")
+        await asyncio.sleep(0)
+        return current_run_id()
+
+    try:
+        run = s.submit("a", "p1", whoami)
+        assert s.wait(run.run_id, timeout=5).result == run.run_id
+    finally:
+        logger.remove(sink)
+    assert run.run_id in records
+    assert current_run_id() is None
+
+
+def test_process_workers(scheduler):
+    s = scheduler(max_runs=2, workers="process")
+    runs = [s.submit(f"user{i}", "p1", square, i) for i in range(3)]
+    assert [s.wait(r.run_id, timeout=60).result for r in runs] == [0, 1, 4]
+
+
+@pytest.mark.parametrize("workers", ["asyncio", "process"])
+def test_reports_reach_the_scheduler(scheduler, workers):
+    lines = []
+    s = scheduler(workers=workers, on_log=lambda run_id, text, level, created: lines.append((run_id, level, text)))
+    finished = []
+    run = s.submit("a", "p1", reporting, 7)
+    s.add_done_callback(run.run_id, finished.append)
+    assert s.wait(run.run_id, timeout=60).result == run.run_id
+    assert run.info == {"stage": "Design"} and finished == [run]
+    assert (run.run_id, "STREAM", "streamed") in lines
+    # records logged in a process worker are sent along, those of this process are left to its own sinks
+    assert any(level == "INFO" and text.endswith("working on 7") for _, level, text in lines) == (workers == "process")
+    s.add_done_callback(run.run_id, finished.append)
+    assert finished == [run, run]
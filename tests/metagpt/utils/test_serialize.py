@@ -64,3 +64,16 @@ def test_serialize_and_deserialize_message():
     assert new_message.content == message.content
     assert new_message.cause_by == message.cause_by
     assert new_message.instruct_content.field1 == out_data["field1"]
+
+
+def test_model_classes_are_cached():
+    out_mapping = {"field1": (str, ...), "field2": (List[str], ...)}
+    ic_obj = ActionOutput.create_model_class("prd", out_mapping)
+    assert ActionOutput.create_model_class("prd", dict(out_mapping)) is ic_obj
+    assert ActionOutput.create_model_class("prd", {"field1": (str, ...)}) is not ic_obj
+
+    message = Message(content="prd demand", instruct_content=ic_obj(field1="a", field2=["b"]), cause_by=WritePRD)
+    first, second = [deserialize_message(serialize_message(message)) for _ in range(2)]
+    cls = type(first.instruct_content)
+    assert isinstance(second.instruct_content, cls)
+    assert message.instruct_content.field1 == "a"  # the original is left alone
@@ -0,0 +1,100 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# @Desc   : unittest of `metagpt/utils/speculation.py` through Team.run(speculate=True)
+
+import asyncio
+import tempfile
+
+import pytest
+
+from metagpt.actions import WriteJBDesign, WriteProductApproval
+from metagpt.product_config import PRODUCT_CONFIG
+from metagpt.utils.approvals import Approvals
+from metagpt.utils.speculation import SPECULATION_DIR
+
+
+@pytest.fixture
+def workspace():
+    from jbbench import FIXTURES, mock_llm_config
+
+    with tempfile.TemporaryDirectory() as workspace, mock_llm_config(
+        mock_llm=True, mock_llm_fixtures=FIXTURES, workspace_root=workspace, long_term_memory=False
+    ):
+        yield workspace
+
+
+def run_design(monkeypatch, answer: str, edit: bool = False):
+    """Run to the Design stage with the PRD approved by `answer` once the speculative design is written"""
+    from jbbench import hire_team
+
+    designs = []
+    write_design = WriteJBDesign.run
+
+    async def counted(self, *args, **kwargs):
+        designs.append(PRODUCT_CONFIG.product_root)
+        return await write_design(self, *args, **kwargs)
+
+    monkeypatch.setattr(WriteJBDesign, "run", counted)
+    approvals = Approvals()
+    team = hire_team("speculate")
+    for role in team.environment.get_roles().values():
+        if role._setting.is_human:
+            role._actions[0].llm.set_callback(lambda action, stage: approvals.request(stage))
+    team.invest(1e6)
+    team.start_project("speculate", stage="Requirements", end_stage="Design")
+
+    async def approve():
+        while not team._speculations:
+            await asyncio.sleep(0.01)
+        await asyncio.wait([team._speculations[0].task])
+        if edit:
+            prd = team.get_deliverable("Requirements")["prd"]
+            team.update_deliverable("Requirements", prd.replace("Hello World", "Hello Moon"))
+            await asyncio.sleep(0)  # the speculation is abandoned on the loop
+        approvals.resolve("Requirements", answer)
+        while answer == "yes" and not approvals.waiting("Design"):
+            await asyncio.sleep(0.01)
+        approvals.resolve("Design", "no")  # the end of the run
+
+    async def main():
+        run = asyncio.create_task(team.run(start_stage="Requirements", end_stage="Design", speculate=True))
+        await approve()
+        await run
+
+    asyncio.run(main())
+    return team, designs
+
+
+def test_commit_when_approved_unchanged(monkeypatch, workspace):
+    team, designs = run_design(monkeypatch, "yes")
+    with team.context.activate():
+        root = PRODUCT_CONFIG.product_root
+    assert designs == [root / SPECULATION_DIR / "Requirements"]  # the design was written once, speculatively
+    assert (root / "docs" / "system_design.md").exists() and not (root / SPECULATION_DIR).exists()
+    messages = team.environment.memory.get()
+    assert [m.cause_by for m in messages].index(WriteProductApproval) < [m.cause_by for m in messages].index(
+        WriteJBDesign
+    )
+    assert team.environment.get_role("Architect")._rc.memory.get_by_action(WriteJBDesign)
+    assert team.get_balance() > 0 and not team._speculations
+
+
+def test_discard_when_edited(monkeypatch, workspace):
+    team, designs = run_design(monkeypatch, "yes", edit=True)
+    with team.context.activate():
+        root = PRODUCT_CONFIG.product_root
+    assert designs == [root / SPECULATION_DIR / "Requirements", root]  # written again on the edited PRD
+    approval = team.environment.memory.get_by_action(WriteProductApproval)[0]
+    assert "Hello Moon" in approval.content
+    assert len(team.environment.memory.get_by_action(WriteJBDesign)) == 1
+    assert not (root / SPECULATION_DIR).exists()
+
+
+def test_discard_when_rejected(monkeypatch, workspace):
+    team, designs = run_design(monkeypatch, "no")
+    with team.context.activate():
+        root = PRODUCT_CONFIG.product_root
+    assert designs == [root / SPECULATION_DIR / "Requirements"]
+    assert not team.environment.memory.get_by_action(WriteJBDesign)
+    assert not (root / "docs" / "system_design.md").exists() and not (root / SPECULATION_DIR).exists()
+    assert team.get_balance() > 0  # the speculative spend is charged all the same
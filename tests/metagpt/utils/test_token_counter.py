@@ -7,7 +7,36 @@
 """
 import pytest
 
-from metagpt.utils.token_counter import count_message_tokens, count_string_tokens
+from metagpt.utils.token_counter import (
+    TokenCounter,
+    approximate_tokens,
+    count_message_tokens,
+    count_string_tokens,
+)
+
+
+class FakeEncoding:
+    """Whitespace tokenizer recording what it was asked to encode"""
+
+    name = "fake"
+
+    def __init__(self):
+        self.encoded = []
+
+    def encode(self, text):
+        self.encoded.append(text)
+        return text.split()
+
+    def encode_batch(self, texts, num_threads=1):
+        self.encoded.extend(texts)
+        return [text.split() for text in texts]
+
+
+@pytest.fixture
+def fake_encoding(mocker):
+    encoding = FakeEncoding()
+    mocker.patch("metagpt.utils.token_counter.get_encoding", return_value=encoding)
+    return encoding
 
 
 def test_count_message_tokens():
@@ -62,8 +91,46 @@ def test_count_string_tokens_empty_input():
     assert count_string_tokens("", model_name="gpt-3.5-turbo-0301") == 0
 
 
+def test_count_string_tokens_invalid_model():
+    """An unknown model is not counted with another encoding"""
+    with pytest.raises(KeyError):
+        count_string_tokens("Hello, world!", model_name="invalid_model")
+
+
 def test_count_string_tokens_gpt_4():
     """Test that the string tokens are counted correctly."""
 
     string = "Hello, world!"
     assert count_string_tokens(string, model_name="gpt-4-0314") == 4
+
+
+def test_token_counter_memo(fake_encoding):
+    counter = TokenCounter(memo_size=2)
+    assert counter.count("a b c", "gpt-4") == 3
+    assert counter.count("a b c", "gpt-4") == 3
+    assert fake_encoding.encoded == ["a b c"]
+    assert counter.stats()["hits"] == 1
+
+    counter.count("d", "gpt-4")
+    counter.count("e f", "gpt-4")  # evicts the least recently used "a b c"
+    counter.count("a b c", "gpt-4")
+    assert fake_encoding.encoded.count("a b c") == 2
+
+
+def test_token_counter_count_many(fake_encoding):
+    counter = TokenCounter()
+    counter.count("x y", "gpt-4")
+    assert counter.count_many(["x y", "one", "", "one", "two words"], "gpt-4") == [2, 1, 0, 1, 2]
+    assert fake_encoding.encoded == ["x y", "one", "two words"]  # cached and duplicate texts are not re-encoded
+
+
+def test_token_counter_messages(fake_encoding):
+    messages = [{"role": "user", "content": "hello there"}, {"role": "assistant", "content": "hi", "name": "bob"}]
+    # 2 + 1 + 1 + 1 + 1 content tokens, 3 per message, 1 per name, 3 to prime the reply
+    assert TokenCounter().count_messages(messages, "gpt-4-0613") == 6 + 6 + 1 + 3
+
+
+def test_approximate_tokens():
+    assert approximate_tokens("") == 0
+    assert approximate_tokens("Hello, world!") == 4
+    assert approximate_tokens("你好") == 2